@@ -0,0 +1,150 @@
+"""
+Хранилище файлов вложений (сканы, PDF анализов) с адресацией по содержимому.
+
+Файл хранится один раз под именем, равным SHA-256 его содержимого:
+<корень>/objects/ab/abcdef... Одинаковые файлы разных пациентов занимают место
+один раз. Метаданные (пациент, имя файла, тип, хэш) хранятся в SQLite
+(таблицы attachments и attachment_blobs, см. migrations), а здесь - только байты.
+
+Запись идет в два шага: ingest копирует источник во временный файл, считая хэш
+по ходу копирования, а publish атомарно переносит его на место. publish и удаление
+файлов сборщиком мусора выполняются под блокировкой записи базы (AttachmentRepository),
+поэтому сборщик не может удалить файл, на который в этот момент добавляется ссылка.
+
+Чтение идет через mmap: отдается только запрошенный диапазон байт,
+файл целиком в память не загружается.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+
+COPY_CHUNK_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+# Сколько живут временные файлы незавершенной записи, прежде чем сборщик их удалит
+TEMP_GRACE_SECONDS = 24 * 60 * 60
+
+
+def default_root(db_name):
+    """Каталог вложений рядом с файлом базы: healthcare.db -> healthcare_attachments."""
+    if db_name == ":memory:":
+        raise ValueError("Для базы в памяти каталог вложений нужно указать явно")
+    return os.path.splitext(os.path.abspath(db_name))[0] + "_attachments"
+
+
+class AttachmentStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path(self, sha256) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def exists(self, sha256) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def ingest(self, source) -> tuple:
+        """
+        Копирует источник во временный файл хранилища и считает SHA-256.
+
+        :param source: Путь к файлу или двоичный файловый объект (не закрывается)
+        :return: (sha256, размер в байтах, путь временного файла)
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                source_file = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+                try:
+                    while True:
+                        chunk = source_file.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        out.write(chunk)
+                        size += len(chunk)
+                finally:
+                    if source_file is not source:
+                        source_file.close()
+                out.flush()
+                os.fsync(out.fileno())
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        return digest.hexdigest(), size, temp_path
+
+    def publish(self, temp_path, sha256) -> bool:
+        """
+        Переносит временный файл из ingest на его место в хранилище.
+
+        :return: False, если такой файл уже был (временный тогда удаляется)
+        """
+        path = self.path(sha256)
+        if os.path.exists(path):
+            self.discard(temp_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return True
+
+    @staticmethod
+    def discard(temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, sha256) -> int:
+        """Удаляет файл из хранилища. :return: Освобожденные байты (0, если файла не было)"""
+        path = self.path(sha256)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def iter_range(self, sha256, offset=0, length=None, chunk_size=READ_CHUNK_SIZE):
+        """
+        Генератор байт файла из диапазона [offset, offset + length) порциями по chunk_size.
+        Файл отображается в память (mmap), в Python копируется только текущая порция.
+        """
+        with open(self.path(sha256), "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            start = min(max(offset, 0), size)
+            end = size if length is None else min(start + max(length, 0), size)
+            if start >= end:
+                return  # mmap не умеет отображать пустые файлы
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for position in range(start, end, chunk_size):
+                    yield mapped[position:min(position + chunk_size, end)]
+
+    def read_range(self, sha256, offset=0, length=None) -> bytes:
+        """Байты файла из диапазона [offset, offset + length) (length=None - до конца файла)."""
+        return b"".join(self.iter_range(sha256, offset, length, chunk_size=max(length or 0, READ_CHUNK_SIZE)))
+
+    def iter_objects(self):
+        """Хэши всех файлов хранилища."""
+        if not os.path.isdir(self.objects_dir):
+            return
+        for prefix in os.scandir(self.objects_dir):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if entry.is_file():
+                        yield entry.name
+
+    def remove_stale_temp_files(self, grace_seconds=TEMP_GRACE_SECONDS) -> int:
+        """Удаляет временные файлы записей, прерванных больше grace_seconds назад."""
+        if not os.path.isdir(self.tmp_dir):
+            return 0
+        removed = 0
+        deadline = time.time() - grace_seconds
+        for entry in os.scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                self.discard(entry.path)
+                removed += 1
+        return removed
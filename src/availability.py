@@ -0,0 +1,161 @@
+import bisect
+import datetime
+import heapq
+import itertools
+
+# Рабочие часы по умолчанию, если для врача не задано расписание
+DEFAULT_START_TIME = "10:00"
+DEFAULT_END_TIME = "18:00"
+DEFAULT_SLOT_MINUTES = 10
+
+
+def _parse_time(value) -> datetime.time:
+    if isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(value)
+
+
+class WorkingHours:
+    """
+    Рабочий день врача: начало, конец и длина слота в минутах.
+
+    Слоты нумеруются от 0. Последний слот начинается ровно в end
+    (так же, как это было в ui.appointment_ui.generate_time_slots).
+    """
+    __slots__ = ("start", "end", "slot_minutes", "_start_minute", "slot_count")
+
+    def __init__(self, start=DEFAULT_START_TIME, end=DEFAULT_END_TIME, slot_minutes=DEFAULT_SLOT_MINUTES):
+        self.start = _parse_time(start)
+        self.end = _parse_time(end)
+        self.slot_minutes = int(slot_minutes)
+        if self.slot_minutes <= 0:
+            raise ValueError("Длина слота должна быть положительной")
+        if self.end < self.start:
+            raise ValueError("Конец рабочего дня раньше начала")
+
+        self._start_minute = self.start.hour * 60 + self.start.minute
+        end_minute = self.end.hour * 60 + self.end.minute
+        self.slot_count = (end_minute - self._start_minute) // self.slot_minutes + 1
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Создает расписание из строки doctor_schedules.
+        Если строки нет (или поля пустые), используются часы по умолчанию.
+        """
+        if not row or row.get('start_time') is None:
+            return cls()
+        return cls(row['start_time'], row['end_time'], row['slot_minutes'])
+
+    def slot_index(self, moment) -> int | None:
+        """
+        Номер слота, в который попадает время (datetime или time).
+        None, если время вне рабочего дня.
+        """
+        offset = moment.hour * 60 + moment.minute - self._start_minute
+        if offset < 0:
+            return None
+        index = offset // self.slot_minutes
+        return index if index < self.slot_count else None
+
+    def first_slot_index_from(self, moment) -> int:
+        """Номер первого слота, начинающегося не раньше moment (может быть >= slot_count)."""
+        offset = moment.hour * 60 + moment.minute - self._start_minute
+        if moment.second or moment.microsecond:
+            offset += 1
+        # Округляем вверх до ближайшего начала слота
+        return max(0, -(-offset // self.slot_minutes))
+
+    def slot_time(self, index) -> datetime.time:
+        minutes = self._start_minute + index * self.slot_minutes
+        return datetime.time(minutes // 60, minutes % 60)
+
+    def __repr__(self):
+        return f"WorkingHours({self.start:%H:%M}, {self.end:%H:%M}, {self.slot_minutes})"
+
+
+class DayAvailability:
+    """
+    Свободные слоты врача на один день.
+
+    Занятые слоты вычитаются за один проход по битовой карте дня, после чего
+    хранится отсортированный массив номеров свободных слотов: список свободных
+    слотов получается за линейное время, а поиск "первые N свободных после T" -
+    бинарным поиском.
+    """
+    __slots__ = ("day", "hours", "_free")
+
+    def __init__(self, day: datetime.date, hours: WorkingHours, booked_slots=()):
+        self.day = day
+        self.hours = hours
+
+        bitmap = bytearray(b"\x01") * hours.slot_count
+        for booked in booked_slots:
+            index = hours.slot_index(booked)
+            if index is not None:
+                bitmap[index] = 0
+        self._free = [index for index, free in enumerate(bitmap) if free]
+
+    def __len__(self):
+        return len(self._free)
+
+    def _slot_datetime(self, index) -> datetime.datetime:
+        return datetime.datetime.combine(self.day, self.hours.slot_time(index))
+
+    def free_slots(self) -> list[datetime.datetime]:
+        """Все свободные слоты дня."""
+        return [self._slot_datetime(index) for index in self._free]
+
+    def free_slot_labels(self) -> list[str]:
+        """Свободные слоты в виде строк 'HH:MM' для выпадающих списков."""
+        return [self.hours.slot_time(index).strftime("%H:%M") for index in self._free]
+
+    def is_free(self, moment: datetime.datetime) -> bool:
+        index = self.hours.slot_index(moment)
+        if index is None or self.hours.slot_time(index) != moment.time().replace(second=0, microsecond=0):
+            return False
+        position = bisect.bisect_left(self._free, index)
+        return position < len(self._free) and self._free[position] == index
+
+    def first_free_after(self, moment: datetime.datetime, count=1) -> list[datetime.datetime]:
+        """
+        Первые count свободных слотов, начинающихся не раньше moment.
+
+        :param moment: Время, начиная с которого ищутся слоты
+        :param count: Сколько слотов вернуть
+        """
+        if moment.date() > self.day:
+            return []
+        if moment.date() < self.day:
+            first_index = 0
+        else:
+            first_index = self.hours.first_slot_index_from(moment)
+
+        position = bisect.bisect_left(self._free, first_index)
+        return [self._slot_datetime(index) for index in self._free[position:position + count]]
+
+
+def iter_free_slots(hours: WorkingHours, booked_by_day: dict, start: datetime.datetime, end_date: datetime.date):
+    """
+    Лениво перебирает свободные слоты врача в хронологическом порядке,
+    начиная с start и до end_date (не включительно). Доступность каждого дня
+    строится только тогда, когда до него дошел перебор.
+
+    :param hours: Рабочие часы врача
+    :param booked_by_day: Занятые слоты {дата: [datetime]}
+    """
+    day = start.date()
+    while day < end_date:
+        availability = DayAvailability(day, hours, booked_by_day.get(day, ()))
+        yield from availability.first_free_after(start, len(availability))
+        day += datetime.timedelta(days=1)
+
+
+def merge_earliest_free_slots(free_slots_by_key: dict, count: int) -> list[tuple]:
+    """
+    Сливает отсортированные потоки свободных слотов нескольких врачей через очередь
+    с приоритетом и возвращает первые count пар (слот, ключ врача).
+    Из каждого потока читается не больше слотов, чем нужно для ответа.
+    """
+    streams = [zip(slots, itertools.repeat(key)) for key, slots in free_slots_by_key.items()]
+    return list(itertools.islice(heapq.merge(*streams), count))
@@ -0,0 +1,11 @@
+"""
+Нагрузочные замеры репозиториев на синтетических данных.
+
+Запуск из каталога src:
+    python -m benchmarks.run --patients 20000 --out benchmark_results.json
+    python -m benchmarks.importtime
+    python -m benchmarks.booking_stress
+    python -m benchmarks.row_memory
+    python -m benchmarks.query_plans
+    python -m benchmarks.plan_regression
+"""
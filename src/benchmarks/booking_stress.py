@@ -0,0 +1,204 @@
+"""
+Нагрузочная проверка записи на прием: потоки и процессы одновременно занимают
+одни и те же слоты через AppointmentRepository.reserve_slot.
+
+    python -m benchmarks.booking_stress --threads 8 --processes 4 --attempts 300 --slots 500
+
+Для каждого режима (потоки одного процесса, отдельные процессы) создается новая база.
+Проверяется, что ни один слот не занят дважды, что каждому ответу BOOKED соответствует
+ровно одна запись этого пациента и что ответ SLOT_TAKEN получен только для слота,
+который действительно занят. Часть попыток (--off-grid) приходится на время внутри слота
+(10:00:30, 10:00:00.5): такие попытки должны получать INVALID_SLOT, а слот не должен
+оказаться занятым дважды под разными строками времени. Выводится пропускная способность и задержки.
+Код возврата 1, если найдено нарушение.
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import database
+from benchmarks import synthetic
+from booking import ReservationStatus
+from database import DatabaseConnection
+from repositories import AppointmentRepository
+
+SLOTS_PER_DAY = 49  # 10:00-18:00 с шагом 10 минут, часы по умолчанию
+
+
+def make_slots(doctors, count, seed):
+    """Случайный набор слотов, за которые будут соревноваться участники."""
+    rnd = random.Random(seed)
+    slots = set()
+    while len(slots) < count:
+        doctor_id = rnd.randint(1, doctors)
+        moment = datetime.datetime.combine(synthetic.BASE_DATE, datetime.time(10)) + datetime.timedelta(
+            days=rnd.randrange(30), minutes=10 * rnd.randrange(SLOTS_PER_DAY))
+        slots.add((doctor_id, moment))
+    return sorted(slots)
+
+
+def off_grid(moment, rnd):
+    """Время внутри того же слота, но не совпадающее с его началом."""
+    if rnd.random() < 0.5:
+        return moment.replace(second=rnd.randint(1, 59))
+    return moment.replace(microsecond=rnd.randint(1, 999999))
+
+
+def run_worker(db_name, slots, patients, attempts, seed, off_grid_fraction=0.0):
+    """
+    Выполняет attempts попыток записи на случайные слоты из slots.
+    Доля off_grid_fraction попыток идет на время внутри слота, а не на его начало.
+
+    :return: Список (статус, doctor_id, время, patient_id, appointment_id, задержка в мс)
+    """
+    database.enable_pooling()
+    repository = AppointmentRepository(db_name)
+    rnd = random.Random(seed)
+    outcomes = []
+    for _ in range(attempts):
+        doctor_id, moment = rnd.choice(slots)
+        if rnd.random() < off_grid_fraction:
+            moment = off_grid(moment, rnd)
+        patient_id = rnd.randint(1, patients)
+        started = time.perf_counter()
+        result = repository.reserve_slot(patient_id, doctor_id, moment)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        status = result.status.value if result is not None else "error"
+        appointment_id = result.appointment_id if result is not None else None
+        outcomes.append((status, doctor_id, moment, patient_id, appointment_id, elapsed_ms))
+    return outcomes
+
+
+def _process_worker(args):
+    try:
+        return run_worker(*args)
+    finally:
+        database.close_pools()
+
+
+def _run_threads(db_name, slots, patients, attempts, workers, seed, off_grid_fraction):
+    results = [None] * workers
+
+    def target(index):
+        results[index] = run_worker(db_name, slots, patients, attempts, seed + index, off_grid_fraction)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [outcome for outcomes in results for outcome in outcomes]
+
+
+def _run_processes(db_name, slots, patients, attempts, workers, seed, off_grid_fraction):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        results = pool.map(_process_worker, [(db_name, slots, patients, attempts, seed + index, off_grid_fraction)
+                                             for index in range(workers)])
+    return [outcome for outcomes in results for outcome in outcomes]
+
+
+def verify(db_name, outcomes) -> list[str]:
+    """Сверяет ответы reserve_slot с содержимым базы и возвращает найденные нарушения."""
+    problems = []
+    with DatabaseConnection(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT doctor_id, appointment_time, count(*) AS n FROM appointments
+            GROUP BY doctor_id, appointment_time HAVING n > 1
+        """)
+        for row in cursor.fetchall():
+            problems.append(f"слот {row['doctor_id']} {row['appointment_time']} занят {row['n']} раз")
+        # Одна и та же минута под разными строками времени ('10:00:00' и '10:00:30') - тоже двойная запись
+        cursor.execute("""
+            SELECT doctor_id, substr(appointment_time, 1, 16) AS slot, count(*) AS n FROM appointments
+            GROUP BY doctor_id, slot HAVING count(DISTINCT appointment_time) > 1
+        """)
+        for row in cursor.fetchall():
+            problems.append(f"слот {row['doctor_id']} {row['slot']} занят {row['n']} раз под разным временем")
+        cursor.execute("SELECT appointment_id, doctor_id, patient_id, appointment_time FROM appointments")
+        rows = {row['appointment_id']: row for row in cursor.fetchall()}
+
+    taken = {(row['doctor_id'], row['appointment_time']) for row in rows.values()}
+    booked = [outcome for outcome in outcomes if outcome[0] == ReservationStatus.BOOKED.value]
+    if len(booked) != len(rows):
+        problems.append(f"ответов BOOKED {len(booked)}, а записей в базе {len(rows)}")
+    for status, doctor_id, moment, patient_id, appointment_id, _ in outcomes:
+        key = (doctor_id, moment.isoformat(sep=" "))
+        if (moment.second or moment.microsecond) and status != ReservationStatus.INVALID_SLOT.value:
+            problems.append(f"{status} вместо INVALID_SLOT для времени внутри слота {key}")
+        elif status == ReservationStatus.BOOKED.value:
+            row = rows.get(appointment_id)
+            if row is None or (row['doctor_id'], row['appointment_time']) != key or row['patient_id'] != patient_id:
+                problems.append(f"BOOKED {key} для пациента {patient_id} не совпадает с записью {appointment_id}")
+        elif status == ReservationStatus.SLOT_TAKEN.value and key not in taken:
+            problems.append(f"SLOT_TAKEN для свободного слота {key}")
+        elif status == "error":
+            problems.append(f"ошибка при записи на {key}")
+    return problems
+
+
+def run_mode(mode, args, directory):
+    db_name = os.path.join(directory, f"booking_{mode}.db")
+    database.enable_pooling()
+    config = synthetic.SyntheticConfig(doctors=args.doctors, patients=args.patients, appointments=0,
+                                       record_fraction=0, seed=args.seed)
+    synthetic.generate(db_name, config)
+    database.close_pools()  # процессы откроют свои соединения
+
+    slots = make_slots(args.doctors, args.slots, args.seed)
+    workers = args.threads if mode == "threads" else args.processes
+    runner = _run_threads if mode == "threads" else _run_processes
+
+    started = time.perf_counter()
+    outcomes = runner(db_name, slots, args.patients, args.attempts, workers, args.seed, args.off_grid)
+    elapsed = time.perf_counter() - started
+
+    database.enable_pooling()
+    problems = verify(db_name, outcomes)
+    database.close_pools()
+
+    counts = {status.value: 0 for status in ReservationStatus}
+    for outcome in outcomes:
+        counts[outcome[0]] = counts.get(outcome[0], 0) + 1
+    latencies = sorted(outcome[5] for outcome in outcomes)
+    print(f"{mode:9} workers={workers:<3} attempts={len(outcomes):<6} "
+          f"{len(outcomes) / elapsed:8.0f} attempts/s  {counts[ReservationStatus.BOOKED.value] / elapsed:8.0f} bookings/s  "
+          f"median {statistics.median(latencies):6.2f} ms  p99 {latencies[int(len(latencies) * 0.99)]:7.2f} ms")
+    print(f"          {counts}")
+    for problem in problems[:20]:
+        print(f"  НАРУШЕНИЕ: {problem}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Конкурентная запись на прием: потоки и процессы")
+    parser.add_argument("--threads", type=int, default=8, help="Потоков в режиме threads")
+    parser.add_argument("--processes", type=int, default=4, help="Процессов в режиме processes")
+    parser.add_argument("--attempts", type=int, default=300, help="Попыток записи на одного участника")
+    parser.add_argument("--slots", type=int, default=500, help="Сколько разных слотов разыгрывается")
+    parser.add_argument("--off-grid", type=float, default=0.1,
+                        help="Доля попыток на время внутри слота (с секундами), а не на его начало")
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", action="append", choices=("threads", "processes"),
+                        help="Запустить только указанный режим (можно несколько раз)")
+    args = parser.parse_args(argv)
+
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.mode or ("threads", "processes"):
+            problems.extend(run_mode(mode, args, directory))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
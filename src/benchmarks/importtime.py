@@ -0,0 +1,111 @@
+"""
+Проверка времени холодного импорта модулей.
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --repeat 7 --budget repositories=80
+
+Каждый модуль импортируется в отдельном процессе через `python -X importtime`,
+из отчета интерпретатора берется накопленное время импорта модуля (медиана по
+повторам). Для модулей слоя данных дополнительно проверяется, что они не
+загружают tkinter и модули интерфейса, а для окна входа - что интерфейсы ролей
+и tkcalendar загружаются только при первом использовании.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUI_MODULES = ("tkinter", "_tkinter", "tkcalendar", "ui")
+ROLE_UI_MODULES = ("tkcalendar", "ui.admin_ui", "ui.doctor_ui", "ui.patient_ui", "ui.appointment_ui",
+                   "ui.manage_doctors_ui", "ui.manage_patients_ui")
+
+# Модуль: (бюджет холодного импорта в миллисекундах, модули, которые не должны загружаться)
+BUDGETS = {
+    "database": (60, GUI_MODULES),
+    "repositories": (100, GUI_MODULES),
+    "import_cli": (120, GUI_MODULES),
+    "main": (120, GUI_MODULES),
+    "ui.main_ui": (250, ROLE_UI_MODULES),
+}
+
+
+def measure_import(module):
+    """
+    Импортирует модуль в новом процессе.
+
+    :return: (накопленное время импорта в миллисекундах, множество загруженных модулей)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr}")
+
+    cumulative_ms = None
+    loaded = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # строка заголовка
+        name = name.strip()
+        loaded.add(name)
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000
+    if cumulative_ms is None:
+        raise RuntimeError(f"В отчете -X importtime нет модуля {module}")
+    return cumulative_ms, loaded
+
+
+def _is_forbidden(name, forbidden):
+    return any(name == prefix or name.startswith(prefix + ".") for prefix in forbidden)
+
+
+def check(module, budget_ms, forbidden, repeat):
+    """
+    :return: (медиана времени импорта, список нарушений)
+    """
+    samples = []
+    problems = []
+    for _ in range(repeat):
+        elapsed_ms, loaded = measure_import(module)
+        samples.append(elapsed_ms)
+    median_ms = statistics.median(samples)
+    if median_ms > budget_ms:
+        problems.append(f"{module}: {median_ms:.1f} ms, бюджет {budget_ms} ms")
+    unexpected = sorted(name for name in loaded if _is_forbidden(name, forbidden))
+    if unexpected:
+        problems.append(f"{module} загружает {', '.join(unexpected)}")
+    return median_ms, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка времени холодного импорта")
+    parser.add_argument("--repeat", type=int, default=5, help="Запусков на модуль, берется медиана")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Переопределить бюджет модуля (можно несколько раз)")
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, _, value = item.partition("=")
+        forbidden = budgets.get(module, (None, ()))[1]
+        budgets[module] = (float(value), forbidden)
+
+    failures = []
+    for module, (budget_ms, forbidden) in budgets.items():
+        median_ms, problems = check(module, budget_ms, forbidden, args.repeat)
+        print(f"{module:16} {median_ms:8.1f} ms  (бюджет {budget_ms} ms)  {'OK' if not problems else 'FAIL'}")
+        failures.extend(problems)
+
+    for problem in failures:
+        print(f"  {problem}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
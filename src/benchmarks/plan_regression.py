@@ -0,0 +1,632 @@
+"""
+Регрессионная проверка планов и задержек всех запросов репозиториев.
+
+    python -m benchmarks.plan_regression
+    python -m benchmarks.plan_regression --patients 20000 --appointments 200000 --ceiling-scale 2 --verbose
+
+На синтетической базе вызывается каждый публичный метод UserRepository,
+PatientRepository, DoctorRepository, AppointmentRepository и AttachmentRepository
+(сценарии SCENARIOS).
+Все SQL-запросы, которые метод действительно выполнил, перехватываются через
+set_trace_callback соединения и прогоняются через EXPLAIN QUERY PLAN. Нарушения:
+
+- SCAN таблицы, в которой не меньше --large-table-rows строк;
+- USE TEMP B-TREE (сортировка или DISTINCT без индекса);
+- медиана времени метода выше потолка из CEILINGS_MS (умноженного на --ceiling-scale);
+- публичный метод репозитория без сценария (кроме NO_QUERIES).
+
+Ожидаемые нарушения перечислены в ALLOWLIST вместе с причиной.
+Код возврата 1, если найдено хотя бы одно неразрешенное нарушение.
+"""
+import argparse
+import datetime
+import io
+import inspect
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import database
+import passwords
+import record_storage
+from availability import WorkingHours
+from benchmarks import synthetic
+from benchmarks.query_plans import StatementCapture, explain, normalize
+from database import DatabaseConnection
+from recurrence import RecurrenceRule
+from repositories import (AppointmentRepository, AttachmentRepository, DoctorRepository, PatientRepository, Role,
+                          UserRepository)
+
+REPOSITORIES = (UserRepository, PatientRepository, DoctorRepository, AppointmentRepository, AttachmentRepository)
+
+# Потолок медианы времени вызова метода в миллисекундах при размере данных по умолчанию
+DEFAULT_CEILING_MS = 20
+CEILINGS_MS = {
+    # Проверка пароля PBKDF2 занимает сотни миллисекунд намеренно
+    "UserRepository.login": 1500,
+    "UserRepository.authenticate": 1500,
+    # Методы возвращают таблицу целиком
+    "UserRepository.get_all_users": 150,
+    "PatientRepository.get_all_patients": 100,
+    "PatientRepository.add_patients_bulk": 100,
+    "DoctorRepository.add_doctors_bulk": 100,
+    "PatientRepository.search_records": 100,
+    "AppointmentRepository.find_earliest_free_slots": 60,
+    "AppointmentRepository.get_appointments_by_doctor_id": 50,
+    "AppointmentRepository.iter_appointments": 50,
+    "AppointmentRepository.book_recurring": 50,
+}
+
+# Метод: {подстрока шага плана: причина}
+ALLOWLIST = {
+    "UserRepository.get_all_users": {"SCAN users": "возвращает всех пользователей"},
+    "PatientRepository.get_all_patients": {"SCAN patients": "возвращает всех пациентов"},
+    "DoctorRepository.get_all_doctors": {"SCAN doctors": "возвращает всех врачей"},
+    "DoctorRepository.directory": {"SCAN doctors": "справочник загружает всех врачей"},
+}
+
+# Публичные методы, которые не обращаются к базе, и поэтому не проверяются
+NO_QUERIES = {
+    "PatientRepository.record_cache": "возвращает кэш карт в памяти",
+}
+
+TABLE_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+SQL_KEYWORDS = {"where", "left", "inner", "join", "on", "order", "group", "limit", "using", "set",
+                "values", "select", "default", "as", "natural", "cross"}
+
+SCENARIOS = {}
+
+
+def scenario(method):
+    """
+    Регистрирует сценарий метода репозитория ('PatientRepository.get_patient').
+    Функция сценария получает PlanContext, выполняет подготовку и возвращает
+    функцию без аргументов, которая вызывает сам метод (замеряется только она).
+    """
+    def decorator(func):
+        SCENARIOS[method] = func
+        return func
+    return decorator
+
+
+class PlanContext:
+    def __init__(self, db_name, summary, seed):
+        self.db_name = db_name
+        self.summary = summary
+        self.rnd = random.Random(seed)
+        self.users = UserRepository(db_name)
+        self.patients = PatientRepository(db_name)
+        self.doctors = DoctorRepository(db_name)
+        self.appointments = AppointmentRepository(db_name)
+        self.attachments = AttachmentRepository(db_name)
+        self.password_hash = passwords.hash_password(synthetic.PASSWORD)
+        self.first_day = datetime.date.fromisoformat(summary['first_day'])
+        # Новые записи идут в дни после синтетической истории, каждый раз в новый слот
+        self.next_slot = datetime.datetime.combine(
+            datetime.date.fromisoformat(summary['last_day']) + datetime.timedelta(days=1), datetime.time(10))
+        self._counter = 0
+
+    def unique_name(self, prefix):
+        self._counter += 1
+        return f"{prefix}_plan_{self._counter}"
+
+    def random_patient_id(self):
+        return self.rnd.randint(1, self.summary['patients'])
+
+    def random_doctor_id(self):
+        return self.rnd.randint(1, self.summary['doctors'])
+
+    def random_day(self):
+        return self.first_day + datetime.timedelta(days=self.rnd.randrange(30))
+
+    def take_slot(self):
+        slot = self.next_slot
+        self.next_slot += datetime.timedelta(minutes=10)
+        if self.next_slot.hour >= 18:
+            self.next_slot = datetime.datetime.combine(self.next_slot.date() + datetime.timedelta(days=1),
+                                                       datetime.time(10))
+        return slot
+
+    def new_patient(self):
+        return self.patients.add_patient(self.unique_name("patient"), self.password_hash, "Пациент Плана")
+
+    def new_doctor(self):
+        return self.doctors.add_doctor(self.unique_name("doctor"), self.password_hash, "Врач Плана", "терапевт")
+
+    def new_attachment(self, patient_id=None):
+        name = self.unique_name("scan")
+        content = name.encode() * 1024
+        return self.attachments.add_attachment(patient_id or self.random_patient_id(), io.BytesIO(content),
+                                               filename=f"{name}.pdf")
+
+
+# --- UserRepository
+
+@scenario("UserRepository.login")
+def _login(ctx):
+    username = synthetic.patient_username(ctx.rnd.randrange(ctx.summary['patients']))
+    return lambda: ctx.users.login(username, synthetic.PASSWORD)
+
+
+@scenario("UserRepository.authenticate")
+def _authenticate(ctx):
+    username = synthetic.doctor_username(ctx.rnd.randrange(ctx.summary['doctors']))
+    return lambda: ctx.users.authenticate(username, synthetic.PASSWORD)
+
+
+@scenario("UserRepository.add_user")
+def _add_user(ctx):
+    username = ctx.unique_name("user")
+    return lambda: ctx.users.add_user(username, ctx.password_hash, Role.ADMIN)
+
+
+@scenario("UserRepository.find_by_username")
+def _find_by_username(ctx):
+    username = synthetic.patient_username(ctx.rnd.randrange(ctx.summary['patients']))
+    return lambda: ctx.users.find_by_username(username)
+
+
+@scenario("UserRepository.get_all_users")
+def _get_all_users(ctx):
+    return ctx.users.get_all_users
+
+
+# --- PatientRepository
+
+@scenario("PatientRepository.get_all_patients")
+def _get_all_patients(ctx):
+    return ctx.patients.get_all_patients
+
+
+@scenario("PatientRepository.get_patients_page")
+def _get_patients_page(ctx):
+    after_id = ctx.random_patient_id()
+    return lambda: ctx.patients.get_patients_page(after_id=after_id, limit=100)
+
+
+@scenario("PatientRepository.get_patient_record")
+def _get_patient_record(ctx):
+    patient_id = ctx.random_patient_id()
+    return lambda: ctx.patients.get_patient_record(patient_id)
+
+
+@scenario("PatientRepository.iter_record_chunks")
+def _iter_record_chunks(ctx):
+    # Длинная карта хранится сжатой и читается через blobopen
+    patient_id = ctx.random_patient_id()
+    ctx.patients.update_medical_record(patient_id, " ".join(ctx.rnd.choice(synthetic.RECORD_WORDS)
+                                                            for _ in range(20000)))
+    ctx.patients.record_cache().invalidate(patient_id)
+    return lambda: sum(len(chunk) for chunk in ctx.patients.iter_record_chunks(patient_id))
+
+
+@scenario("PatientRepository.search_records")
+def _search_records(ctx):
+    query = f"{ctx.rnd.choice(synthetic.RECORD_WORDS)} {ctx.rnd.choice(synthetic.RECORD_WORDS)}"
+    return lambda: ctx.patients.search_records(query)
+
+
+@scenario("PatientRepository.get_patient")
+def _get_patient(ctx):
+    patient_id = ctx.random_patient_id()
+    return lambda: ctx.patients.get_patient(patient_id)
+
+
+@scenario("PatientRepository.update_patient")
+def _update_patient(ctx):
+    patient_id = ctx.new_patient()
+    username = ctx.unique_name("renamed")
+    return lambda: ctx.patients.update_patient(patient_id, "Новое Имя", username=username, password=ctx.password_hash)
+
+
+@scenario("PatientRepository.get_patient_username")
+def _get_patient_username(ctx):
+    patient_id = ctx.random_patient_id()
+    return lambda: ctx.patients.get_patient_username(patient_id)
+
+
+@scenario("PatientRepository.get_patient_login_data")
+def _get_patient_login_data(ctx):
+    patient_id = ctx.random_patient_id()
+    return lambda: ctx.patients.get_patient_login_data(patient_id)
+
+
+@scenario("PatientRepository.get_patient_by_user_id")
+def _get_patient_by_user_id(ctx):
+    user_id = ctx.users.find_by_username(synthetic.patient_username(ctx.rnd.randrange(ctx.summary['patients'])))
+    return lambda: ctx.patients.get_patient_by_user_id(user_id)
+
+
+@scenario("PatientRepository.delete_patient")
+def _delete_patient(ctx):
+    patient_id = ctx.new_patient()
+    ctx.appointments.add_appointment(patient_id, ctx.random_doctor_id(), ctx.take_slot())
+    ctx.patients.update_medical_record(patient_id, "запись для удаления")
+    return lambda: ctx.patients.delete_patient(patient_id)
+
+
+@scenario("PatientRepository.add_patient")
+def _add_patient(ctx):
+    username = ctx.unique_name("patient")
+    return lambda: ctx.patients.add_patient(username, ctx.password_hash, "Пациент Плана")
+
+
+@scenario("PatientRepository.add_patients_bulk")
+def _add_patients_bulk(ctx):
+    rows = [(ctx.unique_name("bulk_patient"), ctx.password_hash, "Пациент Плана") for _ in range(100)]
+    return lambda: ctx.patients.add_patients_bulk(rows)
+
+
+@scenario("PatientRepository.update_medical_record")
+def _update_medical_record(ctx):
+    patient_id = ctx.random_patient_id()
+    record = " ".join(ctx.rnd.choice(synthetic.RECORD_WORDS) for _ in range(150))
+    return lambda: ctx.patients.update_medical_record(patient_id, record)
+
+
+def _patient_with_history(ctx):
+    patient_id = ctx.random_patient_id()
+    for index in range(3):
+        ctx.patients.update_medical_record(patient_id, f"версия {index} " + " ".join(synthetic.RECORD_WORDS))
+    return patient_id
+
+
+@scenario("PatientRepository.list_record_revisions")
+def _list_record_revisions(ctx):
+    patient_id = _patient_with_history(ctx)
+    return lambda: ctx.patients.list_record_revisions(patient_id)
+
+
+@scenario("PatientRepository.get_record_revision")
+def _get_record_revision(ctx):
+    patient_id = _patient_with_history(ctx)
+    revision = ctx.patients.list_record_revisions(patient_id)[-1]['revision']
+    return lambda: ctx.patients.get_record_revision(patient_id, revision)
+
+
+# --- DoctorRepository
+
+@scenario("DoctorRepository.directory")
+def _directory(ctx):
+    ctx.doctors.directory().invalidate()
+    return lambda: ctx.doctors.directory().all()
+
+
+@scenario("DoctorRepository.get_all_doctors")
+def _get_all_doctors(ctx):
+    return ctx.doctors.get_all_doctors
+
+
+@scenario("DoctorRepository.get_doctors_page")
+def _get_doctors_page(ctx):
+    return lambda: ctx.doctors.get_doctors_page(after_id=ctx.summary['doctors'] // 2, limit=20)
+
+
+@scenario("DoctorRepository.get_doctor")
+def _get_doctor(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.doctors.get_doctor(doctor_id)
+
+
+@scenario("DoctorRepository.delete_doctor")
+def _delete_doctor(ctx):
+    doctor_id = ctx.new_doctor()
+    ctx.appointments.add_appointment(ctx.random_patient_id(), doctor_id, ctx.take_slot())
+    ctx.doctors.set_working_hours(doctor_id, WorkingHours())
+    return lambda: ctx.doctors.delete_doctor(doctor_id)
+
+
+@scenario("DoctorRepository.add_doctor")
+def _add_doctor(ctx):
+    username = ctx.unique_name("doctor")
+    return lambda: ctx.doctors.add_doctor(username, ctx.password_hash, "Врач Плана", "хирург")
+
+
+@scenario("DoctorRepository.add_doctors_bulk")
+def _add_doctors_bulk(ctx):
+    rows = [(ctx.unique_name("bulk_doctor"), ctx.password_hash, "Врач Плана", "лор") for _ in range(100)]
+    return lambda: ctx.doctors.add_doctors_bulk(rows)
+
+
+@scenario("DoctorRepository.get_doctor_username")
+def _get_doctor_username(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.doctors.get_doctor_username(doctor_id)
+
+
+@scenario("DoctorRepository.get_doctor_login_data")
+def _get_doctor_login_data(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.doctors.get_doctor_login_data(doctor_id)
+
+
+@scenario("DoctorRepository.update_doctor")
+def _update_doctor(ctx):
+    doctor_id = ctx.new_doctor()
+    username = ctx.unique_name("renamed")
+    return lambda: ctx.doctors.update_doctor(doctor_id, "Новое Имя", "кардиолог",
+                                             username=username, password=ctx.password_hash)
+
+
+@scenario("DoctorRepository.get_doctor_by_user_id")
+def _get_doctor_by_user_id(ctx):
+    user_id = ctx.users.find_by_username(synthetic.doctor_username(ctx.rnd.randrange(ctx.summary['doctors'])))
+    return lambda: ctx.doctors.get_doctor_by_user_id(user_id)
+
+
+@scenario("DoctorRepository.get_working_hours")
+def _get_working_hours(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.doctors.get_working_hours(doctor_id)
+
+
+@scenario("DoctorRepository.set_working_hours")
+def _set_working_hours(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.doctors.set_working_hours(doctor_id, WorkingHours())
+
+
+# --- AppointmentRepository
+
+@scenario("AppointmentRepository.add_appointment")
+def _add_appointment(ctx):
+    args = (ctx.random_patient_id(), ctx.random_doctor_id(), ctx.take_slot())
+    return lambda: ctx.appointments.add_appointment(*args)
+
+
+@scenario("AppointmentRepository.reserve_slot")
+def _reserve_slot(ctx):
+    # Занятый слот: кроме попытки записи выполняется и поиск альтернатив
+    doctor_id = ctx.random_doctor_id()
+    slot = ctx.take_slot()
+    ctx.appointments.add_appointment(ctx.random_patient_id(), doctor_id, slot)
+    return lambda: ctx.appointments.reserve_slot(ctx.random_patient_id(), doctor_id, slot)
+
+
+@scenario("AppointmentRepository.book_recurring")
+def _book_recurring(ctx):
+    rule = RecurrenceRule.weekly(ctx.take_slot(), 8)
+    args = (ctx.random_patient_id(), ctx.random_doctor_id(), rule)
+    return lambda: ctx.appointments.book_recurring(*args)
+
+
+@scenario("AppointmentRepository.get_booked_slots_in_one_day")
+def _get_booked_slots_in_one_day(ctx):
+    args = (ctx.random_doctor_id(), ctx.random_day())
+    return lambda: ctx.appointments.get_booked_slots_in_one_day(*args)
+
+
+@scenario("AppointmentRepository.get_day_availability")
+def _get_day_availability(ctx):
+    args = (ctx.random_doctor_id(), ctx.random_day())
+    return lambda: ctx.appointments.get_day_availability(*args)
+
+
+@scenario("AppointmentRepository.find_earliest_free_slots")
+def _find_earliest_free_slots(ctx):
+    speciality = ctx.rnd.choice(synthetic.SPECIALITIES)
+    start = datetime.datetime.combine(ctx.random_day(), datetime.time(9))
+    return lambda: ctx.appointments.find_earliest_free_slots(speciality, start)
+
+
+@scenario("AppointmentRepository.get_booked_slots_in_range")
+def _get_booked_slots_in_range(ctx):
+    day = ctx.random_day()
+    args = (ctx.random_doctor_id(), day, day + datetime.timedelta(days=7))
+    return lambda: ctx.appointments.get_booked_slots_in_range(*args)
+
+
+@scenario("AppointmentRepository.get_appointments_by_doctor_id")
+def _get_appointments_by_doctor_id(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: ctx.appointments.get_appointments_by_doctor_id(doctor_id)
+
+
+@scenario("AppointmentRepository.list_appointments")
+def _list_appointments(ctx):
+    day = ctx.random_day()
+    args = (ctx.random_doctor_id(), day, day + datetime.timedelta(days=30))
+    return lambda: ctx.appointments.list_appointments(*args, descending=True, limit=50)
+
+
+@scenario("AppointmentRepository.iter_appointments")
+def _iter_appointments(ctx):
+    doctor_id = ctx.random_doctor_id()
+    return lambda: sum(1 for _ in ctx.appointments.iter_appointments(doctor_id))
+
+
+# --- AttachmentRepository
+
+@scenario("AttachmentRepository.add_attachment")
+def _add_attachment(ctx):
+    patient_id = ctx.random_patient_id()
+    content = ctx.unique_name("scan").encode() * 1024
+    return lambda: ctx.attachments.add_attachment(patient_id, io.BytesIO(content), filename="scan.pdf")
+
+
+@scenario("AttachmentRepository.list_attachments")
+def _list_attachments(ctx):
+    patient_id = ctx.random_patient_id()
+    ctx.new_attachment(patient_id)
+    return lambda: ctx.attachments.list_attachments(patient_id)
+
+
+@scenario("AttachmentRepository.get_attachment")
+def _get_attachment(ctx):
+    attachment_id = ctx.new_attachment()
+    return lambda: ctx.attachments.get_attachment(attachment_id)
+
+
+@scenario("AttachmentRepository.read_attachment")
+def _read_attachment(ctx):
+    attachment_id = ctx.new_attachment()
+    return lambda: ctx.attachments.read_attachment(attachment_id, offset=100, length=1000)
+
+
+@scenario("AttachmentRepository.iter_attachment")
+def _iter_attachment(ctx):
+    attachment_id = ctx.new_attachment()
+    return lambda: sum(len(chunk) for chunk in ctx.attachments.iter_attachment(attachment_id, chunk_size=4096))
+
+
+@scenario("AttachmentRepository.export_attachment")
+def _export_attachment(ctx):
+    attachment_id = ctx.new_attachment()
+    destination = os.path.join(os.path.dirname(os.path.abspath(ctx.db_name)), f"{ctx.unique_name('export')}.pdf")
+    return lambda: ctx.attachments.export_attachment(attachment_id, destination)
+
+
+@scenario("AttachmentRepository.delete_attachment")
+def _delete_attachment(ctx):
+    attachment_id = ctx.new_attachment()
+    return lambda: ctx.attachments.delete_attachment(attachment_id)
+
+
+@scenario("AttachmentRepository.collect_garbage")
+def _collect_garbage(ctx):
+    # Вложение удаляемого пациента уходит каскадом, и его файл остается без ссылок
+    patient_id = ctx.new_patient()
+    ctx.new_attachment(patient_id)
+    ctx.patients.delete_patient(patient_id)
+    return lambda: ctx.attachments.collect_garbage()
+
+
+def public_methods() -> list[str]:
+    """Все публичные методы проверяемых репозиториев в виде 'Класс.метод'."""
+    return [f"{cls.__name__}.{name}" for cls in REPOSITORIES
+            for name, member in vars(cls).items()
+            if not name.startswith("_") and inspect.isfunction(member)]
+
+
+def table_aliases(sql) -> dict:
+    """Соответствие имен из плана (псевдоним или имя таблицы) таблицам запроса."""
+    aliases = {}
+    for table, alias in TABLE_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def plan_violations(plan, sql, table_rows, large_table_rows) -> list[str]:
+    """Шаги плана, которые считаются регрессией: SCAN большой таблицы и временные B-деревья."""
+    aliases = table_aliases(sql)
+    violations = []
+    for step in plan:
+        if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step:
+            table = aliases.get(step.split()[1])
+            if table is not None and table_rows.get(table, 0) >= large_table_rows:
+                violations.append(step if table == step.split()[1] else f"{step} ({table})")
+        elif "USE TEMP B-TREE" in step:
+            violations.append(step)
+    return violations
+
+
+def _allowed(method, violation):
+    return any(pattern in violation for pattern in ALLOWLIST.get(method, ()))
+
+
+def count_table_rows(conn) -> dict:
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+    """)
+    tables = [name for (name,) in cursor.fetchall()]
+    return {table: cursor.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in tables}
+
+
+def run(db_name, summary, args) -> list[str]:
+    """Выполняет все сценарии и возвращает неразрешенные нарушения."""
+    ctx = PlanContext(db_name, summary, args.seed)
+    capture = StatementCapture()
+    # Пул отдает этому потоку одни и те же соединения (основное и для генераторов),
+    # поэтому перехват действует на все вызовы
+    for reader in (False, True):
+        with DatabaseConnection(db_name, reader=reader) as conn:
+            conn.set_trace_callback(capture)
+
+    problems = [f"{method}: нет сценария проверки" for method in public_methods()
+                if method not in SCENARIOS and method not in NO_QUERIES]
+    timings = {}
+    for method, prepare in SCENARIOS.items():
+        samples = []
+        for _ in range(args.repeat):
+            call = prepare(ctx)
+            capture.method = method
+            started = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - started) * 1000)
+            capture.method = None
+        timings[method] = statistics.median(samples)
+
+    plan_conn = sqlite3.connect(db_name)
+    # Триггеры полнотекстового индекса вызывают record_text, без нее запись в medical_records не разобрать
+    record_storage.register_functions(plan_conn)
+    try:
+        table_rows = count_table_rows(plan_conn)
+        for method in SCENARIOS:
+            statements = capture.statements.get(method, {})
+            ceiling = CEILINGS_MS.get(method, DEFAULT_CEILING_MS) * args.ceiling_scale
+            slow = timings[method] > ceiling
+            method_problems = []
+            for sql in statements.values():
+                plan = explain(plan_conn, sql)
+                violations = [violation for violation in plan_violations(plan, sql, table_rows, args.large_table_rows)
+                              if not _allowed(method, violation)]
+                method_problems.extend(f"{method}: {violation}\n        {normalize(sql)}" for violation in violations)
+                if args.verbose:
+                    print(f"    {normalize(sql)}")
+                    for step in plan:
+                        print(f"        {step}")
+            if slow:
+                method_problems.append(f"{method}: медиана {timings[method]:.1f} мс выше потолка {ceiling:.0f} мс")
+            if not statements:
+                method_problems.append(f"{method}: сценарий не выполнил ни одного запроса")
+            status = "FAIL" if method_problems else "ok"
+            print(f"{status:4} {method:52} {timings[method]:8.2f} мс (потолок {ceiling:.0f})  запросов: {len(statements)}")
+            problems.extend(method_problems)
+    finally:
+        plan_conn.close()
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Планы и задержки всех запросов репозиториев")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--appointments", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="Вызовов каждого метода для медианы")
+    parser.add_argument("--large-table-rows", type=int, default=1000,
+                        help="С какого числа строк SCAN таблицы считается нарушением")
+    parser.add_argument("--ceiling-scale", type=float, default=1.0,
+                        help="Множитель потолков задержки (для медленных машин или больших данных)")
+    parser.add_argument("--verbose", action="store_true", help="Печатать запросы и их планы")
+    args = parser.parse_args(argv)
+
+    config = synthetic.SyntheticConfig(doctors=args.doctors, patients=args.patients,
+                                       appointments=args.appointments, seed=args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, "plan_regression.db")
+        database.enable_pooling()
+        try:
+            summary = synthetic.generate(db_name, config)
+            problems = run(db_name, summary, args)
+        finally:
+            database.close_pools()
+
+    for problem in problems:
+        print(f"  НАРУШЕНИЕ: {problem}")
+    print(f"Нарушений: {len(problems)}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
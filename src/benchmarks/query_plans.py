@@ -0,0 +1,184 @@
+"""
+Проверка планов запросов (EXPLAIN QUERY PLAN): поиск по ключу и каскадные удаления
+должны идти по индексу, а не перебирать таблицу целиком.
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --db healthcare.db
+
+Каскад ON DELETE CASCADE SQLite выполняет как поиск дочерних строк по значению
+внешнего ключа, поэтому для каждого внешнего ключа схемы проверяется план запроса
+SELECT ... FROM <дочерняя таблица> WHERE <колонка> = ?. Дополнительно проверяются
+запросы, которые выполняют методы репозиториев из KEYED_CALLS. Код возврата 1, если найден полный перебор.
+"""
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import database
+import passwords
+from database import DatabaseConnection
+from repositories import AppointmentRepository, DoctorRepository, PatientRepository, UserRepository
+
+# Методы репозиториев, которые ищут строки по ключу: (имя, вызов). Проверяются запросы,
+# которые метод действительно выполнил (перехват через set_trace_callback), а не их копии
+KEYED_CALLS = [
+    ("UserRepository.login", lambda db, ids: UserRepository(db).login("query_plans_nobody", "x")),
+    ("PatientRepository.get_patient_by_user_id",
+     lambda db, ids: PatientRepository(db).get_patient_by_user_id(ids['patient_user_id'])),
+    ("DoctorRepository.get_doctor_by_user_id",
+     lambda db, ids: DoctorRepository(db).get_doctor_by_user_id(ids['doctor_user_id'])),
+    ("AppointmentRepository.get_booked_slots_in_one_day",
+     lambda db, ids: AppointmentRepository(db).get_booked_slots_in_one_day(ids['doctor_id'], DAY)),
+    ("AppointmentRepository.find_earliest_free_slots",
+     lambda db, ids: AppointmentRepository(db).find_earliest_free_slots(
+         SPECIALITY, datetime.datetime.combine(DAY, datetime.time(9)))),
+    # Удаление - последним: после него врача и пациента для остальных вызовов уже нет
+    ("PatientRepository.delete_patient", lambda db, ids: PatientRepository(db).delete_patient(ids['patient_id'])),
+    ("DoctorRepository.delete_doctor", lambda db, ids: DoctorRepository(db).delete_doctor(ids['doctor_id'])),
+]
+DAY = datetime.date(2024, 1, 1)
+SPECIALITY = "Терапевт"
+
+STATEMENT_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", re.IGNORECASE)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Служебные таблицы FTS5 (их читают триггеры полнотекстового индекса), например medical_records_fts_config
+FTS5_SHADOW_RE = re.compile(r"^SCAN (?:main\.)?\w+_fts_(?:config|data|idx|docsize|content)\b")
+
+
+class StatementCapture:
+    """Собирает SQL-запросы соединения (set_trace_callback) для текущего метода."""
+
+    def __init__(self):
+        self.method = None
+        self.statements = {}  # метод: {нормализованный текст: пример запроса}
+
+    def __call__(self, sql):
+        if self.method is not None and STATEMENT_RE.match(sql):
+            self.statements.setdefault(self.method, {}).setdefault(normalize(sql), sql)
+
+
+def normalize(sql) -> str:
+    """Текст запроса без значений параметров и лишних пробелов - ключ для объединения повторов."""
+    return " ".join(LITERAL_RE.sub("?", sql).split())
+
+
+def explain(conn, sql, params=()) -> list[str]:
+    """Строки плана EXPLAIN QUERY PLAN (поле detail) в порядке вывода SQLite."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+
+def full_scans(plan) -> list[str]:
+    """Шаги плана, перебирающие таблицу целиком (виртуальные таблицы FTS и их служебные не считаются)."""
+    return [step for step in plan
+            if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step and not FTS5_SHADOW_RE.match(step)]
+
+
+def cascade_queries(conn) -> list[tuple]:
+    """
+    Запросы, которыми SQLite ищет дочерние строки при удалении родителя,
+    по одному на каждый внешний ключ схемы.
+
+    :return: Список (описание, SQL, параметры)
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+    """)
+    queries = []
+    for (table,) in cursor.fetchall():
+        cursor.execute(f"PRAGMA foreign_key_list({table})")
+        for row in cursor.fetchall():
+            parent, column, action = row[2], row[3], row[6]
+            queries.append((f"{parent} -> {table}.{column} ({action})",
+                            f"SELECT 1 FROM {table} WHERE {column} = ?", (1,)))
+    return queries
+
+
+def keyed_queries(db_name) -> list[tuple]:
+    """
+    Вызывает методы из KEYED_CALLS на тестовых врача и пациента и собирает выполненные запросы.
+    Нужен пул соединений: перехват ставится на соединение текущего потока.
+
+    :return: Список (метод, SQL, параметры)
+    """
+    password = passwords.hash_password("x", iterations=1000)
+    doctor_id = DoctorRepository(db_name).add_doctor("query_plans_doctor", password, "Врач", SPECIALITY)
+    patient_id = PatientRepository(db_name).add_patient("query_plans_patient", password, "Пациент")
+    users = UserRepository(db_name)
+    ids = dict(doctor_id=doctor_id, patient_id=patient_id,
+               doctor_user_id=users.find_by_username("query_plans_doctor"),
+               patient_user_id=users.find_by_username("query_plans_patient"))
+    AppointmentRepository(db_name).add_appointment(patient_id, doctor_id,
+                                                   datetime.datetime.combine(DAY, datetime.time(10)))
+
+    capture = StatementCapture()
+    with DatabaseConnection(db_name) as conn:
+        conn.set_trace_callback(capture)
+        try:
+            for name, call in KEYED_CALLS:
+                capture.method = name
+                call(db_name, ids)
+        finally:
+            capture.method = None
+            conn.set_trace_callback(None)
+    return [(method, sql, ()) for method, statements in capture.statements.items() for sql in statements.values()]
+
+
+def check(db_name, verbose=False) -> list[str]:
+    """Проверяет планы каскадов и запросов KEYED_CALLS, возвращает найденные нарушения."""
+    with DatabaseConnection(db_name) as conn:
+        queries = cascade_queries(conn)
+    queries += keyed_queries(db_name)
+    problems = []
+    with DatabaseConnection(db_name) as conn:
+        for name, sql, params in queries:
+            plan = explain(conn, sql, params)
+            scans = full_scans(plan)
+            if verbose or scans:
+                print(f"{'SCAN' if scans else 'ok':5} {name}")
+                if verbose:
+                    print(f"        {normalize(sql)}")
+                for step in plan:
+                    print(f"        {step}")
+            if scans:
+                problems.append(f"{name}: {'; '.join(scans)}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка использования индексов запросами и каскадами")
+    parser.add_argument("--db", help="Проверить копию существующей базы (по умолчанию - новая пустая)")
+    parser.add_argument("--verbose", action="store_true", help="Печатать планы всех запросов")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, "query_plans.db")
+        if args.db:
+            # Методы из KEYED_CALLS пишут в базу, поэтому проверяется копия
+            source, target = sqlite3.connect(args.db), sqlite3.connect(db_name)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+        database.create_tables(db_name)
+        database.enable_pooling()
+        try:
+            problems = check(db_name, args.verbose)
+        finally:
+            database.close_pools()
+    print(f"Нарушений: {len(problems)}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
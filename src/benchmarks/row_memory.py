@@ -0,0 +1,87 @@
+"""
+Память на строку результата: словари dict_factory против компактных строк rows.
+
+    python -m benchmarks.row_memory --patients 20000 --appointments 100000
+
+На синтетической базе одни и те же запросы читаются целиком (fetchall) сначала
+с dict_factory, затем с rows.factory(<сущность>). Объем памяти, занятой списком
+строк, измеряется через tracemalloc, время чтения - через perf_counter.
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import database
+import rows
+from benchmarks import synthetic
+from database import DatabaseConnection
+
+# Название: (сущность, запрос) - те же запросы, что в репозиториях
+QUERIES = {
+    "patients": (rows.Patient, "SELECT patient_id, name FROM patients"),
+    "doctors": (rows.Doctor, "SELECT doctor_id, name, speciality FROM doctors"),
+    "users": (rows.User, "SELECT * FROM users"),
+    "appointments": (rows.Appointment, """
+        SELECT a.appointment_id, a.patient_id, p.name, a.appointment_time
+        FROM appointments a JOIN patients p ON p.patient_id = a.patient_id
+    """),
+}
+
+
+def measure(conn, query, factory):
+    """
+    Читает все строки запроса с указанной row_factory.
+
+    :return: (число строк, байт на строку, миллисекунд на весь запрос)
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.row_factory = factory
+    cursor.execute(query)
+    result = cursor.fetchall()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(result)
+    del result
+    return count, size / max(count, 1), elapsed_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Память на строку: dict_factory и rows")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, "row_memory.db")
+        database.enable_pooling()
+        try:
+            config = synthetic.SyntheticConfig(doctors=args.doctors, patients=args.patients,
+                                               appointments=args.appointments, record_fraction=0,
+                                               seed=args.seed)
+            synthetic.generate(db_name, config)
+
+            print(f"{'запрос':14} {'строк':>8} {'dict, Б/стр':>12} {'rows, Б/стр':>12} {'экономия':>9}"
+                  f" {'dict, мс':>9} {'rows, мс':>9}")
+            with DatabaseConnection(db_name) as conn:
+                for name, (entity, query) in QUERIES.items():
+                    # Прогрев: класс строки создается один раз и не относится к памяти строк
+                    measure(conn, query + " LIMIT 1", rows.factory(entity))
+                    count, dict_bytes, dict_ms = measure(conn, query, database.dict_factory)
+                    _, row_bytes, row_ms = measure(conn, query, rows.factory(entity))
+                    print(f"{name:14} {count:8} {dict_bytes:12.0f} {row_bytes:12.0f}"
+                          f" {1 - row_bytes / dict_bytes:8.0%} {dict_ms:9.1f} {row_ms:9.1f}")
+        finally:
+            database.close_pools()
+
+
+if __name__ == "__main__":
+    main()
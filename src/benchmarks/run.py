@@ -0,0 +1,174 @@
+"""
+Замер типичных сценариев работы репозиториев на синтетической базе.
+
+    python -m benchmarks.run --patients 20000 --appointments 200000 --out benchmark_results.json
+
+Результат записывается в JSON, чтобы сравнивать прогоны между собой.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks import synthetic
+from repositories import AppointmentRepository, DoctorRepository, PatientRepository, UserRepository
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Регистрирует функцию сценария. Функция получает BenchmarkContext и выполняет одну операцию."""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class BenchmarkContext:
+    def __init__(self, db_name, summary, seed):
+        self.db_name = db_name
+        self.summary = summary
+        self.rnd = random.Random(seed)
+        self.users = UserRepository(db_name)
+        self.patients = PatientRepository(db_name)
+        self.doctors = DoctorRepository(db_name)
+        self.appointments = AppointmentRepository(db_name)
+        self.first_day = datetime.date.fromisoformat(summary['first_day'])
+        self.days = (datetime.date.fromisoformat(summary['last_day']) - self.first_day).days + 1
+        # Бронирования идут в дни после синтетической истории, каждый раз в новый слот
+        self.next_booking = datetime.datetime.combine(
+            self.first_day + datetime.timedelta(days=self.days), datetime.time(10))
+
+    def random_doctor_id(self):
+        return self.rnd.randint(1, self.summary['doctors'])
+
+    def random_patient_id(self):
+        return self.rnd.randint(1, self.summary['patients'])
+
+    def random_day(self):
+        return self.first_day + datetime.timedelta(days=self.rnd.randrange(self.days))
+
+
+@scenario("login")
+def _login(ctx):
+    username = synthetic.patient_username(ctx.rnd.randrange(ctx.summary['patients']))
+    assert ctx.users.authenticate(username, synthetic.PASSWORD) is not None
+
+
+@scenario("patient_list")
+def _patient_list(ctx):
+    ctx.patients.get_all_patients()
+
+
+@scenario("doctor_appointments")
+def _doctor_appointments(ctx):
+    ctx.appointments.get_appointments_by_doctor_id(ctx.random_doctor_id())
+
+
+@scenario("booked_slots")
+def _booked_slots(ctx):
+    ctx.appointments.get_booked_slots_in_one_day(ctx.random_doctor_id(), ctx.random_day())
+
+
+@scenario("booking")
+def _booking(ctx):
+    ctx.appointments.add_appointment(ctx.random_patient_id(), ctx.random_doctor_id(), ctx.next_booking)
+    ctx.next_booking += datetime.timedelta(minutes=10)
+
+
+@scenario("record_update")
+def _record_update(ctx):
+    patient_id = ctx.random_patient_id()
+    record = ctx.patients.get_patient_record(patient_id)['record']
+    ctx.patients.update_medical_record(patient_id, record + f"\nПовторный прием {ctx.rnd.randrange(10 ** 6)}")
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_scenario(func, ctx, repeat, warmup=3):
+    """Выполняет сценарий repeat раз и возвращает статистику задержек в миллисекундах."""
+    for _ in range(warmup):
+        func(ctx)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(ctx)
+        samples.append((time.perf_counter() - started) * 1000)
+    return dict(repeat=repeat,
+                mean_ms=statistics.fmean(samples),
+                median_ms=statistics.median(samples),
+                p95_ms=_percentile(samples, 0.95),
+                min_ms=min(samples),
+                max_ms=max(samples))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер сценариев работы репозиториев")
+    parser.add_argument("--db", help="Файл базы (по умолчанию временный, удаляется после замера)")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50, help="Повторов каждого сценария")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Запустить только указанные сценарии (можно несколько раз)")
+    parser.add_argument("--no-pooling", action="store_true", help="Открывать соединение на каждый запрос")
+    parser.add_argument("--out", default="benchmark_results.json", help="Куда записать результат")
+    args = parser.parse_args(argv)
+
+    config = synthetic.SyntheticConfig(doctors=args.doctors, patients=args.patients,
+                                       appointments=args.appointments, days=args.days, seed=args.seed)
+    temp_dir = None
+    db_name = args.db
+    if db_name is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_name = os.path.join(temp_dir.name, "benchmark.db")
+
+    database.enable_pooling(not args.no_pooling)
+    try:
+        started = time.perf_counter()
+        summary = synthetic.generate(db_name, config)
+        generation_seconds = time.perf_counter() - started
+        print(f"Данные сгенерированы за {generation_seconds:.1f} с: {summary}")
+
+        ctx = BenchmarkContext(db_name, summary, args.seed)
+        results = {}
+        for name in args.scenario or SCENARIOS:
+            results[name] = run_scenario(SCENARIOS[name], ctx, args.repeat)
+            print(f"{name:22} median {results[name]['median_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms")
+    finally:
+        database.close_pools()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = dict(
+        meta=dict(timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+                  python=sys.version.split()[0],
+                  sqlite=sqlite3.sqlite_version,
+                  platform=platform.platform(),
+                  pooling=not args.no_pooling,
+                  config=config.as_dict(),
+                  generation_seconds=generation_seconds),
+        dataset=summary,
+        scenarios=results,
+    )
+    with open(args.out, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результат записан в {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import datetime
+import random
+
+import passwords
+from database import DatabaseConnection, create_tables
+from repositories import DoctorRepository, PatientRepository, Role, UserRepository
+
+# Все даты отсчитываются от фиксированного дня, чтобы данные не зависели от даты запуска
+BASE_DATE = datetime.date(2024, 1, 1)
+PASSWORD = "password"
+
+SPECIALITIES = ("терапевт", "хирург", "кардиолог", "невролог", "офтальмолог",
+                "дерматолог", "педиатр", "эндокринолог", "лор", "стоматолог")
+FIRST_NAMES = ("Иван", "Петр", "Анна", "Мария", "Олег", "Елена", "Сергей", "Ольга", "Дмитрий", "Наталья")
+LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков")
+RECORD_WORDS = ("жалобы", "кашель", "температура", "давление", "головная", "боль", "осмотр", "анализ", "крови",
+                "рекомендации", "аллергия", "пенициллин", "антибиотик", "повторный", "прием", "через", "неделю",
+                "состояние", "удовлетворительное", "назначено", "лечение", "диагноз", "ОРВИ", "гипертония")
+
+
+class SyntheticConfig:
+    """Размер синтетической базы. Одинаковые параметры и seed дают одинаковые данные."""
+
+    def __init__(self, doctors=50, patients=10000, appointments=100000, record_fraction=0.8,
+                 record_words=150, days=120, seed=42):
+        self.doctors = doctors
+        self.patients = patients
+        self.appointments = appointments
+        self.record_fraction = record_fraction
+        self.record_words = record_words
+        self.days = days
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _name(rnd):
+    return f"{rnd.choice(LAST_NAMES)} {rnd.choice(FIRST_NAMES)}"
+
+
+def doctor_username(index):
+    return f"doctor{index}"
+
+
+def patient_username(index):
+    return f"patient{index}"
+
+
+def generate(db_name, config: SyntheticConfig) -> dict:
+    """
+    Создает схему и заполняет базу синтетическими пользователями, врачами,
+    пациентами, медицинскими картами и записями на прием.
+
+    :return: Сводка: количества строк и диапазон дат записей
+    """
+    rnd = random.Random(config.seed)
+    create_tables(db_name)
+
+    user_repository = UserRepository(db_name)
+    doctor_repository = DoctorRepository(db_name)
+    patient_repository = PatientRepository(db_name)
+
+    # Один хэш на всех: хэшировать пароль каждого из тысяч пользователей слишком долго,
+    # а импорт сохраняет готовые хэши как есть
+    password_hash = passwords.hash_password(PASSWORD)
+    user_repository.add_user("admin", password_hash, Role.ADMIN)
+    doctor_repository.add_doctors_bulk(
+        (doctor_username(i), password_hash, _name(rnd), SPECIALITIES[i % len(SPECIALITIES)])
+        for i in range(config.doctors))
+    patient_repository.add_patients_bulk(
+        (patient_username(i), password_hash, _name(rnd)) for i in range(config.patients))
+
+    with DatabaseConnection(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT doctor_id FROM doctors ORDER BY doctor_id")
+        doctor_ids = [row['doctor_id'] for row in cursor.fetchall()]
+        cursor.execute("SELECT patient_id FROM patients ORDER BY patient_id")
+        patient_ids = [row['patient_id'] for row in cursor.fetchall()]
+
+        records = ((patient_id, " ".join(rnd.choice(RECORD_WORDS) for _ in range(config.record_words)))
+                   for patient_id in patient_ids if rnd.random() < config.record_fraction)
+        cursor.executemany("INSERT INTO medical_records (patient_id, record) VALUES (?, ?)", records)
+
+        # Записи на прием с шагом 10 минут с 10:00 до 18:00, без повторов слота у врача
+        slots_per_day = 49
+        total_slots = len(doctor_ids) * config.days * slots_per_day
+        appointments = min(config.appointments, total_slots)
+        taken = set()
+        rows = []
+        while len(rows) < appointments:
+            doctor_id = rnd.choice(doctor_ids)
+            day = rnd.randrange(config.days)
+            slot = rnd.randrange(slots_per_day)
+            if (doctor_id, day, slot) in taken:
+                continue
+            taken.add((doctor_id, day, slot))
+            moment = datetime.datetime.combine(BASE_DATE, datetime.time(10)) + \
+                datetime.timedelta(days=day, minutes=10 * slot)
+            rows.append((doctor_id, rnd.choice(patient_ids), moment.isoformat(sep=" ")))
+        cursor.executemany("""
+            INSERT INTO appointments (doctor_id, patient_id, appointment_time) VALUES (?, ?, ?)
+        """, rows)
+
+        cursor.execute("SELECT count(*) AS n FROM medical_records")
+        record_count = cursor.fetchone()['n']
+
+    return dict(users=1 + len(doctor_ids) + len(patient_ids),
+                doctors=len(doctor_ids),
+                patients=len(patient_ids),
+                medical_records=record_count,
+                appointments=len(rows),
+                first_day=BASE_DATE.isoformat(),
+                last_day=(BASE_DATE + datetime.timedelta(days=config.days - 1)).isoformat())
@@ -0,0 +1,76 @@
+import enum
+import random
+import sqlite3
+import time
+
+# Попыток взять блокировку записи, прежде чем вернуть RETRY_LATER.
+# Каждая попытка сама ждет до busy_timeout соединения.
+RESERVATION_ATTEMPTS = 3
+RESERVATION_BACKOFF_SECONDS = 0.05
+DEFAULT_ALTERNATIVES = 3
+# На сколько дней вперед искать альтернативы занятому слоту
+ALTERNATIVES_HORIZON_DAYS = 7
+
+
+class ReservationStatus(enum.Enum):
+    BOOKED = "booked"
+    SLOT_TAKEN = "slot_taken"
+    INVALID_SLOT = "invalid_slot"
+    RETRY_LATER = "retry_later"
+
+
+class ReservationResult:
+    """
+    Итог попытки записи на прием.
+
+    status - ReservationStatus,
+    appointment_id - айди записи, если status == BOOKED,
+    alternatives - ближайшие свободные слоты врача (datetime) для SLOT_TAKEN и INVALID_SLOT.
+    """
+    __slots__ = ("status", "appointment_time", "appointment_id", "alternatives")
+
+    def __init__(self, status: ReservationStatus, appointment_time, appointment_id=None, alternatives=()):
+        self.status = status
+        self.appointment_time = appointment_time
+        self.appointment_id = appointment_id
+        self.alternatives = list(alternatives)
+
+    @property
+    def booked(self) -> bool:
+        return self.status is ReservationStatus.BOOKED
+
+    def __repr__(self):
+        return (f"ReservationResult({self.status.value}, {self.appointment_time}, "
+                f"appointment_id={self.appointment_id}, alternatives={len(self.alternatives)})")
+
+
+def is_lock_error(error: sqlite3.OperationalError) -> bool:
+    """Ошибка означает, что базу держит другой писатель, и попытку можно повторить."""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def backoff(attempt):
+    """Пауза перед повторной попыткой: растет с номером попытки, со случайным разбросом."""
+    time.sleep(RESERVATION_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+class RecurringBookingResult:
+    """
+    Итог записи на серию приемов (AppointmentRepository.book_recurring).
+
+    status - BOOKED, если записаны все приемы, SLOT_TAKEN, если часть конфликтует,
+    INVALID_SLOT, если время серии не совпадает с началом слота (например, с секундами),
+    RETRY_LATER, если не удалось получить блокировку базы,
+    booked - список (время, appointment_id) записанных приемов,
+    conflicts - список (время, ReservationStatus.SLOT_TAKEN или INVALID_SLOT) незаписанных.
+    """
+    __slots__ = ("status", "booked", "conflicts")
+
+    def __init__(self, status: ReservationStatus, booked=(), conflicts=()):
+        self.status = status
+        self.booked = list(booked)
+        self.conflicts = list(conflicts)
+
+    def __repr__(self):
+        return f"RecurringBookingResult({self.status.value}, booked={len(self.booked)}, conflicts={len(self.conflicts)})"
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+
+
+def read_records(path):
+    """
+    Читает записи для массового импорта из CSV (с заголовком) или JSONL файла.
+    Формат определяется по расширению: .csv, .jsonl или .ndjson.
+
+    :param path: Путь к файлу
+    :return: Генератор словарей, по одному на строку файла
+    """
+    extension = os.path.splitext(os.fspath(path))[1].lower()
+    if extension == ".csv":
+        return _read_csv(path)
+    if extension in (".jsonl", ".ndjson"):
+        return _read_jsonl(path)
+    raise ValueError(f"Неподдерживаемый формат файла: {path}")
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for row in csv.DictReader(file):
+            yield {key.strip(): (value or "").strip() for key, value in row.items() if key}
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_chunks(iterable, size):
+    """Разбивает поток на списки длиной не больше size."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkImportResult:
+    """
+    Итог массового импорта.
+
+    inserted - сколько строк добавлено,
+    errors - список (номер строки, логин, причина) для пропущенных строк.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def add_error(self, row_number, username, reason):
+        self.errors.append((row_number, username, reason))
+
+    def __repr__(self):
+        return f"BulkImportResult(inserted={self.inserted}, errors={len(self.errors)})"
@@ -0,0 +1,221 @@
+import collections
+import os
+import sys
+import threading
+
+_doctor_directories = {}
+_record_caches = {}
+_directories_lock = threading.Lock()
+
+# Ограничения кэша медицинских карт одной базы
+RECORD_CACHE_MAX_ENTRIES = 1024
+RECORD_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+class DoctorDirectory:
+    """
+    Кэш справочника врачей в памяти процесса: список врачей, индекс по doctor_id
+    и индекс по специальности. Загружается при первом обращении и сбрасывается
+    методами DoctorRepository, которые меняют таблицу doctors.
+    """
+
+    def __init__(self, loader):
+        """
+        :param loader: Функция без аргументов, возвращающая список врачей
+                       (словари с ключами 'doctor_id', 'name', 'speciality')
+        """
+        self._loader = loader
+        self._lock = threading.Lock()
+        # (список врачей, индекс по doctor_id, индекс по специальности) или None, если не загружено
+        self._state = None
+
+    @classmethod
+    def for_database(cls, db_name, loader):
+        """Возвращает общий для всех репозиториев справочник одной базы данных."""
+        key = db_name if db_name == ":memory:" else os.path.abspath(db_name)
+        directory = _doctor_directories.get(key)
+        if directory is None:
+            with _directories_lock:
+                directory = _doctor_directories.setdefault(key, cls(loader))
+        return directory
+
+    def _ensure_loaded(self):
+        state = self._state
+        if state is not None:
+            return state
+
+        with self._lock:
+            if self._state is not None:
+                return self._state
+            doctors = self._loader()
+            if doctors is None:
+                # Загрузка не удалась (ошибка уже залогирована) - ничего не кэшируем
+                return [], {}, {}
+            doctors = list(doctors)
+            by_id = {doctor['doctor_id']: doctor for doctor in doctors}
+            by_speciality = {}
+            for doctor in doctors:
+                by_speciality.setdefault(doctor['speciality'], []).append(doctor)
+
+            self._state = (doctors, by_id, by_speciality)
+            return self._state
+
+    def all(self) -> list[dict]:
+        """Все врачи."""
+        return list(self._ensure_loaded()[0])
+
+    def get(self, doctor_id) -> dict | None:
+        """Врач по doctor_id или None."""
+        return self._ensure_loaded()[1].get(doctor_id)
+
+    def by_speciality(self, speciality) -> list[dict]:
+        """Врачи указанной специальности."""
+        return list(self._ensure_loaded()[2].get(speciality, ()))
+
+    def specialities(self) -> list[str]:
+        """Список всех специальностей."""
+        return sorted(self._ensure_loaded()[2])
+
+    def invalidate(self):
+        """Сбрасывает кэш, следующий запрос перечитает врачей из базы."""
+        # Берем блокировку, чтобы не потерять сброс во время параллельной загрузки
+        with self._lock:
+            self._state = None
+
+
+class RecordCache:
+    """
+    LRU-кэш текстов медицинских карт по patient_id, ограниченный и числом карт,
+    и их суммарным размером в памяти.
+
+    Свои изменения PatientRepository записывает в кэш после commit (write-through).
+    Чужие изменения обнаруживаются по счетчику изменений карт в базе (таблица
+    record_change_counter, его увеличивают триггеры). После своей записи кэш узнает
+    новое значение счетчика (note_own_changes), поэтому изменения этого процесса,
+    из любого потока, кэш не сбрасывают. Если при чтении счетчик отличается от
+    известного кэшу, карты изменил другой процесс, и кэш очищается целиком.
+    """
+
+    def __init__(self, max_entries=RECORD_CACHE_MAX_ENTRIES, max_bytes=RECORD_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # patient_id: (текст, размер)
+        self._bytes = 0
+        # Растет при каждом изменении; загрузка из базы, начатая до изменения, в кэш не попадает
+        self._generation = 0
+        # Значение счетчика изменений карт, которому соответствует содержимое кэша
+        self._changes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def for_database(cls, db_name):
+        """Возвращает общий для всех репозиториев кэш карт одной базы данных."""
+        key = db_name if db_name == ":memory:" else os.path.abspath(db_name)
+        cache = _record_caches.get(key)
+        if cache is None:
+            with _directories_lock:
+                cache = _record_caches.setdefault(key, cls())
+        return cache
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def check_changes(self, changes):
+        """
+        Сверяет счетчик изменений карт, прочитанный из базы, с известным кэшу
+        и очищает кэш, если карты с тех пор изменил кто-то кроме этого процесса.
+        """
+        with self._lock:
+            if changes != self._changes:
+                self._changes = changes
+                self._clear()
+
+    def note_own_changes(self, before, after):
+        """
+        Учитывает изменение карт этим процессом после его commit.
+
+        :param before: Счетчик изменений карт до изменения
+        :param after: Счетчик после изменения (оба прочитаны в одной транзакции записи)
+        """
+        with self._lock:
+            # after кэш уже мог увидеть при чтении сразу после commit; другое значение
+            # означает, что до этой записи карты менял еще кто-то
+            if self._changes not in (before, after):
+                self._clear()
+            self._changes = after
+
+    def get(self, patient_id):
+        """Текст карты из кэша или None, если его там нет."""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, patient_id, record, generation=None):
+        """
+        Запоминает текст карты.
+
+        :param generation: Значение generation до чтения карты из базы; если кэш с тех пор
+                           менялся, прочитанный текст может быть устаревшим и не сохраняется.
+                           None - текст заведомо актуален (записан и зафиксирован этим процессом)
+        """
+        size = sys.getsizeof(record)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._generation += 1
+            self._remove(patient_id)
+            if size > self.max_bytes:
+                return
+            self._entries[patient_id] = (record, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, patient_id):
+        """Удаляет карту пациента из кэша."""
+        with self._lock:
+            self._generation += 1
+            if self._remove(patient_id):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, patient_id):
+        entry = self._entries.pop(patient_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        return entry is not None
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов и текущий размер - для подбора ограничений."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        hit_rate=self.hits / lookups if lookups else 0.0,
+                        entries=len(self._entries),
+                        bytes=self._bytes,
+                        max_entries=self.max_entries,
+                        max_bytes=self.max_bytes,
+                        evictions=self.evictions,
+                        invalidations=self.invalidations)
@@ -1,96 +1,368 @@
+import os
 import sqlite3
 import functools
+import inspect
+import threading
+import time
+import weakref
+
+from instrumentation import InstrumentedConnection, count_rows, metrics
+import migrations
+import record_storage
 
 def handle_db_errors():
-    """Декоратор для обработки ошибок SQLite и возврата значения по умолчанию при ошибке."""
+    """
+    Декоратор для обработки ошибок SQLite и возврата значения по умолчанию при ошибке.
+    Для функций-генераторов ошибки перехватываются во время итерации, и генератор просто завершается.
+    Генератор, закрытый до конца (break, отмена чтения), ошибкой не считается.
+    При включенной статистике (enable_instrumentation) замеряет время и число строк каждого вызова.
+    """
     def decorator(func):
+        name = func.__qualname__
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                started = time.perf_counter() if metrics.enabled else None
+                rows = 0
+                failed = True
+                try:
+                    for row in func(*args, **kwargs):
+                        rows += 1
+                        yield row
+                    failed = False
+                except GeneratorExit:
+                    failed = False
+                    raise
+                except sqlite3.IntegrityError as e:
+                    print(f"Integrity error in {func.__name__}: {e}")
+                except sqlite3.DatabaseError as e:
+                    print(f"Database error in {func.__name__}: {e}")
+                except Exception as e:
+                    print(f"Unexpected error in {func.__name__}: {e}")
+                finally:
+                    if started is not None:
+                        metrics.record_call(name, (time.perf_counter() - started) * 1000, rows, failed)
+            return gen_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            started = time.perf_counter() if metrics.enabled else None
+            result = None
+            failed = True
             try:
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
+                failed = False
+                return result
             except sqlite3.IntegrityError as e:
                 print(f"Integrity error in {func.__name__}: {e}")
             except sqlite3.DatabaseError as e:
                 print(f"Database error in {func.__name__}: {e}")
             except Exception as e:
                 print(f"Unexpected error in {func.__name__}: {e}")
+            finally:
+                if started is not None:
+                    metrics.record_call(name, (time.perf_counter() - started) * 1000, count_rows(result), failed)
         return wrapper
     return decorator
 
+# (cursor.description, имена колонок) последнего запроса: описание одно на весь запрос,
+# поэтому имена колонок не собираются заново для каждой строки
+_last_fields = (None, ())
+
+
 def dict_factory(cursor, row):
-    fields = [column[0] for column in cursor.description]
-    return {key: value for key, value in zip(fields, row)}
+    global _last_fields
+    description = cursor.description
+    seen, fields = _last_fields
+    if seen is not description:
+        fields = tuple(column[0] for column in description)
+        _last_fields = (description, fields)
+    return dict(zip(fields, row))
+
+# Параметры, которые выставляются один раз на каждое долгоживущее соединение пула
+POOL_BUSY_TIMEOUT_MS = 5000
+POOL_CACHE_SIZE_KIB = 16384  # отрицательное значение cache_size задается в KiB
+POOL_MMAP_SIZE = 256 * 1024 * 1024
+
+_pooling_enabled = False
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except sqlite3.Error:
+        pass
+
+
+class _ThreadConnection:
+    """Соединение пула, принадлежащее одному потоку, и состояние его блоков with."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.depth = 0
+        self.nested_failed = False
+        self.after_commit = []
+        self.closed = False  # закрыто close_all, поток откроет новое при следующем обращении
+        self.retired = False  # close_all застал соединение занятым, его закроет release
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений к одному файлу базы данных.
+
+    Каждый поток получает свое соединение (sqlite3 не любит, когда одно соединение
+    используют несколько потоков одновременно), которое открывается один раз и
+    настраивается PRAGMA-ми: WAL, synchronous=NORMAL, busy_timeout, cache_size и mmap_size.
+    Вложенные ``with DatabaseConnection(...)`` в одном потоке используют одно и то же
+    соединение, а commit выполняется только при выходе из самого внешнего блока.
+    Соединение потока закрывается, когда поток завершается.
+
+    Генераторы, которые держат запрос открытым между yield, берут отдельное соединение
+    только для чтения (``DatabaseConnection(..., reader=True)``): иначе блок генератора
+    оставался бы внешним, и записи потока, сделанные между его yield, не фиксировались бы.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        # Ссылки слабые: состояние соединения хранится в thread-local своего потока
+        # и удаляется вместе с потоком, а соединение тогда закрывает finalize (см. _open)
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def _connect(self, reader):
+        connection = sqlite3.connect(self.db_name, check_same_thread=False, factory=_connection_factory())
+        connection.row_factory = dict_factory
+        record_storage.register_functions(connection)
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout = {int(POOL_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size = {-int(POOL_CACHE_SIZE_KIB)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(POOL_MMAP_SIZE)}")
+        if reader:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+        return connection
+
+    def _open(self, reader):
+        state = _ThreadConnection(self._connect(reader))
+        state.depth = 1  # до регистрации, чтобы close_all не закрыл его как свободное
+        weakref.finalize(state, _close_quietly, state.connection)
+        with self._lock:
+            self._connections.add(state)
+        return state
+
+    @staticmethod
+    def _slot(reader):
+        return "reader" if reader else "writer"
+
+    def acquire(self, reader=False):
+        """
+        Возвращает соединение текущего потока, открывая его при первом обращении.
+
+        :param reader: Отдельное соединение только для чтения (для генераторов, см. описание класса)
+        """
+        state = getattr(self._local, self._slot(reader), None)
+        if state is not None and state.depth > 0:
+            state.depth += 1
+            return state.connection
+        if state is not None:
+            # Самый внешний блок берет соединение под блокировкой: close_all закрывает только свободные
+            with self._lock:
+                if not state.closed:
+                    state.depth = 1
+                    return state.connection
+        state = self._open(reader)
+        setattr(self._local, self._slot(reader), state)
+        return state.connection
+
+    def release(self, connection, commit=True, reader=False):
+        """
+        Возвращает соединение в пул. Фиксирует или откатывает транзакцию,
+        только если это самый внешний блок в текущем потоке.
+        """
+        state = getattr(self._local, self._slot(reader))
+        if state.depth > 1:
+            state.depth -= 1
+            if not commit:
+                # Откатывать или нет, решает внешний блок (см. take_nested_failure)
+                state.nested_failed = True
+            return
+        state.nested_failed = False
+        callbacks, state.after_commit = state.after_commit, []
+        try:
+            if commit:
+                connection.commit()
+            else:
+                connection.rollback()
+        finally:
+            with self._lock:
+                state.depth = 0
+                state.closed = state.closed or state.retired
+            if state.closed:
+                _close_quietly(connection)
+        if commit:
+            for callback in callbacks:
+                callback()
+
+    def after_commit(self, callback):
+        """
+        Вызывает callback после фиксации транзакции текущего потока, то есть при выходе
+        из самого внешнего блока with. При откате транзакции callback не вызывается.
+        """
+        self._local.writer.after_commit.append(callback)
+
+    def after_commit_mark(self) -> int:
+        """Сколько callback after_commit уже ждут commit в текущем потоке (см. discard_after_commit)."""
+        return len(self._local.writer.after_commit)
+
+    def discard_after_commit(self, mark):
+        """
+        Отменяет callback after_commit, добавленные после after_commit_mark. Нужно при откате
+        части транзакции до SAVEPOINT: изменения отменены, и вызывать их после commit нельзя.
+        """
+        del self._local.writer.after_commit[mark:]
+
+    def take_nested_failure(self) -> bool:
+        """
+        Завершался ли ошибкой вложенный блок в текущем потоке с прошлого вызова.
+        Нужно внешнему блоку, который выполняет несколько операций в одной транзакции
+        и откатывает неудавшуюся до SAVEPOINT (ошибку саму по себе гасит handle_db_errors).
+        """
+        state = getattr(self._local, "writer", None)
+        if state is None:
+            return False
+        failed, state.nested_failed = state.nested_failed, False
+        return failed
+
+    def close_all(self):
+        """
+        Закрывает соединения пула (например, при завершении приложения). Соединение, которое
+        сейчас занято блоком with в другом потоке, закрывается при выходе из этого блока,
+        а не посреди транзакции. Следующее обращение потока откроет новое соединение.
+        """
+        idle = []
+        with self._lock:
+            for state in list(self._connections):
+                if state.depth == 0:
+                    state.closed = True
+                    idle.append(state.connection)
+                else:
+                    state.retired = True
+            self._connections = weakref.WeakSet()
+        for connection in idle:
+            _close_quietly(connection)
+
+
+def enable_pooling(enabled=True):
+    """
+    Включает (или выключает) режим пула соединений для всех DatabaseConnection.
+    При выключении все открытые соединения пулов закрываются.
+    """
+    global _pooling_enabled
+    _pooling_enabled = enabled
+    if not enabled:
+        close_pools()
+
+
+def is_pooling_enabled():
+    return _pooling_enabled
+
+
+def get_pool(db_name):
+    """Возвращает пул для файла базы данных, создавая его при необходимости."""
+    key = db_name if db_name == ":memory:" else os.path.abspath(db_name)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(db_name))
+    return pool
+
+
+def close_pools():
+    """Закрывает соединения во всех пулах."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+def _connection_factory():
+    return InstrumentedConnection if metrics.enabled else sqlite3.Connection
+
+
+def enable_instrumentation(enabled=True, slow_query_threshold_ms=None):
+    """
+    Включает статистику запросов: счетчики и гистограммы задержек по методам репозиториев
+    и журнал медленных запросов. Открытые соединения пулов закрываются, чтобы новые
+    были созданы уже с замером запросов, поэтому включать лучше при старте приложения.
+
+    :param slow_query_threshold_ms: Порог, после которого запрос попадает в журнал медленных
+    """
+    metrics.enabled = enabled
+    if slow_query_threshold_ms is not None:
+        metrics.slow_query_threshold_ms = slow_query_threshold_ms
+    close_pools()
+
+
+def get_metrics_snapshot() -> dict:
+    """Текущая статистика запросов (см. instrumentation.QueryMetrics.snapshot)."""
+    return metrics.snapshot()
+
 
 class DatabaseConnection:
-    def __init__(self, db_name="healthcare.db"):
+    def __init__(self, db_name="healthcare.db", reader=False):
+        """
+        :param reader: В режиме пула взять отдельное соединение потока только для чтения -
+                       для генераторов, которые делают yield внутри блока (см. ConnectionPool)
+        """
         self.db_name = db_name
+        self.reader = reader
+        self.connection = None
+        self.pool = None
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_name)
+        if _pooling_enabled:
+            # Берем долгоживущее соединение из пула, PRAGMA уже выставлены
+            self.pool = get_pool(self.db_name)
+            self.connection = self.pool.acquire(self.reader)
+            return self.connection
+
+        self.connection = sqlite3.connect(self.db_name, factory=_connection_factory())
         self.connection.row_factory = dict_factory  # возвращает строки в виде словаря
+        record_storage.register_functions(self.connection)
         self.connection.cursor().execute("PRAGMA foreign_keys = ON")
         return self.connection
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.pool is not None:
+            # В пуле соединение не закрывается, при ошибке транзакция откатывается
+            self.pool.release(self.connection, commit=exc_type is None, reader=self.reader)
+            self.pool = None
+            return
+
         if self.connection:
-            self.connection.commit()  # сохраняем изменения
+            if exc_type is None:
+                self.connection.commit()  # сохраняем изменения
+            else:
+                self.connection.rollback()  # при ошибке не оставляем половину изменений, как и в пуле
             self.connection.close()  # закрываем соединение
 
 def create_tables(db_name):
+    """
+    Приводит схему базы к актуальной версии (см. migrations).
+    Для актуальной схемы это одна проверка PRAGMA user_version.
+
+    :return: Номера примененных миграций
+    """
     with DatabaseConnection(db_name) as db:
-        cursor = db.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print("Таблицы в базе данных:", tables)
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL
-        )
-        """)
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS doctors (
-            doctor_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            speciality TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-        )
-        """)
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patients (
-            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-        )
-        """)
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medical_records (
-            patient_id INTEGER PRIMARY KEY,
-            record TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
-        )
-        """)
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS appointments (
-            appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            doctor_id INTEGER,
-            patient_id INTEGER,
-            appointment_time TEXT NOT NULL,  -- Используйте ISO 8601 строку
-            FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
-            UNIQUE(doctor_id, appointment_time)  -- Ограничение уникальности
-        )
-        """)
-
-        cursor.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_patient_id ON medical_records(patient_id)
-        """)
+        applied = migrations.migrate(db)
+    if applied:
+        print(f"Схема базы обновлена до версии {applied[-1]}")
+    return applied
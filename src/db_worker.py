@@ -0,0 +1,45 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 2
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class DatabaseWorker:
+    """
+    Фоновые потоки для обращений к базе данных.
+
+    Методы репозиториев выполняются вне потока интерфейса и возвращают Future.
+    В режиме пула (database.enable_pooling) у каждого потока свое долгоживущее соединение.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+
+    def submit(self, func, *args, **kwargs):
+        """Ставит вызов func(*args, **kwargs) в очередь и возвращает concurrent.futures.Future."""
+        return self._executor.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def get_worker() -> DatabaseWorker:
+    """Общий для приложения DatabaseWorker, создается при первом обращении."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = DatabaseWorker()
+    return _worker
+
+
+def shutdown_worker(wait=True):
+    """Останавливает общий DatabaseWorker (например, при выходе из приложения)."""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.shutdown(wait=wait)
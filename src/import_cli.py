@@ -0,0 +1,50 @@
+"""
+Массовый импорт пациентов и докторов без запуска интерфейса.
+
+Примеры:
+    python import_cli.py patients patients.csv
+    python import_cli.py doctors doctors.jsonl --db healthcare.db --chunk-size 5000
+
+CSV должен содержать заголовок username,password,name (для докторов еще speciality),
+JSONL - по одному объекту с теми же ключами на строку.
+"""
+import argparse
+import sys
+import time
+
+from database import create_tables, enable_pooling, close_pools
+from repositories import BULK_CHUNK_SIZE, DoctorRepository, PatientRepository
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовый импорт пациентов и докторов")
+    parser.add_argument("kind", choices=("patients", "doctors"), help="Что импортировать")
+    parser.add_argument("path", help="CSV или JSONL файл")
+    parser.add_argument("--db", default="healthcare.db", help="Файл базы данных")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="Строк в одной транзакции")
+    args = parser.parse_args(argv)
+
+    enable_pooling()
+    try:
+        create_tables(args.db)
+        started = time.perf_counter()
+        if args.kind == "patients":
+            result = PatientRepository(args.db).add_patients_bulk(args.path, args.chunk_size)
+        else:
+            result = DoctorRepository(args.db).add_doctors_bulk(args.path, args.chunk_size)
+        elapsed = time.perf_counter() - started
+    finally:
+        close_pools()
+
+    if result is None:
+        print("Импорт прерван из-за ошибки базы данных.")
+        return 1
+
+    for row_number, username, reason in result.errors:
+        print(f"Строка {row_number} ({username}): {reason}")
+    print(f"Добавлено: {result.inserted}, пропущено: {len(result.errors)}, время: {elapsed:.2f} с")
+    return 0 if not result.errors else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
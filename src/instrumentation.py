@@ -0,0 +1,169 @@
+import bisect
+import collections
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+slow_query_logger = logging.getLogger("database.slow_queries")
+
+# Верхние границы корзин гистограммы задержек в миллисекундах, последняя корзина - все, что больше
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 200
+
+
+def redact_params(params):
+    """Заменяет значения параметров запроса их типами, чтобы в журнал не попадали персональные данные."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: f"<{type(value).__name__}>" for key, value in params.items()}
+    return [f"<{type(value).__name__}>" for value in params]
+
+
+def count_rows(result):
+    """Сколько строк вернул метод репозитория: длина списка, 1 для одной строки, 0 для None."""
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+class _MethodStats:
+    __slots__ = ("calls", "errors", "rows", "total_ms", "max_ms", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def as_dict(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return dict(calls=self.calls,
+                    errors=self.errors,
+                    rows=self.rows,
+                    total_ms=self.total_ms,
+                    mean_ms=self.total_ms / self.calls if self.calls else 0.0,
+                    max_ms=self.max_ms,
+                    histogram=dict(zip(labels, self.histogram)))
+
+
+class QueryMetrics:
+    """
+    Статистика обращений к базе данных.
+
+    Для каждого метода репозитория (по __qualname__, например 'PatientRepository.get_patient')
+    считаются вызовы, ошибки, возвращенные строки и гистограмма задержек. Отдельные SQL-запросы
+    дольше slow_query_threshold_ms попадают в журнал медленных запросов с замаскированными параметрами.
+    Пока enabled выключен, декоратор handle_db_errors и соединения ничего не замеряют.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_threshold_ms = DEFAULT_SLOW_QUERY_THRESHOLD_MS
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._statements = 0
+        self._statements_ms = 0.0
+        self._slow_queries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record_call(self, name, elapsed_ms, rows=0, failed=False):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+        with self._lock:
+            stats = self._methods.get(name)
+            if stats is None:
+                stats = self._methods[name] = _MethodStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.rows += rows
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.histogram[bucket] += 1
+
+    def record_statement(self, sql, params, elapsed_ms, many=False):
+        """
+        Учитывает один SQL-запрос. Для executemany (many=True) в params передается число строк.
+        """
+        with self._lock:
+            self._statements += 1
+            self._statements_ms += elapsed_ms
+        if elapsed_ms < self.slow_query_threshold_ms:
+            return
+
+        entry = dict(at=datetime.datetime.now().isoformat(timespec="milliseconds"),
+                     elapsed_ms=elapsed_ms,
+                     sql=" ".join(sql.split()),
+                     params=f"<{params} rows>" if many else redact_params(params))
+        with self._lock:
+            self._slow_queries.append(entry)
+        slow_query_logger.warning("Slow query (%.1f ms): %s params=%s",
+                                  elapsed_ms, entry['sql'], entry['params'])
+
+    def snapshot(self) -> dict:
+        """Копия текущей статистики для панели администратора или тестов."""
+        with self._lock:
+            return dict(enabled=self.enabled,
+                        slow_query_threshold_ms=self.slow_query_threshold_ms,
+                        methods={name: stats.as_dict() for name, stats in sorted(self._methods.items())},
+                        statements=dict(count=self._statements, total_ms=self._statements_ms),
+                        slow_queries=list(self._slow_queries))
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._statements = 0
+            self._statements_ms = 0.0
+            self._slow_queries.clear()
+
+
+metrics = QueryMetrics()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время каждого execute/executemany."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_statement(sql, parameters, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, sql, seq_of_parameters):
+        count = 0
+
+        def counted():
+            nonlocal count
+            for parameters in seq_of_parameters:
+                count += 1
+                yield parameters
+
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, counted())
+        finally:
+            metrics.record_statement(sql, count, (time.perf_counter() - started) * 1000, many=True)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Соединение, курсоры которого замеряют запросы. Используется только при включенной
+    статистике, поэтому в обычном режиме накладных расходов нет.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute создает обычный курсор в обход cursor(), поэтому без этих
+    # методов не замерялись бы BEGIN IMMEDIATE, PRAGMA и миграции, выполняемые через conn.execute
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
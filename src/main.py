@@ -1,15 +1,18 @@
-from database import create_tables
+import argparse
+
+from database import create_tables, enable_pooling, close_pools
+from db_worker import shutdown_worker
 from repositories import *
-from ui.main_ui import MainApp
 
-if __name__ == "__main__":
-    create_tables("healthcare.db")
+DB_NAME = "healthcare.db"
+
+
+def seed_test_users(db_name):
+    """Добавляет тестовых пользователей, если их еще нет."""
+    user_repository = UserRepository(db_name)
+    patient_repository = PatientRepository(db_name)
+    doctor_repository = DoctorRepository(db_name)
 
-    user_repository = UserRepository("healthcare.db")
-    patient_repository = PatientRepository("healthcare.db")
-    doctor_repository = DoctorRepository("healthcare.db")
-    
-    # Добавим тестовых пользователей
     if not user_repository.find_by_username("admin"):
         user_repository.add_user("admin", "admin_password", Role.ADMIN)
 
@@ -19,6 +22,13 @@ if __name__ == "__main__":
     if not user_repository.find_by_username("patient"):
         patient_repository.add_patient("patient", "patient_password", "Бебр228")
 
+
+def dump_database(db_name):
+    """Печатает пользователей, пациентов и врачей для отладки."""
+    user_repository = UserRepository(db_name)
+    patient_repository = PatientRepository(db_name)
+    doctor_repository = DoctorRepository(db_name)
+
     print("Юзеры:")
     for i in user_repository.get_all_users():
         print(i)
@@ -37,5 +47,38 @@ if __name__ == "__main__":
     for i in doctor_repository.get_all_doctors():
         print(i)
 
-    app = MainApp()
-    app.mainloop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Медицинская информационная система")
+    parser.add_argument("--seed", action="store_true",
+                        help="Добавить тестовых пользователей (новая база заполняется автоматически)")
+    parser.add_argument("--dump", action="store_true", help="Вывести содержимое базы перед запуском")
+    parser.add_argument("--gc-attachments", action="store_true",
+                        help="Удалить файлы вложений, на которые не осталось ссылок (например, после удаления пациентов)")
+    parser.add_argument("--server", metavar="URL",
+                        help="Работать через сервис (python service.py), например http://127.0.0.1:8765")
+    args = parser.parse_args()
+
+    if not args.server:
+        # Долгоживущие соединения вместо открытия нового на каждый запрос
+        enable_pooling()
+        # Для актуальной схемы - только проверка PRAGMA user_version
+        applied_migrations = create_tables(DB_NAME)
+
+        # Тестовые пользователи нужны только в только что созданной базе
+        if args.seed or 1 in applied_migrations:
+            seed_test_users(DB_NAME)
+        if args.dump:
+            dump_database(DB_NAME)
+        if args.gc_attachments:
+            print(f"Сборка мусора вложений: {AttachmentRepository(DB_NAME).collect_garbage(sweep=True)}")
+
+    # Интерфейс импортируется только при запуске приложения: данные и сид доступны без tkinter
+    from ui.main_ui import MainApp
+
+    app = MainApp(DB_NAME, service_url=args.server)
+    try:
+        app.mainloop()
+    finally:
+        shutdown_worker()
+        close_pools()
@@ -0,0 +1,300 @@
+"""
+Версионирование схемы базы данных.
+
+Номер версии схемы хранится в PRAGMA user_version. Каждая миграция - функция,
+получающая курсор и переводящая схему с версии N-1 на N. При запуске
+применяются только миграции с номером больше текущей версии, поэтому для
+актуальной базы вся проверка - одно чтение user_version.
+
+Миграция 1 - схема в том виде, в каком ее создавали версии приложения без
+user_version. Новые таблицы, колонки и индексы добавляются новой миграцией
+с очередным номером; уже выпущенные миграции не изменяются.
+"""
+MIGRATIONS = {}
+
+
+def migration(version, description):
+    """Регистрирует функцию миграции схемы на версию version."""
+    def decorator(func):
+        if version in MIGRATIONS:
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        func.description = description
+        MIGRATIONS[version] = func
+        return func
+    return decorator
+
+
+def latest_version():
+    return max(MIGRATIONS, default=0)
+
+
+def get_version(conn) -> int:
+    cursor = conn.cursor()
+    cursor.row_factory = None  # у соединений приложения строки - словари
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn) -> list[int]:
+    """
+    Применяет недостающие миграции. Каждая миграция выполняется в своей транзакции
+    вместе с записью нового user_version, поэтому прерванная миграция не оставляет
+    схему в промежуточном состоянии.
+
+    :param conn: Соединение sqlite3
+    :return: Номера примененных миграций (пустой список, если схема актуальна)
+    """
+    target = latest_version()
+    if get_version(conn) >= target:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    applied = []
+    for version in sorted(MIGRATIONS):
+        # BEGIN IMMEDIATE не дает двум процессам применять одну миграцию одновременно,
+        # а версия перечитывается уже под блокировкой
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            MIGRATIONS[version](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+@migration(1, "Исходная схема")
+def _initial_schema(cursor):
+    # IF NOT EXISTS: базы, созданные до появления версий, имеют user_version = 0,
+    # но уже содержат эти таблицы
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctors (
+        doctor_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        speciality TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS patients (
+        patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS medical_records (
+        patient_id INTEGER PRIMARY KEY,
+        record TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS appointments (
+        appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER,
+        patient_id INTEGER,
+        appointment_time TEXT NOT NULL,  -- Используйте ISO 8601 строку
+        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+        UNIQUE(doctor_id, appointment_time)  -- Ограничение уникальности
+    )
+    """)
+
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_patient_id ON medical_records(patient_id)
+    """)
+
+
+@migration(2, "Индекс записей врача по времени")
+def _doctor_time_index(cursor):
+    # Явный индекс под поиск занятых слотов врача по диапазону времени
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_appointments_doctor_time ON appointments(doctor_id, appointment_time)
+    """)
+
+
+@migration(3, "Рабочие часы врачей")
+def _doctor_schedules(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctor_schedules (
+        doctor_id INTEGER PRIMARY KEY,
+        start_time TEXT NOT NULL,  -- HH:MM
+        end_time TEXT NOT NULL,  -- HH:MM, последний слот начинается в это время
+        slot_minutes INTEGER NOT NULL,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE
+    )
+    """)
+
+
+@migration(4, "Полнотекстовый поиск по медицинским картам")
+def _records_fts(cursor):
+    # Индекс с внешним содержимым (rowid = patient_id): FTS5 хранит только термы, а текст
+    # читает из представления medical_record_texts. Триггеры передают индексу старый и новый
+    # текст из того же представления, поэтому индекс совпадает с картами при любой записи
+    # в medical_records, включая каскадное удаление пациента. Если способ хранения текста
+    # изменится, меняется только представление.
+    # Индекс строится по medical_records заново, поэтому и в базе без версии он соответствует картам
+    for trigger in ("medical_records_fts_insert", "medical_records_fts_update", "medical_records_fts_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS medical_records_fts")
+    cursor.execute("""
+    CREATE VIEW medical_record_texts AS SELECT patient_id, record FROM medical_records
+    """)
+    cursor.execute("""
+    CREATE VIRTUAL TABLE medical_records_fts USING fts5(
+        record,
+        content = 'medical_record_texts',
+        content_rowid = 'patient_id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+
+    # Старый текст берется в BEFORE-триггерах, пока строка еще не изменена
+    cursor.execute("""
+    CREATE TRIGGER medical_records_fts_delete BEFORE DELETE ON medical_records BEGIN
+        INSERT INTO medical_records_fts (medical_records_fts, rowid, record)
+        SELECT 'delete', patient_id, record FROM medical_record_texts WHERE patient_id = old.patient_id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER medical_records_fts_update_old BEFORE UPDATE ON medical_records BEGIN
+        INSERT INTO medical_records_fts (medical_records_fts, rowid, record)
+        SELECT 'delete', patient_id, record FROM medical_record_texts WHERE patient_id = old.patient_id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER medical_records_fts_update_new AFTER UPDATE ON medical_records BEGIN
+        INSERT INTO medical_records_fts (rowid, record)
+        SELECT patient_id, record FROM medical_record_texts WHERE patient_id = new.patient_id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER medical_records_fts_insert AFTER INSERT ON medical_records BEGIN
+        INSERT INTO medical_records_fts (rowid, record)
+        SELECT patient_id, record FROM medical_record_texts WHERE patient_id = new.patient_id;
+    END
+    """)
+    cursor.execute("INSERT INTO medical_records_fts (medical_records_fts) VALUES ('rebuild')")
+
+
+@migration(5, "История медицинских карт")
+def _record_revisions(cursor):
+    # Периодические снимки карты и сжатые дельты между ними (см. record_history)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS medical_record_revisions (
+        revision_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,  -- номер версии карты пациента, начиная с 1
+        base_revision INTEGER NOT NULL,  -- версия-снимок, от которой идет цепочка дельт
+        kind TEXT NOT NULL,  -- 'snapshot' или 'delta'
+        payload BLOB NOT NULL,  -- сжатый zlib текст или дельта
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+        UNIQUE(patient_id, revision)
+    )
+    """)
+
+
+@migration(6, "Индексы по внешним ключам")
+def _foreign_key_indexes(cursor):
+    # Каскадное удаление пользователя ищет дочерние строки по user_id и patient_id,
+    # вход в систему соединяет users с doctors и patients по user_id
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_user_id ON patients(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctors_user_id ON doctors(user_id)")
+    # Покрывает и каскад от patients, и записи пациента по времени
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_appointments_patient_time ON appointments(patient_id, appointment_time)
+    """)
+    # Поиск врачей и ближайших слотов по специальности
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctors_speciality ON doctors(speciality)")
+
+
+@migration(7, "Счетчик изменений медицинских карт")
+def _record_change_counter(cursor):
+    # Растет при каждом изменении и удалении карты любым соединением. Кэш карт (cache.RecordCache)
+    # сверяет его со значением после своих записей и так отличает чужие изменения от своих.
+    # Вставка не учитывается: карты, которой нет в базе, нет и в кэше
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS record_change_counter (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        value INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO record_change_counter (id, value) VALUES (1, 0)")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS medical_records_count_update AFTER UPDATE ON medical_records BEGIN
+        UPDATE record_change_counter SET value = value + 1 WHERE id = 1;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS medical_records_count_delete AFTER DELETE ON medical_records BEGIN
+        UPDATE record_change_counter SET value = value + 1 WHERE id = 1;
+    END
+    """)
+
+
+@migration(8, "Сжатое хранение длинных медицинских карт")
+def _compressed_records(cursor):
+    # Длинные карты хранятся сжатыми в record_blob, а record = NULL (см. record_storage)
+    cursor.execute("ALTER TABLE medical_records ADD COLUMN record_blob BLOB")
+    cursor.execute("ALTER TABLE medical_records ADD COLUMN record_encoding TEXT")
+    cursor.execute("ALTER TABLE medical_records ADD COLUMN record_size INTEGER")  # байт текста в UTF-8
+    cursor.execute("UPDATE medical_records SET record_size = length(CAST(record AS BLOB))")
+    # Полнотекстовый индекс и его триггеры читают текст через это представление;
+    # record_text распаковывает сжатую карту (record_storage.register_functions)
+    cursor.execute("DROP VIEW medical_record_texts")
+    cursor.execute("""
+    CREATE VIEW medical_record_texts AS
+    SELECT patient_id, record_text(record, record_blob, record_encoding) AS record FROM medical_records
+    """)
+
+
+@migration(9, "Вложения пациентов")
+def _attachments(cursor):
+    # Один файл хранилища (см. attachments) на каждое уникальное содержимое
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS attachment_blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+    # Вложение пациента - ссылка на содержимое; при удалении пациента удаляется каскадом,
+    # а файл без ссылок удаляет сборщик мусора (AttachmentRepository.collect_garbage)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS attachments (
+        attachment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        content_type TEXT,
+        size INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+        FOREIGN KEY (sha256) REFERENCES attachment_blobs(sha256)
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attachments_patient ON attachments(patient_id, created_at)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments(sha256)")
@@ -0,0 +1,95 @@
+"""
+Хранение паролей в виде солёного PBKDF2-SHA256.
+
+Формат хранимой строки: pbkdf2_sha256$<итерации>$<соль base64>$<хэш base64>.
+Пароли, сохраненные до появления хэширования, лежат в базе открытым текстом;
+verify_password их принимает, а needs_rehash сообщает, что их пора заменить хэшем.
+"""
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+ALGORITHM = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = 600_000
+# Хэш с большим числом итераций не проверяется: строка из ввода или импорта
+# с огромным числом итераций иначе подвешивала бы каждый вход в эту учетную запись
+MAX_PBKDF2_ITERATIONS = PBKDF2_ITERATIONS * 4
+SALT_BYTES = 16
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _derive(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def _looks_hashed(stored) -> bool:
+    return isinstance(stored, str) and stored.startswith(ALGORITHM + "$")
+
+
+def _iterations(stored) -> int | None:
+    """Число итераций хэша или None, если строка не в формате hash_password или число вне допустимого."""
+    if not _looks_hashed(stored) or stored.count("$") != 3:
+        return None
+    value = stored.split("$")[1]
+    if not (value.isascii() and value.isdigit()) or len(value) > 10:
+        return None
+    iterations = int(value)
+    return iterations if 1 <= iterations <= MAX_PBKDF2_ITERATIONS else None
+
+
+def is_hashed(stored: str) -> bool:
+    return _iterations(stored) is not None
+
+
+def hash_password(password: str, iterations: int = PBKDF2_ITERATIONS) -> str:
+    """Хэширует пароль со случайной солью. Занимает сотни миллисекунд - не вызывать в потоке Tk."""
+    salt = os.urandom(SALT_BYTES)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(_derive(password, salt, iterations))}"
+
+
+def ensure_hashed(password: str) -> str:
+    """Хэширует пароль, если он еще не в формате hash_password (например, при импорте готовых хэшей)."""
+    return password if is_hashed(password) else hash_password(password)
+
+
+def hash_many(passwords, max_workers=None) -> list[str]:
+    """
+    Хэширует пароли параллельно. hashlib.pbkdf2_hmac отпускает GIL,
+    поэтому потоки действительно занимают несколько ядер.
+    """
+    passwords = list(passwords)
+    if len(passwords) <= 1:
+        return [ensure_hashed(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(ensure_hashed, passwords))
+
+
+def verify_password(password: str, stored: str | None) -> bool:
+    """
+    Проверяет пароль против хранимого значения за время, не зависящее от места несовпадения.
+    """
+    if stored is None or password is None:
+        return False
+    if not _looks_hashed(stored):
+        # Пароль из базы до перехода на хэши
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    iterations = _iterations(stored)
+    if iterations is None:
+        return False
+    _, _, salt, expected = stored.split("$")
+    try:
+        derived = _derive(password, base64.b64decode(salt), iterations)
+        return hmac.compare_digest(derived, base64.b64decode(expected))
+    except ValueError:
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    """True для открытого текста, хэшей с числом итераций меньше текущего и испорченных хэшей."""
+    iterations = _iterations(stored)
+    return iterations is None or iterations < PBKDF2_ITERATIONS
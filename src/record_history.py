@@ -0,0 +1,105 @@
+import difflib
+import json
+import zlib
+
+# Через сколько дельт подряд сохраняется полный снимок карты,
+# чтобы восстановление любой версии применяло ограниченное число дельт
+SNAPSHOT_INTERVAL = 20
+# Сравнение строк (SequenceMatcher) в худшем случае квадратично, поэтому запускается только
+# для измененной части не длиннее стольких строк; версия с большей правкой сохраняется снимком
+MAX_DIFF_LINES = 2000
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def encode_snapshot(text: str) -> bytes:
+    """Сжатый полный текст карты."""
+    return zlib.compress(text.encode("utf-8"))
+
+
+def decode_snapshot(payload: bytes) -> str:
+    return zlib.decompress(payload).decode("utf-8")
+
+
+def make_delta(old: str, new: str) -> bytes | None:
+    """
+    Сжатая построчная разница между двумя версиями карты.
+
+    Дельта - список операций: ["c", i1, i2] копирует строки old[i1:i2],
+    ["i", текст] вставляет новый текст. Поэтому размер дельты зависит от объема
+    правки, а не от размера всей карты.
+
+    Общие начало и конец версий отбрасываются до сравнения, так что дописывание
+    в конец большой карты сравнивается быстро. None, если измененная часть
+    длиннее MAX_DIFF_LINES строк.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old_lines) - suffix, len(new_lines) - suffix
+    if max(old_end, new_end) - prefix > MAX_DIFF_LINES:
+        return None
+
+    operations = [["c", 0, prefix]] if prefix else []
+    matcher = difflib.SequenceMatcher(None, old_lines[prefix:old_end], new_lines[prefix:new_end], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operations.append(["c", prefix + i1, prefix + i2])
+        elif j2 > j1:  # replace и insert
+            operations.append(["i", "".join(new_lines[prefix + j1:prefix + j2])])
+        # delete: строки просто не копируются
+    if suffix:
+        operations.append(["c", old_end, len(old_lines)])
+    return zlib.compress(json.dumps(operations, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def apply_delta(old: str, payload: bytes) -> str:
+    """Восстанавливает новую версию карты по предыдущей и дельте из make_delta."""
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(zlib.decompress(payload).decode("utf-8")):
+        if operation[0] == "c":
+            parts.extend(old_lines[operation[1]:operation[2]])
+        else:
+            parts.append(operation[1])
+    return "".join(parts)
+
+
+def encode_revision(previous: str | None, new: str, deltas_since_snapshot: int) -> tuple[str, bytes]:
+    """
+    Выбирает, как сохранить новую версию: снимком или дельтой от предыдущей.
+
+    Снимок сохраняется для первой версии, после SNAPSHOT_INTERVAL дельт подряд,
+    при слишком большой правке (см. make_delta) и когда дельта получилась
+    не меньше снимка (карту переписали целиком).
+
+    :return: (вид записи, сжатые данные)
+    """
+    snapshot = encode_snapshot(new)
+    if previous is None or deltas_since_snapshot >= SNAPSHOT_INTERVAL:
+        return SNAPSHOT, snapshot
+    delta = make_delta(previous, new)
+    if delta is None or len(delta) >= len(snapshot):
+        return SNAPSHOT, snapshot
+    return DELTA, delta
+
+
+def rebuild(rows) -> str:
+    """
+    Восстанавливает текст по цепочке записей истории: первая запись - снимок,
+    остальные - дельты, по возрастанию номера версии.
+    """
+    text = None
+    for row in rows:
+        if row['kind'] == SNAPSHOT:
+            text = decode_snapshot(row['payload'])
+        else:
+            text = apply_delta(text, row['payload'])
+    return text
@@ -0,0 +1,100 @@
+"""
+Фрагменты текста медицинских карт для результатов полнотекстового поиска.
+
+Индекс medical_records_fts не хранит текст карт (см. migrations), а длинные карты
+хранятся сжатыми, поэтому фрагмент строится здесь по тексту, который читается
+порциями (record_storage.iter_text): выбирается окно слов, начинающееся чуть раньше
+первого найденного слова, найденные слова выделяются «», обрезанные края - «…».
+Текст читается только до конца окна, так что длинная карта не распаковывается целиком.
+"""
+import collections
+import re
+import unicodedata
+
+SNIPPET_WORDS = 12
+# Сколько слов перед первым найденным показывать для контекста
+SNIPPET_CONTEXT_WORDS = 2
+# Дальше этого числа символов найденное слово не ищется, и фрагментом становится начало карты
+SNIPPET_SCAN_CHARS = 256 * 1024
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_word(word: str) -> str:
+    """Слово без регистра и диакритики - так его сравнивает токенизатор unicode61 remove_diacritics 2."""
+    decomposed = unicodedata.normalize("NFKD", word.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def query_prefixes(query: str) -> list[str]:
+    """Слова запроса в виде префиксов, как их ищет PatientRepository.search_records."""
+    return [normalize_word(word) for word in _WORD_RE.findall(query)]
+
+
+def _iter_words(chunks):
+    """Пары (текст перед словом, слово) из порций текста; слово на границе порций не разрывается."""
+    tail = ""
+    for chunk in chunks:
+        text = tail + chunk
+        position = 0
+        for match in _WORD_RE.finditer(text):
+            if match.end() == len(text):
+                break  # слово может продолжиться в следующей порции
+            yield text[position:match.start()], match.group()
+            position = match.end()
+        tail = text[position:]
+    position = 0
+    for match in _WORD_RE.finditer(tail):
+        yield tail[position:match.start()], match.group()
+        position = match.end()
+
+
+def snippet(chunks, prefixes, words=SNIPPET_WORDS, scan_chars=SNIPPET_SCAN_CHARS) -> str:
+    """
+    Фрагмент из words слов вокруг первого слова, начинающегося с одного из prefixes.
+
+    :param chunks: Текст карты строкой или порциями (record_storage.iter_text)
+    :param prefixes: Префиксы из query_prefixes
+    """
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    head = []  # первые слова карты - фрагмент, если найденное слово не встретилось
+    before = collections.deque(maxlen=SNIPPET_CONTEXT_WORDS)
+    window = None
+    skipped = more = False
+    count = scanned = 0
+    for gap, word in _iter_words(chunks):
+        found = any(normalize_word(word).startswith(prefix) for prefix in prefixes)
+        if window is None:
+            if found:
+                skipped = count > len(before)
+                window = list(before)
+            else:
+                if len(head) < words:
+                    head.append((gap, word, False))
+                before.append((gap, word, False))
+                count += 1
+                scanned += len(gap) + len(word)
+                if scanned > scan_chars:
+                    more = True
+                    break
+                continue
+        elif len(window) >= words:
+            more = True
+            break
+        window.append((gap, word, found))
+    if window is None:
+        # Совпадение нашел только токенизатор FTS5 или оно дальше scan_chars - показываем начало карты
+        window, skipped = head, False
+        more = more or count > len(head)
+        if not window:
+            return ""
+
+    parts = ["…"] if skipped else []
+    for index, (gap, word, found) in enumerate(window):
+        if index:
+            parts.append(gap)
+        parts.append(f"«{word}»" if found else word)
+    if more:
+        parts.append("…")
+    return " ".join("".join(parts).split())
@@ -0,0 +1,97 @@
+"""
+Хранение текущего текста медицинской карты в таблице medical_records.
+
+Карта короче COMPRESS_THRESHOLD байт (в UTF-8) хранится как есть в колонке record.
+Более длинная карта сжимается zlib и хранится в record_blob, а record = NULL;
+в record_encoding записывается способ сжатия, в record_size - размер текста в байтах.
+Полнотекстовый индекс читает текст карт через представление medical_record_texts
+и SQL-функцию record_text (register_functions, см. migrations).
+
+Длинную карту можно читать порциями через sqlite3.Connection.blobopen (iter_text),
+не загружая в память ни сжатые данные, ни весь текст сразу.
+"""
+import codecs
+import zlib
+
+COMPRESS_THRESHOLD = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+ZLIB = "zlib"
+# Сжатие сохраняется, только если экономит хотя бы десятую часть
+MIN_COMPRESSION_RATIO = 0.9
+
+
+def encode_record(text: str) -> tuple:
+    """
+    Выбирает способ хранения текста карты.
+
+    :return: (record, record_blob, record_encoding, record_size) для записи в medical_records
+    """
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data) * MIN_COMPRESSION_RATIO:
+            return None, compressed, ZLIB, len(data)
+    return text, None, None, len(data)
+
+
+def decode_record(row) -> str | None:
+    """Текст карты из строки с колонками record, record_blob, record_encoding."""
+    if row['record_encoding'] == ZLIB:
+        return zlib.decompress(row['record_blob']).decode("utf-8")
+    if row['record_encoding'] is not None:
+        raise ValueError(f"Неизвестный способ хранения карты: {row['record_encoding']}")
+    return row['record']
+
+
+def register_functions(connection):
+    """
+    Регистрирует в соединении SQL-функцию record_text(record, record_blob, record_encoding) -
+    текст карты. На ней построено представление medical_record_texts, по которому триггеры
+    обновляют полнотекстовый индекс, поэтому изменять medical_records можно только
+    соединением с этой функцией (в других запрос завершится ошибкой no such function).
+    """
+    connection.create_function("record_text", 3, _record_text, deterministic=True)
+
+
+def _record_text(record, record_blob, record_encoding):
+    return decode_record(dict(record=record, record_blob=record_blob, record_encoding=record_encoding))
+
+
+def _iter_bytes(blob, encoding, chunk_size):
+    """Байты текста из открытого blob, распакованные порциями не больше chunk_size."""
+    if encoding is None:
+        while True:
+            data = blob.read(chunk_size)
+            if not data:
+                return
+            yield data
+    if encoding != ZLIB:
+        raise ValueError(f"Неизвестный способ хранения карты: {encoding}")
+
+    decompressor = zlib.decompressobj()
+    while not decompressor.eof:
+        # Ограничиваем размер распакованной порции: сжатые данные могут разворачиваться в десятки раз
+        data = decompressor.unconsumed_tail or blob.read(chunk_size)
+        if not data:
+            break
+        output = decompressor.decompress(data, chunk_size)
+        if output:
+            yield output
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_text(blob, encoding, chunk_size=READ_CHUNK_SIZE):
+    """
+    Генератор фрагментов текста карты из sqlite3.Blob (колонки record или record_blob).
+    Многобайтовые символы UTF-8 на границе порций не разрываются.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for data in _iter_bytes(blob, encoding, chunk_size):
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
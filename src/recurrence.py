@@ -0,0 +1,51 @@
+import datetime
+
+DAILY = "daily"
+WEEKLY = "weekly"
+MAX_OCCURRENCES = 104
+
+
+class RecurrenceRule:
+    """
+    Правило повторяющейся записи: первое время, частота, шаг и число повторений.
+
+    RecurrenceRule.weekly(datetime(2024, 1, 2, 10), 12) - каждый вторник в 10:00 двенадцать недель.
+    """
+    __slots__ = ("start", "count", "frequency", "interval")
+
+    def __init__(self, start: datetime.datetime, count, frequency=WEEKLY, interval=1):
+        """
+        :param start: Время первого приема
+        :param count: Сколько всего приемов, включая первый
+        :param frequency: DAILY или WEEKLY
+        :param interval: Шаг в днях или неделях (2 - через неделю)
+        """
+        if frequency not in (DAILY, WEEKLY):
+            raise ValueError(f"Неизвестная частота повторения: {frequency}")
+        self.start = start
+        self.count = int(count)
+        self.frequency = frequency
+        self.interval = int(interval)
+        if not 1 <= self.count <= MAX_OCCURRENCES:
+            raise ValueError(f"Число повторений должно быть от 1 до {MAX_OCCURRENCES}")
+        if self.interval < 1:
+            raise ValueError("Шаг повторения должен быть положительным")
+
+    @classmethod
+    def weekly(cls, start, weeks, interval=1):
+        return cls(start, weeks, WEEKLY, interval)
+
+    @classmethod
+    def daily(cls, start, days, interval=1):
+        return cls(start, days, DAILY, interval)
+
+    def step(self) -> datetime.timedelta:
+        return datetime.timedelta(days=self.interval * (7 if self.frequency == WEEKLY else 1))
+
+    def occurrences(self) -> list[datetime.datetime]:
+        """Все времена приемов по порядку."""
+        step = self.step()
+        return [self.start + step * index for index in range(self.count)]
+
+    def __repr__(self):
+        return f"RecurrenceRule({self.start}, count={self.count}, {self.frequency}, interval={self.interval})"
@@ -1,18 +1,216 @@
+import contextlib
 import datetime
-from database import DatabaseConnection, handle_db_errors
+import functools
+import itertools
+import mimetypes
+import os
+import re
+import sqlite3
+import booking
+from attachments import AttachmentStore, default_root
+from availability import DayAvailability, WorkingHours, iter_free_slots, merge_earliest_free_slots
+from bulk_import import BulkImportResult, iter_chunks, read_records
+from cache import DoctorDirectory, RecordCache
+from database import DatabaseConnection, get_pool, handle_db_errors, is_pooling_enabled
+import passwords
+import record_history
+import record_search
+import record_storage
+import rows
+from recurrence import RecurrenceRule
 from sqlite3 import IntegrityError
 from enum import Enum
 
+def _format_time(value):
+    """
+    Приводит дату/время к строке в формате, в котором appointment_time хранится в базе
+    ('YYYY-MM-DD HH:MM:SS'). Дата без времени превращается в 'YYYY-MM-DD', что при
+    строковом сравнении соответствует началу этого дня.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+def _fts_query(text):
+    """
+    Превращает пользовательский ввод в запрос FTS5: каждое слово ищется как префикс,
+    все слова должны встретиться. Кавычки защищают от синтаксиса FTS5 во вводе.
+    """
+    words = re.findall(r"\w+", text)
+    return " AND ".join(f'"{word}"*' for word in words)
+
+def _invalidates_doctor_directory(func):
+    """Сбрасывает кэш справочника врачей после метода, который меняет таблицу doctors."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.directory().invalidate()
+    return wrapper
+
 class Role(Enum):
     ADMIN = "admin"
     PATIENT = "patient"
     DOCTOR = "doctor"
 
+class Session:
+    """
+    Вошедший пользователь: роль и профиль врача или пациента.
+    Создается один раз при входе и передается окнам, чтобы они не запрашивали профиль повторно.
+    """
+    __slots__ = ("user_id", "username", "role", "doctor_id", "patient_id", "name", "speciality")
+
+    def __init__(self, user_id, username, role: Role, doctor_id=None, patient_id=None, name=None, speciality=None):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+        self.name = name
+        self.speciality = speciality
+
+    @classmethod
+    def from_row(cls, row):
+        role = Role(row['role'])
+        if role == Role.DOCTOR:
+            name = row['doctor_name']
+        elif role == Role.PATIENT:
+            name = row['patient_name']
+        else:
+            name = row['username']
+        return cls(row['user_id'], row['username'], role,
+                   doctor_id=row['doctor_id'], patient_id=row['patient_id'],
+                   name=name, speciality=row['speciality'])
+
+    def __repr__(self):
+        return f"Session(user_id={self.user_id}, username={self.username!r}, role={self.role.value})"
+
+@functools.cache
+def _dummy_password_hash():
+    """Хэш для проверки пароля несуществующего пользователя, чтобы вход длился одинаково."""
+    return passwords.hash_password("")
+
+BULK_CHUNK_SIZE = 1000
+
+def _bulk_add_users(db_name, source, role, profile_fields, profile_insert_sql, chunk_size):
+    """
+    Общая часть массового добавления пациентов и докторов.
+
+    Каждая порция из chunk_size строк вставляется в users и в таблицу профиля
+    в одной транзакции; при ошибке порция откатывается целиком. Строки с пустыми
+    полями и занятыми логинами пропускаются и попадают в отчет, не прерывая импорт.
+    Пароли хэшируются (см. passwords), уже готовые хэши сохраняются как есть.
+
+    :param source: Итерируемые словари/кортежи или путь к CSV/JSONL файлу
+    :param profile_fields: Поля профиля после username и password, например ('name',)
+    :param profile_insert_sql: INSERT в таблицу профиля, первым параметром идет user_id
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = read_records(source)
+
+    fields = ("username", "password") + profile_fields
+    result = BulkImportResult()
+    seen_usernames = set()
+
+    for chunk in iter_chunks(enumerate(source, start=1), chunk_size):
+        # Проверяем строки и убираем дубликаты логинов внутри файла
+        candidates = []
+        for row_number, row in chunk:
+            values = tuple(row.get(field) for field in fields) if isinstance(row, dict) else tuple(row)
+            if len(values) != len(fields) or not all(values):
+                result.add_error(row_number, values[0] if values else None, "не заполнены обязательные поля")
+            elif values[0] in seen_usernames:
+                result.add_error(row_number, values[0], "логин повторяется в файле")
+            else:
+                seen_usernames.add(values[0])
+                candidates.append((row_number, values))
+        if not candidates:
+            continue
+
+        # Хэшируем до открытия транзакции: это самая долгая часть импорта, и она идет в нескольких потоках
+        hashed = passwords.hash_many(values[1] for _, values in candidates)
+        candidates = [(row_number, (values[0], password) + values[2:])
+                      for (row_number, values), password in zip(candidates, hashed)]
+
+        with DatabaseConnection(db_name) as conn:
+            cursor = conn.cursor()
+            profiles = []
+            # Занятый логин определяет сама вставка: отдельный SELECT не увидел бы пользователя,
+            # добавленного другим соединением между проверкой и INSERT
+            for row_number, values in candidates:
+                cursor.execute("""
+                    INSERT INTO users (username, password, role) VALUES (?, ?, ?)
+                    ON CONFLICT(username) DO NOTHING
+                    RETURNING user_id
+                """, (values[0], values[1], role.value))
+                inserted = cursor.fetchone()
+                if inserted is None:
+                    result.add_error(row_number, values[0], "пользователь уже существует")
+                else:
+                    profiles.append((inserted['user_id'],) + values[2:])
+
+            cursor.executemany(profile_insert_sql, profiles)
+            result.inserted += len(profiles)
+
+    return result
+
 class UserRepository:
     def __init__(self, db_name='healthcare.db'):
         self.db_name = db_name
+        # Если задан, замена устаревшего хэша при входе не пишется в базу сразу, а передается
+        # ему как rehash_writer(func, *args) - так сервис отдает запись единственному писателю
+        self.rehash_writer = None
+
+    @handle_db_errors()
+    def login(self, username, password) -> Session | None:
+        """
+        Проверяет логин и пароль и возвращает сессию с ролью и профилем,
+        прочитанными одним запросом. Проверка хэша занимает сотни миллисекунд,
+        поэтому вызывать из фонового потока (run_in_background).
+        Пароль, сохраненный открытым текстом, при успешном входе заменяется хэшем.
+
+        :param username: Логин
+        :param password: Пароль
+        :return: Session или None, если логин или пароль неверны
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT u.user_id, u.username, u.password, u.role,
+                       d.doctor_id, d.name AS doctor_name, d.speciality,
+                       p.patient_id, p.name AS patient_name
+                FROM users u
+                LEFT JOIN doctors d ON d.user_id = u.user_id
+                LEFT JOIN patients p ON p.user_id = u.user_id
+                WHERE u.username = ?
+            """, (username,))
+            row = cursor.fetchone()
+
+        # Хэш проверяется уже без соединения; для неизвестного логина тоже, чтобы время не выдавало его
+        if row is None:
+            passwords.verify_password(password, _dummy_password_hash())
+            return None
+        if not passwords.verify_password(password, row['password']):
+            return None
+
+        if passwords.needs_rehash(row['password']):
+            new_hash = passwords.hash_password(password)
+            if self.rehash_writer is None:
+                self._replace_password_hash(row['user_id'], row['password'], new_hash)
+            else:
+                self.rehash_writer(self._replace_password_hash, row['user_id'], row['password'], new_hash)
+        return Session.from_row(row)
 
     @handle_db_errors()
+    def _replace_password_hash(self, user_id, old_hash, new_hash):
+        with DatabaseConnection(self.db_name) as conn:
+            # Условие на старое значение: не затираем пароль, измененный за это время
+            conn.cursor().execute("UPDATE users SET password = ? WHERE user_id = ? AND password = ?",
+                                  (new_hash, user_id, old_hash))
+
     def authenticate(self, username, password):
         """
         Возвращает роль пользователя.
@@ -21,11 +219,8 @@ class UserRepository:
         :param password: Пароль
         :return role: Роль
         """
-        with DatabaseConnection(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT role FROM users WHERE username = ? AND password = ?', (username, password))
-            result = cursor.fetchone()
-            return result['role'] if result else None
+        session = self.login(username, password)
+        return session.role.value if session else None
 
     @handle_db_errors()
     def add_user(self, username, password, role: Role):
@@ -33,6 +228,7 @@ class UserRepository:
         Может выполнять только Админ
         :param user: Новый пользователь: логин, хэш пароля и роль
         """
+        password = passwords.ensure_hashed(password)
         with DatabaseConnection(self.db_name) as conn:
             try:
                 cursor = conn.cursor()
@@ -66,38 +262,184 @@ class UserRepository:
         """
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.User)
             cursor.execute("SELECT * FROM users")
             return cursor.fetchall()
 
 class PatientRepository:
     def __init__(self, db_name='healthcare.db'):
         self.db_name = db_name
+        # Если задан, пустая карта, которую создает get_patient_record, не пишется в базу сразу,
+        # а передается ему как empty_record_writer(func, *args) - как UserRepository.rehash_writer
+        self.empty_record_writer = None
 
     @handle_db_errors()
     def get_all_patients(self):
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Patient)
             cursor.execute("SELECT patient_id, name FROM patients")
             return cursor.fetchall()
 
+    @handle_db_errors()
+    def get_patients_page(self, after_id=None, before_id=None, limit=100):
+        """
+        Одна страница пациентов по возрастанию patient_id (keyset-пагинация)
+
+        :param after_id: Вернуть пациентов с patient_id больше этого (следующая страница)
+        :param before_id: Вернуть пациентов с patient_id меньше этого (предыдущая страница)
+        :param limit: Размер страницы
+        :return: Список словарей с ключами 'patient_id', 'name'
+        :rtype: list[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Patient)
+            if before_id is not None:
+                # Берем ближайшие записи перед before_id и разворачиваем в порядок возрастания
+                cursor.execute("""
+                    SELECT patient_id, name FROM patients WHERE patient_id < ? ORDER BY patient_id DESC LIMIT ?
+                """, (before_id, limit))
+                return cursor.fetchall()[::-1]
+            cursor.execute("""
+                SELECT patient_id, name FROM patients WHERE patient_id > ? ORDER BY patient_id LIMIT ?
+            """, (after_id if after_id is not None else -1, limit))
+            return cursor.fetchall()
+
+    def record_cache(self) -> RecordCache | None:
+        """
+        Общий кэш медицинских карт этой базы (статистика - record_cache().stats()).
+        Работает только с пулом соединений: кэш обновляется после commit (ConnectionPool.after_commit).
+        """
+        if not is_pooling_enabled():
+            return None
+        return RecordCache.for_database(self.db_name)
+
+    def _checked_record_cache(self, conn) -> RecordCache | None:
+        """Кэш карт, очищенный, если карты изменил другой процесс."""
+        cache = self.record_cache()
+        if cache is not None:
+            cache.check_changes(self._record_changes(conn))
+        return cache
+
+    @staticmethod
+    def _record_changes(conn) -> int:
+        """Счетчик изменений медицинских карт (таблица record_change_counter, см. migrations)."""
+        return conn.execute("SELECT value FROM record_change_counter WHERE id = 1").fetchone()['value']
+
     @handle_db_errors()
     def get_patient_record(self, patient_id):
         with DatabaseConnection(self.db_name) as conn:
+            cache = self._checked_record_cache(conn)
+            if cache is not None:
+                record = cache.get(patient_id)
+                if record is not None:
+                    return {'record': record}
+                generation = cache.generation
+
             cursor = conn.cursor()
-            cursor.execute("SELECT record FROM medical_records WHERE patient_id = ?", (patient_id,))
+            cursor.execute("""
+                SELECT record, record_blob, record_encoding FROM medical_records WHERE patient_id = ?
+            """, (patient_id,))
             res = cursor.fetchone()
-            # Если еще не создана запись, то создается пустая
-            if res is None:
-                cursor.execute("""
-                INSERT INTO medical_records (patient_id, record)
-                VALUES (?, ?)
-                ON CONFLICT(patient_id) DO UPDATE SET record = excluded.record
-                """, (patient_id, ""))
-                return {'record': ''}
+            if res is not None:
+                record = record_storage.decode_record(res)
+                if cache is not None and record is not None:
+                    cache.put(patient_id, record, generation)
+                return {'record': record}
 
-            return res
+        # Если еще не создана запись, то создается пустая - уже после чтения, отдельной записью
+        if self.empty_record_writer is None:
+            self._create_empty_record(patient_id)
+        else:
+            self.empty_record_writer(self._create_empty_record, patient_id)
+        return {'record': ''}
+
+    @handle_db_errors()
+    def _create_empty_record(self, patient_id):
+        with DatabaseConnection(self.db_name) as conn:
+            conn.cursor().execute("""
+                INSERT INTO medical_records (patient_id, record, record_size)
+                VALUES (?, ?, 0)
+                ON CONFLICT(patient_id) DO NOTHING
+            """, (patient_id, ""))
+
+    @handle_db_errors()
+    def iter_record_chunks(self, patient_id, chunk_size=record_storage.READ_CHUNK_SIZE):
+        """
+        Генератор фрагментов текста медицинской карты, чтобы показывать длинную карту
+        по мере чтения. Данные читаются через blobopen порциями по chunk_size байт,
+        сжатая карта распаковывается по ходу чтения. Если карты нет, фрагментов нет.
+        """
+        # Отдельное соединение для чтения: блок остается открытым между yield
+        with DatabaseConnection(self.db_name, reader=True) as conn:
+            cache = self._checked_record_cache(conn)
+            record = cache.get(patient_id) if cache is not None else None
+            if record is not None:
+                for start in range(0, len(record), chunk_size):
+                    yield record[start:start + chunk_size]
+                return
+
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT record IS NOT NULL AS plain, record_blob IS NOT NULL AS compressed, record_encoding
+                FROM medical_records WHERE patient_id = ?
+            """, (patient_id,))
+            row = cursor.fetchone()
+            if row is not None:
+                yield from self._iter_stored_text(conn, patient_id, row, chunk_size)
+
+    @staticmethod
+    def _iter_stored_text(conn, patient_id, row, chunk_size=record_storage.READ_CHUNK_SIZE):
+        """
+        Текст карты из medical_records порциями через blobopen.
+
+        :param row: Колонки plain (record IS NOT NULL), compressed (record_blob IS NOT NULL), record_encoding
+        """
+        if not (row['plain'] or row['compressed']):
+            return
+        column = "record" if row['plain'] else "record_blob"
+        with conn.blobopen("medical_records", column, patient_id, readonly=True) as blob:
+            yield from record_storage.iter_text(blob, row['record_encoding'], chunk_size)
 
         
+    @handle_db_errors()
+    def search_records(self, query, limit=50):
+        """
+        Полнотекстовый поиск по медицинским картам
+
+        :param query: Слова для поиска, например "аллергия пенициллин"
+        :param limit: Максимальное число результатов
+        :return: Список словарей с ключами 'patient_id', 'name', 'snippet', 'rank',
+                 отсортированный по релевантности; найденные слова в snippet выделены «»
+        :rtype: list[dict]
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            # Фрагмент строится по тексту из medical_records, который читается порциями
+            # только до конца фрагмента: сжатая карта не распаковывается целиком
+            cursor.execute("""
+                SELECT p.patient_id, p.name, medical_records_fts.rank AS rank,
+                       m.record IS NOT NULL AS plain, m.record_blob IS NOT NULL AS compressed, m.record_encoding
+                FROM medical_records_fts
+                JOIN patients p ON p.patient_id = medical_records_fts.rowid
+                JOIN medical_records m ON m.patient_id = medical_records_fts.rowid
+                WHERE medical_records_fts MATCH ?
+                ORDER BY medical_records_fts.rank
+                LIMIT ?
+            """, (match, limit))
+            prefixes = record_search.query_prefixes(query)
+            results = []
+            for row in cursor.fetchall():
+                with contextlib.closing(self._iter_stored_text(conn, row['patient_id'], row)) as chunks:
+                    snippet = record_search.snippet(chunks, prefixes)
+                results.append(dict(patient_id=row['patient_id'], name=row['name'], snippet=snippet,
+                                    rank=row['rank']))
+            return results
+
     @handle_db_errors()
     def get_patient(self, patient_id):
         with DatabaseConnection(self.db_name) as conn:
@@ -107,6 +449,12 @@ class PatientRepository:
         
     @handle_db_errors()
     def update_patient(self, patient_id, name, username=None, password=None):
+        """
+        :param username: Новый логин; None или пустая строка - логин не меняется
+        :param password: Новый пароль; None или пустая строка - пароль не меняется
+        """
+        if password:
+            password = passwords.ensure_hashed(password)
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE patients SET name = ? WHERE patient_id = ?", (name, patient_id))
@@ -114,15 +462,25 @@ class PatientRepository:
             # Получение user_id пациента
             cursor.execute("SELECT user_id FROM patients WHERE patient_id = ?", (patient_id,))
             user_id = cursor.fetchone()
-            if user_id and username and password:
+            if user_id:
                 user_id = user_id['user_id']  # Извлечение user_id из результата запроса
-                
+
                 # Обновление имени пользователя и пароля, если они предоставлены
-                if username is not None:
+                if username:
                     cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (username, user_id))
-                if password is not None:
+                if password:
                     cursor.execute("UPDATE users SET password = ? WHERE user_id = ?", (password, user_id))
         
+    @handle_db_errors()
+    def get_patient_username(self, patient_id):
+        """Логин пациента без хэша пароля (для окна редактирования) или None, если пациента нет."""
+        with DatabaseConnection(self.db_name) as conn:
+            row = conn.execute("""
+                SELECT u.username FROM patients p JOIN users u ON u.user_id = p.user_id
+                WHERE p.patient_id = ?
+            """, (patient_id,)).fetchone()
+            return row['username'] if row else None
+
     @handle_db_errors()
     def get_patient_login_data(self, patient_id):
         with DatabaseConnection(self.db_name) as conn:
@@ -156,6 +514,10 @@ class PatientRepository:
     @handle_db_errors()
     def delete_patient(self, patient_id):
         with DatabaseConnection(self.db_name) as conn:
+            # Счетчик изменений карт до удаления должен быть прочитан в той же транзакции записи
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            changes_before = self._record_changes(conn)
             cursor = conn.cursor()
             cursor.execute("SELECT user_id FROM patients WHERE patient_id = ?", (patient_id,))
             result = cursor.fetchone()
@@ -164,13 +526,15 @@ class PatientRepository:
                 print(result)
                 # Удаляем пользователя по user_id, это также удалит пациента благодаря каскадному удалению
                 cursor.execute("DELETE FROM users WHERE user_id = ?", (result['user_id'],))
+                self._after_record_commit(conn, patient_id, None, changes_before)
             else:
                 print(f"Пациент с ID {patient_id} не найден.")
     
     @handle_db_errors()
     def add_patient(self, username, password, name):
         """Добавляет нового пациента в базу данных."""
-        with DatabaseConnection() as conn:
+        password = passwords.ensure_hashed(password)
+        with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
             # 1. Создаем пользователя
 
@@ -185,20 +549,161 @@ class PatientRepository:
             cursor.execute("""
                 INSERT INTO patients (user_id, name) VALUES (?, ?)
             """, (user_id, name))
+            return cursor.lastrowid
+
+    @handle_db_errors()
+    def add_patients_bulk(self, source, chunk_size=BULK_CHUNK_SIZE) -> BulkImportResult:
+        """
+        Массово добавляет пациентов порциями в отдельных транзакциях.
+
+        :param source: Итерируемые словари с ключами 'username', 'password', 'name'
+                       (или кортежи в этом порядке), либо путь к CSV/JSONL файлу
+        :param chunk_size: Сколько строк вставлять в одной транзакции
+        :return: Отчет с количеством добавленных строк и ошибками по строкам
+        """
+        return _bulk_add_users(self.db_name, source, Role.PATIENT, ("name",), """
+            INSERT INTO patients (user_id, name) VALUES (?, ?)
+        """, chunk_size)
 
     @handle_db_errors()
     def update_medical_record(self, patient_id, record):
-        with DatabaseConnection() as conn:
+        """
+        Сохраняет новую версию медицинской карты.
+        Текущий текст перезаписывается (длинный - в сжатом виде, см. record_storage),
+        а в историю добавляется снимок или сжатая дельта.
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            # Блокировка записи берется до чтения последней версии: иначе два параллельных
+            # сохранения получат один номер версии, и второе упадет на UNIQUE(patient_id, revision)
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            changes_before = self._record_changes(conn)
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO medical_records (patient_id, record)
-                VALUES (?, ?)
-                ON CONFLICT(patient_id) DO UPDATE SET record = excluded.record
-            """, (patient_id, record))
+                SELECT record, record_blob, record_encoding FROM medical_records WHERE patient_id = ?
+            """, (patient_id,))
+            current = cursor.fetchone()
+            previous = record_storage.decode_record(current) if current else None
+            if previous == record:
+                return
+
+            cursor.execute("""
+                SELECT revision, base_revision FROM medical_record_revisions
+                WHERE patient_id = ? ORDER BY revision DESC LIMIT 1
+            """, (patient_id,))
+            last = cursor.fetchone()
+            now = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+
+            if last is None and previous:
+                # Карта существовала до появления истории - сохраняем ее как первую версию
+                self._add_revision(cursor, patient_id, 1, None, previous, 0, now)
+                last = {'revision': 1, 'base_revision': 1}
+
+            if last is None:
+                self._add_revision(cursor, patient_id, 1, None, record, 0, now)
+            else:
+                self._add_revision(cursor, patient_id, last['revision'] + 1, previous, record,
+                                   last['revision'] - last['base_revision'], now, last['base_revision'])
+
+            stored, blob, encoding, size = record_storage.encode_record(record)
+            cursor.execute("""
+                INSERT INTO medical_records (patient_id, record, record_blob, record_encoding, record_size)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(patient_id) DO UPDATE SET
+                    record = excluded.record,
+                    record_blob = excluded.record_blob,
+                    record_encoding = excluded.record_encoding,
+                    record_size = excluded.record_size
+            """, (patient_id, stored, blob, encoding, size))
+            self._after_record_commit(conn, patient_id, record, changes_before)
+
+    def _after_record_commit(self, conn, patient_id, record, changes_before):
+        """
+        Обновляет кэш карт после изменения карты пациента: сразу убирает старый текст,
+        а после commit записывает новый (None - карта удалена). До commit другой поток
+        мог снова прочитать из базы старый текст, поэтому кэш обновляется еще раз.
+
+        :param changes_before: Счетчик изменений карт в начале этой транзакции записи
+        """
+        cache = self.record_cache()
+        if cache is None:
+            return
+        changes_after = self._record_changes(conn)
+        cache.invalidate(patient_id)
+
+        def committed():
+            cache.note_own_changes(changes_before, changes_after)
+            if record is None:
+                cache.invalidate(patient_id)
+            else:
+                cache.put(patient_id, record)
+        get_pool(self.db_name).after_commit(committed)
+
+    @staticmethod
+    def _add_revision(cursor, patient_id, revision, previous, record, deltas_since_snapshot, created_at,
+                      base_revision=None):
+        kind, payload = record_history.encode_revision(previous, record, deltas_since_snapshot)
+        if kind == record_history.SNAPSHOT:
+            base_revision = revision
+        cursor.execute("""
+            INSERT INTO medical_record_revisions (patient_id, revision, base_revision, kind, payload, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (patient_id, revision, base_revision, kind, payload, created_at))
+
+    @handle_db_errors()
+    def list_record_revisions(self, patient_id):
+        """
+        Список версий медицинской карты пациента
+
+        :return: Словари с ключами 'revision', 'kind', 'size' (байт в базе), 'created_at'
+                 от новых версий к старым
+        :rtype: list[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT revision, kind, length(payload) AS size, created_at
+                FROM medical_record_revisions WHERE patient_id = ? ORDER BY revision DESC
+            """, (patient_id,))
+            return cursor.fetchall()
+
+    @handle_db_errors()
+    def get_record_revision(self, patient_id, revision):
+        """
+        Восстанавливает версию медицинской карты: берется ближайший снимок
+        и к нему применяются дельты до нужной версии.
+
+        :return: Словарь с ключами 'revision', 'record', 'created_at' или None, если версии нет
+        :rtype: Optional[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT base_revision, created_at FROM medical_record_revisions
+                WHERE patient_id = ? AND revision = ?
+            """, (patient_id, revision))
+            target = cursor.fetchone()
+            if target is None:
+                return None
+
+            cursor.execute("""
+                SELECT kind, payload FROM medical_record_revisions
+                WHERE patient_id = ? AND revision BETWEEN ? AND ? ORDER BY revision
+            """, (patient_id, target['base_revision'], revision))
+            return dict(revision=revision,
+                        record=record_history.rebuild(cursor.fetchall()),
+                        created_at=target['created_at'])
 
 class DoctorRepository:
     def __init__(self, db_name='healthcare.db'):
         self.db_name = db_name
+
+    def directory(self) -> DoctorDirectory:
+        """
+        Кэшированный справочник врачей этой базы данных (список, индексы по id и специальности).
+        Сбрасывается автоматически при добавлении, изменении и удалении врачей.
+        """
+        return DoctorDirectory.for_database(self.db_name, DoctorRepository(self.db_name).get_all_doctors)
     
     @handle_db_errors()
     def get_all_doctors(self) -> list[dict]:
@@ -207,17 +712,43 @@ class DoctorRepository:
         """
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Doctor)
             cursor.execute("SELECT doctor_id, name, speciality FROM doctors")
             return cursor.fetchall()
         
+    @handle_db_errors()
+    def get_doctors_page(self, after_id=None, before_id=None, limit=100):
+        """
+        Одна страница докторов по возрастанию doctor_id (keyset-пагинация)
+
+        :param after_id: Вернуть докторов с doctor_id больше этого (следующая страница)
+        :param before_id: Вернуть докторов с doctor_id меньше этого (предыдущая страница)
+        :param limit: Размер страницы
+        :return: Список словарей с ключами 'doctor_id', 'name', 'speciality'
+        :rtype: list[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Doctor)
+            if before_id is not None:
+                cursor.execute("""
+                    SELECT doctor_id, name, speciality FROM doctors WHERE doctor_id < ? ORDER BY doctor_id DESC LIMIT ?
+                """, (before_id, limit))
+                return cursor.fetchall()[::-1]
+            cursor.execute("""
+                SELECT doctor_id, name, speciality FROM doctors WHERE doctor_id > ? ORDER BY doctor_id LIMIT ?
+            """, (after_id if after_id is not None else -1, limit))
+            return cursor.fetchall()
+
     @handle_db_errors()
     def get_doctor(self, doctor_id):
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT doctor_id, name, specialty FROM doctors WHERE doctor_id = ?", (doctor_id,))
+            cursor.execute("SELECT doctor_id, name, speciality FROM doctors WHERE doctor_id = ?", (doctor_id,))
             return cursor.fetchone()
         
     @handle_db_errors()
+    @_invalidates_doctor_directory
     def delete_doctor(self, doctor_id):
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
@@ -232,9 +763,11 @@ class DoctorRepository:
                 print(f"Доктор {doctor_id} не найден.")
     
     @handle_db_errors()
+    @_invalidates_doctor_directory
     def add_doctor(self, username, password, name, speciality):
         """Добавляет нового доктора в базу данных."""
-        with DatabaseConnection() as conn:
+        password = passwords.ensure_hashed(password)
+        with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
             # 1. Создаем пользователя
 
@@ -249,7 +782,33 @@ class DoctorRepository:
             cursor.execute("""
                 INSERT INTO doctors (user_id, name, speciality) VALUES (?, ?, ?)
             """, (user_id, name, speciality))
+            return cursor.lastrowid
     
+    @handle_db_errors()
+    @_invalidates_doctor_directory
+    def add_doctors_bulk(self, source, chunk_size=BULK_CHUNK_SIZE) -> BulkImportResult:
+        """
+        Массово добавляет докторов порциями в отдельных транзакциях.
+
+        :param source: Итерируемые словари с ключами 'username', 'password', 'name', 'speciality'
+                       (или кортежи в этом порядке), либо путь к CSV/JSONL файлу
+        :param chunk_size: Сколько строк вставлять в одной транзакции
+        :return: Отчет с количеством добавленных строк и ошибками по строкам
+        """
+        return _bulk_add_users(self.db_name, source, Role.DOCTOR, ("name", "speciality"), """
+            INSERT INTO doctors (user_id, name, speciality) VALUES (?, ?, ?)
+        """, chunk_size)
+
+    @handle_db_errors()
+    def get_doctor_username(self, doctor_id):
+        """Логин врача без хэша пароля (для окна редактирования) или None, если врача нет."""
+        with DatabaseConnection(self.db_name) as conn:
+            row = conn.execute("""
+                SELECT u.username FROM doctors d JOIN users u ON u.user_id = d.user_id
+                WHERE d.doctor_id = ?
+            """, (doctor_id,)).fetchone()
+            return row['username'] if row else None
+
     @handle_db_errors()
     def get_doctor_login_data(self, doctor_id):
         with DatabaseConnection(self.db_name) as conn:
@@ -264,20 +823,27 @@ class DoctorRepository:
             return cursor.fetchone()
         
     @handle_db_errors()
+    @_invalidates_doctor_directory
     def update_doctor(self, doctor_id, name, speciality, username=None, password=None):
+        """
+        :param username: Новый логин; None или пустая строка - логин не меняется
+        :param password: Новый пароль; None или пустая строка - пароль не меняется
+        """
+        if password:
+            password = passwords.ensure_hashed(password)
         with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE doctors SET name = ?, speciality = ? WHERE doctor_id = ?", (name, speciality, doctor_id))
             # Получение user_id пациента
             cursor.execute("SELECT user_id FROM doctors WHERE doctor_id = ?", (doctor_id,))
             user_id = cursor.fetchone()
-            if user_id and username and password:
+            if user_id:
                 user_id = user_id['user_id']  # Извлечение user_id из результата запроса
-                
+
                 # Обновление имени пользователя и пароля, если они предоставлены
-                if username is not None:
+                if username:
                     cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (username, user_id))
-                if password is not None:
+                if password:
                     cursor.execute("UPDATE users SET password = ? WHERE user_id = ?", (password, user_id))
     
     @handle_db_errors()
@@ -297,6 +863,33 @@ class DoctorRepository:
             cursor.execute("SELECT doctor_id, name, speciality FROM doctors WHERE user_id = ?", (user_id,))
             return cursor.fetchone()
 
+    @handle_db_errors()
+    def get_working_hours(self, doctor_id) -> WorkingHours:
+        """
+        Возвращает рабочие часы доктора.
+        Если расписание не задано, возвращаются часы по умолчанию.
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT start_time, end_time, slot_minutes FROM doctor_schedules WHERE doctor_id = ?
+            """, (doctor_id,))
+            return WorkingHours.from_row(cursor.fetchone())
+
+    @handle_db_errors()
+    def set_working_hours(self, doctor_id, hours: WorkingHours):
+        """Задает рабочие часы и длину слота доктора."""
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO doctor_schedules (doctor_id, start_time, end_time, slot_minutes)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(doctor_id) DO UPDATE SET
+                    start_time = excluded.start_time,
+                    end_time = excluded.end_time,
+                    slot_minutes = excluded.slot_minutes
+            """, (doctor_id, hours.start.strftime("%H:%M"), hours.end.strftime("%H:%M"), hours.slot_minutes))
+
 class AppointmentRepository:
     def __init__(self, db_name = "healthcare.db"):
         self.db_name = db_name
@@ -308,25 +901,280 @@ class AppointmentRepository:
             cursor.execute("""
                 INSERT INTO appointments (doctor_id, patient_id, appointment_time)
                 VALUES (?, ?, ?)
-            """, (doctor_id, patient_id, appointment_time))
+            """, (doctor_id, patient_id, _format_time(appointment_time)))
+
+    @handle_db_errors()
+    def reserve_slot(self, patient_id, doctor_id, appointment_time: datetime.datetime,
+                     alternatives=booking.DEFAULT_ALTERNATIVES,
+                     attempts=booking.RESERVATION_ATTEMPTS) -> booking.ReservationResult:
+        """
+        Атомарно занимает слот врача для пациента.
+
+        Транзакция начинается с BEGIN IMMEDIATE, поэтому блокировка записи берется до
+        проверки слота, а не посреди транзакции: занятость к ошибке блокировки не
+        приводит, а ошибка блокировки возникает только на BEGIN и безопасно повторяется.
+        После attempts неудачных попыток взять блокировку возвращается RETRY_LATER.
+
+        :param appointment_time: Начало слота (datetime)
+        :param alternatives: Сколько ближайших свободных слотов предложить, если слот занят
+        :return: ReservationResult со статусом BOOKED, SLOT_TAKEN, INVALID_SLOT или RETRY_LATER
+        """
+        result = self._in_write_transaction(attempts, self._reserve_in_transaction,
+                                            patient_id, doctor_id, appointment_time, alternatives)
+        if result is None:
+            return booking.ReservationResult(booking.ReservationStatus.RETRY_LATER, appointment_time)
+        return result
 
     @handle_db_errors()
-    def get_booked_slots_in_one_day(self, doctor_id, date: datetime.datetime):
+    def book_recurring(self, patient_id, doctor_id, rule: RecurrenceRule, all_or_nothing=False,
+                       attempts=booking.RESERVATION_ATTEMPTS) -> booking.RecurringBookingResult:
+        """
+        Записывает пациента на серию приемов по правилу повторения в одной транзакции.
+
+        Все целевые слоты проверяются одним запросом по диапазону дат серии,
+        свободные вставляются одним executemany.
+
+        :param rule: Правило повторения (recurrence.RecurrenceRule)
+        :param all_or_nothing: Если хоть один прием конфликтует, не записывать ни один
+        :return: RecurringBookingResult с записанными приемами и конфликтами
+        """
+        result = self._in_write_transaction(attempts, self._book_recurring_in_transaction,
+                                            patient_id, doctor_id, rule, all_or_nothing)
+        if result is None:
+            return booking.RecurringBookingResult(booking.ReservationStatus.RETRY_LATER)
+        return result
+
+    def _in_write_transaction(self, attempts, func, *args):
+        """
+        Выполняет func(cursor, *args) в транзакции BEGIN IMMEDIATE.
+        Если блокировку записи не удалось взять за attempts попыток, возвращает None.
+        """
+        for attempt in range(attempts):
+            if attempt:
+                booking.backoff(attempt - 1)
+            try:
+                with DatabaseConnection(self.db_name) as conn:
+                    # Внутри чужой транзакции (например, у писателя сервиса) блокировка уже взята
+                    if not conn.in_transaction:
+                        conn.execute("BEGIN IMMEDIATE")
+                    return func(conn.cursor(), *args)
+            except sqlite3.OperationalError as error:
+                if not booking.is_lock_error(error):
+                    raise
+        return None
+
+    @staticmethod
+    def _read_working_hours(cursor, doctor_id) -> WorkingHours:
+        cursor.execute("""
+            SELECT start_time, end_time, slot_minutes FROM doctor_schedules WHERE doctor_id = ?
+        """, (doctor_id,))
+        return WorkingHours.from_row(cursor.fetchone())
+
+    @staticmethod
+    def _is_slot_start(hours: WorkingHours, moment: datetime.datetime) -> bool:
+        # Время сравнивается целиком, вместе с секундами: в базу попадает _format_time(moment),
+        # и '10:00:30' рядом с '10:00:00' не остановил бы UNIQUE(doctor_id, appointment_time)
+        if moment.tzinfo is not None:
+            return False
+        index = hours.slot_index(moment)
+        return index is not None and hours.slot_time(index) == moment.time()
+
+    def _book_recurring_in_transaction(self, cursor, patient_id, doctor_id, rule, all_or_nothing):
+        occurrences = rule.occurrences()
+        hours = self._read_working_hours(cursor, doctor_id)
+        if rule.start.second or rule.start.microsecond or rule.start.tzinfo is not None:
+            # Время суток у всех приемов серии одно, поэтому не с начала слота - вся серия целиком.
+            # Иначе строки '10:00:30' прошли бы мимо проверки занятых слотов и UNIQUE
+            return booking.RecurringBookingResult(
+                booking.ReservationStatus.INVALID_SLOT,
+                conflicts=[(moment, booking.ReservationStatus.INVALID_SLOT) for moment in occurrences])
+
+        # Один запрос по диапазону всей серии вместо проверки каждого дня отдельно
+        cursor.execute("""
+            SELECT appointment_time FROM appointments
+            WHERE doctor_id = ? AND appointment_time >= ? AND appointment_time < ?
+        """, (doctor_id, _format_time(occurrences[0].date()),
+              _format_time(occurrences[-1].date() + datetime.timedelta(days=1))))
+        taken = {row['appointment_time'] for row in cursor.fetchall()}
+
+        free, conflicts = [], []
+        for moment in occurrences:
+            if not self._is_slot_start(hours, moment):
+                conflicts.append((moment, booking.ReservationStatus.INVALID_SLOT))
+            elif _format_time(moment) in taken:
+                conflicts.append((moment, booking.ReservationStatus.SLOT_TAKEN))
+            else:
+                free.append(moment)
+
+        if not free or (conflicts and all_or_nothing):
+            return booking.RecurringBookingResult(booking.ReservationStatus.SLOT_TAKEN, conflicts=conflicts)
+
+        cursor.executemany("""
+            INSERT INTO appointments (doctor_id, patient_id, appointment_time) VALUES (?, ?, ?)
+        """, [(doctor_id, patient_id, _format_time(moment)) for moment in free])
+
+        # executemany не возвращает lastrowid для каждой строки, поэтому айди читаем одним запросом
+        times = [_format_time(moment) for moment in free]
+        cursor.execute(f"""
+            SELECT appointment_id, appointment_time FROM appointments
+            WHERE doctor_id = ? AND appointment_time IN ({", ".join("?" * len(times))})
+        """, [doctor_id] + times)
+        ids = {row['appointment_time']: row['appointment_id'] for row in cursor.fetchall()}
+
+        status = booking.ReservationStatus.SLOT_TAKEN if conflicts else booking.ReservationStatus.BOOKED
+        return booking.RecurringBookingResult(status, booked=[(moment, ids[_format_time(moment)]) for moment in free],
+                                              conflicts=conflicts)
+
+    def _reserve_in_transaction(self, cursor, patient_id, doctor_id, appointment_time, alternatives):
+        hours = self._read_working_hours(cursor, doctor_id)
+        valid = self._is_slot_start(hours, appointment_time)
+
+        if valid:
+            cursor.execute("""
+                INSERT INTO appointments (doctor_id, patient_id, appointment_time) VALUES (?, ?, ?)
+                ON CONFLICT(doctor_id, appointment_time) DO NOTHING
+            """, (doctor_id, patient_id, _format_time(appointment_time)))
+            if cursor.rowcount == 1:
+                return booking.ReservationResult(booking.ReservationStatus.BOOKED, appointment_time,
+                                                 appointment_id=cursor.lastrowid)
+
+        # Слот занят или не совпадает с расписанием: ближайшие свободные слоты читаем в той же транзакции
+        end_date = appointment_time.date() + datetime.timedelta(days=booking.ALTERNATIVES_HORIZON_DAYS)
+        cursor.execute("""
+            SELECT appointment_time FROM appointments
+            WHERE doctor_id = ? AND appointment_time >= ? AND appointment_time < ?
+        """, (doctor_id, _format_time(appointment_time.date()), _format_time(end_date)))
+        booked_by_day = {}
+        for row in cursor.fetchall():
+            slot = datetime.datetime.fromisoformat(row['appointment_time'])
+            booked_by_day.setdefault(slot.date(), []).append(slot)
+        nearest = list(itertools.islice(iter_free_slots(hours, booked_by_day, appointment_time, end_date),
+                                        alternatives))
+        status = booking.ReservationStatus.SLOT_TAKEN if valid else booking.ReservationStatus.INVALID_SLOT
+        return booking.ReservationResult(status, appointment_time, alternatives=nearest)
+
+    @handle_db_errors()
+    def get_booked_slots_in_one_day(self, doctor_id, date: datetime.date):
         """
         Этот метод запрашивает занятые временные интервалы для определенного врача на определенную дату
 
         :param doctor_id: Айди доктора
         :param date: Дата, на которую надо найти занятые слоты
         :return: Возвращает все занятые слоты в формате datetime
-        :rtype: datetime.datetime
+        :rtype: list[datetime.datetime]
         """
-        with DatabaseConnection() as conn:
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
+            # Полуоткрытый интервал [date, date + 1 день) вместо DATE(appointment_time) = ?,
+            # чтобы работал индекс idx_appointments_doctor_time
             cursor.execute("""
                 SELECT appointment_time FROM appointments
-                WHERE doctor_id = ? AND DATE(appointment_time) = ?
-            """, (doctor_id, date.isoformat()))
-            booked_slots = [datetime.datetime.fromisoformat(row['appointment_time']) for row in cursor.fetchall()]  # Получаем только время HH:MM
+                WHERE doctor_id = ? AND appointment_time >= ? AND appointment_time < ?
+            """, (doctor_id, _format_time(date), _format_time(date + datetime.timedelta(days=1))))
+            booked_slots = [datetime.datetime.fromisoformat(row['appointment_time']) for row in cursor.fetchall()]
+            return booked_slots
+
+    @handle_db_errors()
+    def get_day_availability(self, doctor_id, date: datetime.date) -> DayAvailability:
+        """
+        Свободные слоты врача на день с учетом его рабочих часов и уже занятых записей
+
+        :param doctor_id: Айди доктора
+        :param date: Дата
+        :rtype: DayAvailability
+        """
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT start_time, end_time, slot_minutes FROM doctor_schedules WHERE doctor_id = ?
+            """, (doctor_id,))
+            hours = WorkingHours.from_row(cursor.fetchone())
+            booked_slots = self.get_booked_slots_in_one_day(doctor_id, date)
+            return DayAvailability(date, hours, booked_slots or ())
+
+    @handle_db_errors()
+    def find_earliest_free_slots(self, speciality, start: datetime.datetime, count=10, horizon_days=30):
+        """
+        Ближайшие свободные слоты среди всех врачей одной специальности
+
+        Занятые слоты всех подходящих врачей за horizon_days дней читаются одним запросом
+        по диапазону, после чего свободные слоты каждого врача лениво сливаются через очередь
+        с приоритетом: доступность дней строится только до тех пор, пока не набралось count слотов.
+
+        :param speciality: Специальность врача
+        :param start: Время, начиная с которого ищутся слоты
+        :param count: Сколько слотов вернуть
+        :param horizon_days: На сколько дней вперед искать
+        :return: Список словарей с ключами 'doctor_id', 'name', 'speciality', 'appointment_time'
+        :rtype: list[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT d.doctor_id, d.name, d.speciality, s.start_time, s.end_time, s.slot_minutes
+                FROM doctors d
+                LEFT JOIN doctor_schedules s ON s.doctor_id = d.doctor_id
+                WHERE d.speciality = ?
+            """, (speciality,))
+            doctors = {row['doctor_id']: row for row in cursor.fetchall()}
+            if not doctors:
+                return []
+            hours = {doctor_id: WorkingHours.from_row(doctor) for doctor_id, doctor in doctors.items()}
+
+            end_date = start.date() + datetime.timedelta(days=horizon_days)
+            cursor.execute("""
+                SELECT a.doctor_id, a.appointment_time
+                FROM doctors d
+                JOIN appointments a ON a.doctor_id = d.doctor_id
+                WHERE d.speciality = ? AND a.appointment_time >= ? AND a.appointment_time < ?
+            """, (speciality, _format_time(start.date()), _format_time(end_date)))
+            booked = {doctor_id: {} for doctor_id in doctors}
+            for row in cursor.fetchall():
+                slot = datetime.datetime.fromisoformat(row['appointment_time'])
+                booked[row['doctor_id']].setdefault(slot.date(), []).append(slot)
+
+        free_slots = {
+            doctor_id: iter_free_slots(hours[doctor_id], booked[doctor_id], start, end_date)
+            for doctor_id in doctors
+        }
+        earliest = merge_earliest_free_slots(free_slots, count)
+
+        return [dict(doctor_id=doctor_id,
+                     name=doctors[doctor_id]['name'],
+                     speciality=doctors[doctor_id]['speciality'],
+                     appointment_time=slot)
+                for slot, doctor_id in earliest]
+
+    @handle_db_errors()
+    def get_booked_slots_in_range(self, doctor_id, date_from: datetime.date, date_to: datetime.date):
+        """
+        Занятые слоты врача сразу за несколько дней одним запросом (например, для недельного вида)
+
+        :param doctor_id: Айди доктора
+        :param date_from: Первый день периода включительно
+        :param date_to: Последний день периода не включительно
+        :return: Словарь {дата: [занятые слоты в формате datetime]}, дни без записей в него не попадают
+        :rtype: dict[datetime.date, list[datetime.datetime]]
+        """
+        if isinstance(date_from, datetime.datetime):
+            date_from = date_from.date()
+        if isinstance(date_to, datetime.datetime):
+            date_to = date_to.date()
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT appointment_time FROM appointments
+                WHERE doctor_id = ? AND appointment_time >= ? AND appointment_time < ?
+                ORDER BY appointment_time
+            """, (doctor_id, _format_time(date_from), _format_time(date_to)))
+            booked_slots = {}
+            for row in cursor.fetchall():
+                slot = datetime.datetime.fromisoformat(row['appointment_time'])
+                booked_slots.setdefault(slot.date(), []).append(slot)
             return booked_slots
     
     @handle_db_errors()
@@ -338,20 +1186,266 @@ class AppointmentRepository:
         :return: Записи в формате словаря с ключами 'patient_id', 'name', 'appointment_time', где name это имя пациента
         :rtype: dict
         """
-        with DatabaseConnection() as conn:
+        with DatabaseConnection(self.db_name) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Appointment)
+            # Имена пациентов подтягиваются одним JOIN, а не отдельным запросом на каждую запись
             cursor.execute("""
-                SELECT patient_id, appointment_time FROM appointments WHERE doctor_id = ?
+                SELECT a.patient_id, p.name, a.appointment_time
+                FROM appointments a
+                JOIN patients p ON p.patient_id = a.patient_id
+                WHERE a.doctor_id = ?
             """, (doctor_id,))
+            return cursor.fetchall()
 
-            appointments = []
-            for row in cursor.fetchall():
+    @staticmethod
+    def _build_appointments_query(doctor_id, date_from=None, date_to=None, after=None,
+                                  descending=False, limit=None):
+        """Собирает запрос списка записей доктора с фильтрами по дате и keyset-пагинацией."""
+        conditions = ["a.doctor_id = ?"]
+        params = [doctor_id]
+        if date_from is not None:
+            conditions.append("a.appointment_time >= ?")
+            params.append(_format_time(date_from))
+        if date_to is not None:
+            conditions.append("a.appointment_time < ?")
+            params.append(_format_time(date_to))
+        if after is not None:
+            # appointment_time уникален в пределах доктора, поэтому его достаточно как ключа страницы
+            conditions.append("a.appointment_time < ?" if descending else "a.appointment_time > ?")
+            params.append(_format_time(after))
+
+        query = f"""
+            SELECT a.appointment_id, a.patient_id, p.name, a.appointment_time
+            FROM appointments a
+            JOIN patients p ON p.patient_id = a.patient_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY a.appointment_time {"DESC" if descending else "ASC"}
+        """
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return query, params
+
+    @handle_db_errors()
+    def list_appointments(self, doctor_id, date_from=None, date_to=None, after=None,
+                          descending=False, limit=100):
+        """
+        Возвращает одну страницу записей к доктору вместе с именами пациентов.
+
+        :param doctor_id: Айди доктора
+        :param date_from: Начало периода включительно (date, datetime или ISO-строка)
+        :param date_to: Конец периода не включительно
+        :param after: appointment_time последней записи предыдущей страницы
+        :param descending: Сортировать от новых к старым
+        :param limit: Размер страницы
+        :return: Список словарей с ключами 'appointment_id', 'patient_id', 'name', 'appointment_time'
+        :rtype: list[dict]
+        """
+        query, params = self._build_appointments_query(doctor_id, date_from, date_to, after,
+                                                       descending, limit)
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Appointment)
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    @handle_db_errors()
+    def iter_appointments(self, doctor_id, date_from=None, date_to=None, after=None,
+                          descending=False, batch_size=500):
+        """
+        Генератор записей к доктору: строки читаются порциями через fetchmany,
+        поэтому вся история никогда не загружается в память целиком.
+
+        Параметры те же, что у list_appointments.
+        """
+        query, params = self._build_appointments_query(doctor_id, date_from, date_to, after,
+                                                       descending)
+        # Отдельное соединение для чтения: блок остается открытым между yield
+        with DatabaseConnection(self.db_name, reader=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = rows.factory(rows.Appointment)
+            cursor.execute(query, params)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield from batch
+
+
+class AttachmentRepository:
+    """
+    Вложения пациентов: метаданные в таблице attachments, содержимое в AttachmentStore.
+    Одинаковые файлы хранятся один раз (attachment_blobs), файлы без ссылок
+    удаляет collect_garbage.
+    """
+
+    def __init__(self, db_name='healthcare.db', root=None):
+        """
+        :param root: Каталог хранилища файлов, по умолчанию рядом с базой (attachments.default_root)
+        """
+        self.db_name = db_name
+        self.store = AttachmentStore(root or default_root(db_name))
+
+    @handle_db_errors()
+    def add_attachment(self, patient_id, source, filename=None, content_type=None):
+        """
+        Добавляет файл пациенту.
+
+        :param source: Путь к файлу или двоичный файловый объект
+        :param filename: Имя файла для показа, по умолчанию имя исходного файла
+        :param content_type: MIME-тип, по умолчанию определяется по расширению
+        :return: attachment_id
+        """
+        if filename is None:
+            filename = os.path.basename(os.fspath(source)) if isinstance(source, (str, os.PathLike)) \
+                else os.path.basename(getattr(source, "name", "attachment"))
+        if content_type is None:
+            content_type = mimetypes.guess_type(filename)[0]
+
+        # Копирование и хэширование идут до транзакции: для больших сканов это самая долгая часть
+        sha256, size, temp_path = self.store.ingest(source)
+        now = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+        try:
+            with DatabaseConnection(self.db_name) as conn:
+                # Файл публикуется под блокировкой записи: сборщик мусора удаляет файлы тоже
+                # под ней, поэтому не удалит содержимое, на которое сейчас появится ссылка
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT name FROM patients WHERE patient_id = ?
-                """, (row['patient_id'],))
-                patient_name = cursor.fetchone()['name']
-                appointments.append(dict(patient_id=row['patient_id'],
-                                         name=patient_name,
-                                         appointment_time=row['appointment_time']))
-                
-            return appointments
+                    INSERT INTO attachment_blobs (sha256, size, created_at) VALUES (?, ?, ?)
+                    ON CONFLICT(sha256) DO NOTHING
+                """, (sha256, size, now))
+                cursor.execute("""
+                    INSERT INTO attachments (patient_id, sha256, filename, content_type, size, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (patient_id, sha256, filename, content_type, size, now))
+                attachment_id = cursor.lastrowid
+                # Публикуем последним: если вставка не удалась (например, нет такого пациента),
+                # в хранилище не остается файла без ссылок. Файл от транзакции, не прошедшей
+                # commit, здесь не удаляется - на него уже мог сослаться следующий писатель;
+                # такие файлы убирает collect_garbage(sweep=True)
+                self.store.publish(temp_path, sha256)
+                return attachment_id
+        finally:
+            # После publish временного файла уже нет
+            self.store.discard(temp_path)
+
+    @handle_db_errors()
+    def list_attachments(self, patient_id):
+        """
+        Вложения пациента от новых к старым
+
+        :return: Список словарей с ключами 'attachment_id', 'filename', 'content_type', 'size',
+                 'sha256', 'created_at'
+        :rtype: list[dict]
+        """
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT attachment_id, filename, content_type, size, sha256, created_at
+                FROM attachments WHERE patient_id = ?
+                ORDER BY created_at DESC, attachment_id DESC
+            """, (patient_id,))
+            return cursor.fetchall()
+
+    @handle_db_errors()
+    def get_attachment(self, attachment_id):
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT attachment_id, patient_id, filename, content_type, size, sha256, created_at
+                FROM attachments WHERE attachment_id = ?
+            """, (attachment_id,))
+            return cursor.fetchone()
+
+    def _sha256(self, attachment_id):
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT sha256 FROM attachments WHERE attachment_id = ?", (attachment_id,))
+            row = cursor.fetchone()
+            return row['sha256'] if row else None
+
+    @handle_db_errors()
+    def read_attachment(self, attachment_id, offset=0, length=None):
+        """
+        Байты вложения из диапазона [offset, offset + length), по умолчанию до конца файла.
+        Читается только этот диапазон (mmap), а не весь файл.
+
+        :return: bytes или None, если вложения нет
+        """
+        sha256 = self._sha256(attachment_id)
+        if sha256 is None:
+            return None
+        return self.store.read_range(sha256, offset, length)
+
+    @handle_db_errors()
+    def iter_attachment(self, attachment_id, offset=0, length=None, chunk_size=1024 * 1024):
+        """Генератор байт вложения порциями по chunk_size, параметры как у read_attachment."""
+        sha256 = self._sha256(attachment_id)
+        if sha256 is not None:
+            yield from self.store.iter_range(sha256, offset, length, chunk_size)
+
+    @handle_db_errors()
+    def export_attachment(self, attachment_id, destination):
+        """
+        Сохраняет копию вложения в файл destination.
+
+        :return: Записанные байты или None, если вложения нет
+        """
+        sha256 = self._sha256(attachment_id)
+        if sha256 is None:
+            return None
+        written = 0
+        with open(destination, "wb") as out:
+            for chunk in self.store.iter_range(sha256):
+                out.write(chunk)
+                written += len(chunk)
+        return written
+
+    @handle_db_errors()
+    def delete_attachment(self, attachment_id):
+        """Удаляет вложение. Файл удалит collect_garbage, если на него больше нет ссылок."""
+        with DatabaseConnection(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM attachments WHERE attachment_id = ?", (attachment_id,))
+            return cursor.rowcount > 0
+
+    @handle_db_errors()
+    def collect_garbage(self, sweep=False):
+        """
+        Удаляет содержимое, на которое не осталось вложений: после delete_attachment
+        и после каскадного удаления вложений вместе с пациентом (delete_patient).
+
+        :param sweep: Дополнительно обойти каталог хранилища и удалить файлы, которых нет
+                      в attachment_blobs (остались от прерванных записей), и старые временные файлы
+        :return: Словарь с ключами 'blobs', 'bytes' (освобождено), 'stray_files', 'temp_files'
+        :rtype: dict
+        """
+        stats = dict(blobs=0, bytes=0, stray_files=0, temp_files=0)
+        with DatabaseConnection(self.db_name) as conn:
+            # Файлы удаляются под блокировкой записи, см. add_attachment
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT b.sha256 FROM attachment_blobs b
+                WHERE NOT EXISTS (SELECT 1 FROM attachments a WHERE a.sha256 = b.sha256)
+            """)
+            orphans = [row['sha256'] for row in cursor.fetchall()]
+            cursor.executemany("DELETE FROM attachment_blobs WHERE sha256 = ?", [(sha256,) for sha256 in orphans])
+            for sha256 in orphans:
+                stats['bytes'] += self.store.remove(sha256)
+            stats['blobs'] = len(orphans)
+
+            if sweep:
+                cursor.execute("SELECT sha256 FROM attachment_blobs")
+                known = {row['sha256'] for row in cursor.fetchall()}
+                for sha256 in list(self.store.iter_objects()):
+                    if sha256 not in known:
+                        stats['bytes'] += self.store.remove(sha256)
+                        stats['stray_files'] += 1
+        if sweep:
+            stats['temp_files'] = self.store.remove_stale_temp_files()
+        return stats
@@ -0,0 +1,124 @@
+"""
+Компактные строки результатов запросов.
+
+Строка - именованный кортеж (без __dict__ на каждую строку), класс которого создается
+один раз для набора колонок запроса. Строка заменяет словарь из dict_factory, поэтому
+ведет себя как словарь (row['name'], row.get('name'), dict(row), 'name' in row) и так
+же сравнивается: равна словарю или строке с теми же парами ключ-значение, но не
+кортежу значений, и, как словарь, не хэшируется. От кортежа остаются хранение, доступ
+как к атрибуту (row.name), по номеру (row[0]), len и распаковка значений.
+
+    cursor = conn.cursor()
+    cursor.row_factory = rows.factory(rows.Patient)
+"""
+import collections
+import functools
+import threading
+
+
+class Row:
+    """Примесь с доступом к полям именованного кортежа как к словарю."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        if isinstance(other, tuple):
+            return False
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # Равна словарю, значит, как и словарь, не может быть ключом или элементом множества
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Row):
+    __slots__ = ()
+
+
+class Doctor(Row):
+    __slots__ = ()
+
+
+class Patient(Row):
+    __slots__ = ()
+
+
+class Appointment(Row):
+    __slots__ = ()
+
+
+_row_classes = {}
+_row_classes_lock = threading.Lock()
+
+
+def row_class(entity, fields: tuple):
+    """Класс строки сущности entity с полями fields; создается один раз на набор полей."""
+    key = (entity, fields)
+    cls = _row_classes.get(key)
+    if cls is None:
+        with _row_classes_lock:
+            cls = _row_classes.get(key)
+            if cls is None:
+                base = collections.namedtuple(entity.__name__, fields)
+                cls = type(entity.__name__, (entity, base), {"__slots__": ()})
+                _row_classes[key] = cls
+    return cls
+
+
+@functools.cache
+def factory(entity=Row):
+    """
+    row_factory для sqlite3, создающий строки сущности entity.
+
+    Имена колонок берутся из cursor.description один раз на запрос: описание
+    не меняется, пока курсор читает строки одного запроса, поэтому достаточно
+    сравнить его по идентичности с последним увиденным.
+    """
+    # (описание запроса, класс строки) - заменяется целиком, поэтому потокобезопасно
+    last = [(None, None)]
+
+    def make_row(cursor, values):
+        description = cursor.description
+        seen, cls = last[0]
+        if seen is not description:
+            cls = row_class(entity, tuple(column[0] for column in description))
+            last[0] = (description, cls)
+        return cls._make(values)
+
+    return make_row
@@ -0,0 +1,392 @@
+"""
+Локальный HTTP/JSON сервис поверх репозиториев для клиники с несколькими рабочими местами.
+
+    python service.py --db healthcare.db --port 8765
+    python main.py --server http://127.0.0.1:8765
+
+Все рабочие места обращаются к одному процессу, который владеет базой:
+- чтения выполняются пулом потоков, у каждого свое соединение (database.ConnectionPool);
+- все изменения выполняет один поток-писатель. Операции, накопившиеся в очереди,
+  пока шла предыдущая транзакция, выполняются в одной транзакции и фиксируются
+  одним commit (group commit). Каждая операция обернута в SAVEPOINT, поэтому
+  ошибка одной операции не откатывает остальные.
+
+Протокол: POST /rpc/<репозиторий>/<метод> с телом {"args": [...], "kwargs": {...}},
+ответ {"result": ...} или {"error": {"type": ..., "message": ...}}. Значения
+кодируются модулем wire. GET /health возвращает статистику писателя и кэша карт, GET /metrics -
+статистику запросов (database.get_metrics_snapshot).
+Сервис слушает только loopback-адрес: аутентификации у API нет.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import http
+import inspect
+import ipaddress
+import json
+import queue
+import sys
+import threading
+
+import database
+import passwords
+import wire
+from repositories import AppointmentRepository, DoctorRepository, PatientRepository, UserRepository
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_READERS = 4
+# Сколько операций записи максимум объединяется в одну транзакцию
+MAX_GROUP_COMMIT = 64
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Операции, доступные через сервис. Генераторы, массовый импорт из файла и справочник
+# врачей на стороне клиента сюда не входят, их заменяет service_client. У API нет
+# аутентификации, поэтому нет и операций, отдающих хэши паролей (get_*_login_data)
+# или создающих пользователя без профиля (add_user).
+READ_OPERATIONS = {
+    # login и authenticate только читают: замену устаревшего хэша пароля выполняет писатель
+    "users": ("login", "authenticate", "find_by_username", "get_all_users"),
+    # get_patient_record создает пустую карту, если ее нет, но эту запись отдает писателю
+    "patients": ("get_all_patients", "get_patients_page", "search_records", "get_patient",
+                 "get_patient_record", "get_patient_username", "get_patient_by_user_id",
+                 "list_record_revisions", "get_record_revision"),
+    "doctors": ("get_all_doctors", "get_doctors_page", "get_doctor", "get_doctor_username",
+                "get_doctor_by_user_id", "get_working_hours"),
+    "appointments": ("get_booked_slots_in_one_day", "get_day_availability", "find_earliest_free_slots",
+                     "get_booked_slots_in_range", "get_appointments_by_doctor_id", "list_appointments"),
+}
+WRITE_OPERATIONS = {
+    "patients": ("update_patient", "delete_patient", "add_patient", "update_medical_record"),
+    "doctors": ("add_doctor", "update_doctor", "delete_doctor", "set_working_hours"),
+    "appointments": ("add_appointment", "reserve_slot", "book_recurring"),
+}
+# Чтения справочника врачей идут через общий для всех клиентов кэш DoctorDirectory
+DIRECTORY_OPERATIONS = ("all", "get", "by_speciality", "specialities")
+
+
+class ServiceError(Exception):
+    """Ошибка запроса к сервису: неизвестная операция, неверные аргументы."""
+
+    def __init__(self, message, status=http.HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+class Operation:
+    __slots__ = ("func", "write", "signature")
+
+    def __init__(self, func, write):
+        self.func = func
+        self.write = write
+        self.signature = inspect.signature(func)
+
+    def bind(self, args, kwargs):
+        try:
+            bound = self.signature.bind(*args, **kwargs)
+        except TypeError as error:
+            raise ServiceError(str(error)) from None
+        return bound
+
+
+class _WriteJob:
+    __slots__ = ("func", "args", "kwargs", "future", "repository")
+
+    def __init__(self, func, args, kwargs, repository):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.repository = repository
+
+
+class GroupCommitWriter:
+    """
+    Единственный поток, выполняющий изменения в базе.
+
+    Операции ставятся в очередь; поток забирает из нее все, что накопилось
+    (но не больше max_batch), выполняет в одной транзакции BEGIN IMMEDIATE ... COMMIT
+    и только после commit сообщает результаты. Искусственной задержки нет:
+    под нагрузкой партии растут сами, пока предыдущая транзакция фиксируется.
+    """
+
+    def __init__(self, db_name, max_batch=MAX_GROUP_COMMIT, on_commit=None):
+        """
+        :param on_commit: Вызывается в потоке писателя со списком имен репозиториев
+                          операций зафиксированной партии (для сброса кэшей)
+        """
+        self.db_name = db_name
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._jobs = 0
+        self._largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, repository=None, **kwargs) -> concurrent.futures.Future:
+        job = _WriteJob(func, args, kwargs, repository)
+        self._queue.put(job)
+        return job.future
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(batches=self._batches,
+                        jobs=self._jobs,
+                        largest_batch=self._largest_batch,
+                        mean_batch=self._jobs / self._batches if self._batches else 0.0,
+                        queued=self._queue.qsize())
+
+    def close(self):
+        """Дожидается выполнения уже поставленных операций и останавливает поток."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        pool = database.get_pool(self.db_name)
+        outcomes = []
+        try:
+            # Вложенные with DatabaseConnection внутри методов репозиториев используют
+            # это же соединение, поэтому фиксирует транзакцию только этот блок
+            with database.DatabaseConnection(self.db_name) as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                for job in batch:
+                    conn.execute("SAVEPOINT service_job")
+                    pool.take_nested_failure()
+                    mark = pool.after_commit_mark()
+                    try:
+                        outcomes.append((True, job.func(*job.args, **job.kwargs)))
+                        failed = pool.take_nested_failure()
+                    except Exception as error:
+                        outcomes.append((False, error))
+                        failed = True
+                    if failed:
+                        conn.execute("ROLLBACK TO service_job")
+                        # Изменения операции отменены - ее действия после commit тоже
+                        pool.discard_after_commit(mark)
+                    conn.execute("RELEASE service_job")
+        except Exception as error:
+            # Не удалась вся транзакция (например, commit): сообщаем об ошибке всем
+            for job in batch:
+                job.future.set_exception(error)
+            return
+
+        with self._lock:
+            self._batches += 1
+            self._jobs += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+        if self.on_commit is not None:
+            self.on_commit({job.repository for job in batch})
+        for job, (ok, value) in zip(batch, outcomes):
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+
+class RepositoryService:
+    """Таблица операций репозиториев, читатели и писатель для одного файла базы."""
+
+    def __init__(self, db_name, readers=DEFAULT_READERS, max_batch=MAX_GROUP_COMMIT):
+        # Вложенные блоки писателя и долгоживущие соединения читателей требуют пула
+        database.enable_pooling()
+        database.create_tables(db_name)
+
+        self.db_name = db_name
+        self.repositories = dict(users=UserRepository(db_name),
+                                 patients=PatientRepository(db_name),
+                                 doctors=DoctorRepository(db_name),
+                                 appointments=AppointmentRepository(db_name))
+        self.operations = {}
+        for operations, write in ((READ_OPERATIONS, False), (WRITE_OPERATIONS, True)):
+            for name, methods in operations.items():
+                for method in methods:
+                    self.operations[(name, method)] = Operation(getattr(self.repositories[name], method), write)
+        directory = self.repositories['doctors'].directory()
+        for method in DIRECTORY_OPERATIONS:
+            self.operations[("directory", method)] = Operation(getattr(directory, method), False)
+
+        self.readers = concurrent.futures.ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self.writer = GroupCommitWriter(db_name, max_batch, on_commit=self._committed)
+        # login проверяет пароль у читателей, а замену устаревшего хэша отдает писателю,
+        # не дожидаясь ее: вход не ждет очереди записей
+        self.repositories['users'].rehash_writer = functools.partial(self.writer.submit, repository="users")
+        # Так же get_patient_record выполняется у читателей, а пустую карту создает писатель
+        self.repositories['patients'].empty_record_writer = functools.partial(self.writer.submit,
+                                                                              repository="patients")
+
+    def _committed(self, repositories):
+        # Кэш мог быть перечитан читателем между изменением и commit - сбрасываем еще раз
+        if "doctors" in repositories:
+            self.repositories['doctors'].directory().invalidate()
+
+    async def call(self, repository, method, args, kwargs):
+        """Выполняет операцию и возвращает результат, закодированный wire.encode."""
+        operation = self.operations.get((repository, method))
+        if operation is None:
+            raise ServiceError(f"Неизвестная операция {repository}.{method}", http.HTTPStatus.NOT_FOUND)
+        bound = operation.bind(args, kwargs)
+        loop = asyncio.get_running_loop()
+
+        if not operation.write:
+            # Кодирование большого результата тоже выполняется в потоке читателя
+            return await loop.run_in_executor(
+                self.readers, lambda: wire.encode(operation.func(*bound.args, **bound.kwargs)))
+
+        if bound.arguments.get('password'):
+            # Хэширование пароля долгое - выполняем его у читателей, а не в транзакции писателя
+            bound.arguments['password'] = await loop.run_in_executor(
+                self.readers, passwords.ensure_hashed, bound.arguments['password'])
+        future = self.writer.submit(operation.func, *bound.args, repository=repository, **bound.kwargs)
+        return wire.encode(await asyncio.wrap_future(future))
+
+    def health(self) -> dict:
+        return dict(status="ok", db=self.db_name, writer=self.writer.stats(),
+                    record_cache=self.repositories['patients'].record_cache().stats())
+
+    def close(self):
+        self.writer.close()
+        self.readers.shutdown(wait=True)
+        database.close_pools()
+
+
+class ServiceServer:
+    """Минимальный HTTP/1.1 сервер на asyncio (keep-alive, JSON в теле)."""
+
+    def __init__(self, service: RepositoryService):
+        self.service = service
+
+    async def dispatch(self, verb, path, body):
+        """:return: (HTTP статус, JSON-совместимый ответ)"""
+        if verb == "GET" and path == "/health":
+            return http.HTTPStatus.OK, self.service.health()
+        if verb == "GET" and path == "/metrics":
+            return http.HTTPStatus.OK, database.get_metrics_snapshot()
+
+        parts = path.strip("/").split("/")
+        if verb != "POST" or len(parts) != 3 or parts[0] != "rpc":
+            return http.HTTPStatus.NOT_FOUND, dict(error=dict(type="NotFound", message=path))
+        try:
+            payload = json.loads(body or b"{}")
+            args = wire.decode(payload.get("args", []))
+            kwargs = wire.decode(payload.get("kwargs", {}))
+            result = await self.service.call(parts[1], parts[2], args, kwargs)
+        except ServiceError as error:
+            return error.status, dict(error=dict(type="ServiceError", message=str(error)))
+        except (ValueError, TypeError, AttributeError) as error:
+            return http.HTTPStatus.BAD_REQUEST, dict(error=dict(type=type(error).__name__, message=str(error)))
+        except Exception as error:
+            return http.HTTPStatus.INTERNAL_SERVER_ERROR, dict(error=dict(type=type(error).__name__,
+                                                                          message=str(error)))
+        return http.HTTPStatus.OK, dict(result=result)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                verb, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        dict(error=dict(type="TooLarge", message=f"{length} bytes")), False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self.dispatch(verb, path, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, response, keep_alive):
+        data = json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        writer.write((f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                      f"Content-Type: application/json; charset=utf-8\r\n"
+                      f"Content-Length: {len(data)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """
+        Принимает соединения до отмены задачи.
+
+        :param ready: Необязательный threading.Event, выставляется, когда порт открыт
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            if ready is not None:
+                ready.set()
+            await server.serve_forever()
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP/JSON сервис медицинской системы")
+    parser.add_argument("--db", default="healthcare.db", help="Файл базы данных")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Loopback-адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="Потоков чтения")
+    parser.add_argument("--max-batch", type=int, default=MAX_GROUP_COMMIT,
+                        help="Максимум операций записи в одной транзакции")
+    args = parser.parse_args(argv)
+    if not _is_loopback(args.host):
+        parser.error("сервис слушает только loopback-адрес (127.0.0.1, ::1, localhost)")
+
+    service = RepositoryService(args.db, readers=args.readers, max_batch=args.max_batch)
+    print(f"Сервис запущен на http://{args.host}:{args.port} (база {args.db})")
+    try:
+        asyncio.run(ServiceServer(service).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Клиент сервиса service: удаленные репозитории с теми же методами, что у локальных.
+
+    client = ServiceClient("http://127.0.0.1:8765")
+    client.patients.get_patients_page(limit=100)
+
+Интерфейс Tk получает client.users, client.patients, client.doctors и client.appointments
+вместо локальных репозиториев и работает без изменений.
+"""
+import http.client
+import json
+import threading
+import urllib.parse
+
+import wire
+from record_storage import READ_CHUNK_SIZE
+from repositories import DoctorRepository, PatientRepository, UserRepository, AppointmentRepository
+
+DEFAULT_TIMEOUT = 30
+ITER_PAGE_SIZE = 500
+
+
+class ServiceError(Exception):
+    """Сервис вернул ошибку или недоступен."""
+
+
+class ServiceClient:
+    """
+    Соединение с сервисом. У каждого потока свое keep-alive соединение HTTP,
+    поэтому клиент можно использовать из DatabaseWorker.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+        self.users = RemoteUserRepository(self)
+        self.patients = RemotePatientRepository(self)
+        self.doctors = RemoteDoctorRepository(self)
+        self.appointments = RemoteAppointmentRepository(self)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, verb, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        # Keep-alive соединение могло быть закрыто сервером - одна повторная попытка с новым
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(verb, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read())
+            except (ConnectionError, http.client.HTTPException) as error:
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise ServiceError(f"Сервис недоступен: {error}") from error
+            except OSError as error:
+                connection.close()
+                self._local.connection = None
+                raise ServiceError(f"Сервис недоступен: {error}") from error
+
+    def call(self, repository, method, *args, **kwargs):
+        """Вызывает операцию repository.method на сервисе и возвращает декодированный результат."""
+        body = json.dumps(dict(args=wire.encode(args), kwargs=wire.encode(kwargs)),
+                          ensure_ascii=False).encode("utf-8")
+        status, response = self._request("POST", f"/rpc/{repository}/{method}", body)
+        if status != 200 or "error" in response:
+            error = response.get("error", {})
+            raise ServiceError(f"{repository}.{method}: {error.get('type')}: {error.get('message')}")
+        return wire.decode(response['result'])
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")[1]
+
+    def metrics(self) -> dict:
+        return self._request("GET", "/metrics")[1]
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class _RemoteRepository:
+    """
+    Методы из operations пересылаются на сервис как repository.method.
+    Для неизвестных сервису методов атрибута нет, как и у локального репозитория.
+    """
+    repository = None
+    local_class = None
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(self.local_class, name, None)):
+            raise AttributeError(name)
+        method = lambda *args, **kwargs: self.client.call(self.repository, name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+
+class RemoteUserRepository(_RemoteRepository):
+    repository = "users"
+    local_class = UserRepository
+
+
+class RemotePatientRepository(_RemoteRepository):
+    repository = "patients"
+    local_class = PatientRepository
+
+    def iter_record_chunks(self, patient_id, chunk_size=READ_CHUNK_SIZE):
+        """
+        Фрагменты карты, как PatientRepository.iter_record_chunks. Сервис передает
+        карту целиком (get_patient_record), по частям ее показывает только интерфейс.
+        """
+        result = self.client.call(self.repository, "get_patient_record", patient_id)
+        record = result['record'] if result else ""
+        for start in range(0, len(record), chunk_size):
+            yield record[start:start + chunk_size]
+
+
+class RemoteDoctorDirectory:
+    """Справочник врачей, который хранится в общем кэше сервиса (cache.DoctorDirectory)."""
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def all(self) -> list[dict]:
+        return self.client.call("directory", "all")
+
+    def get(self, doctor_id) -> dict | None:
+        return self.client.call("directory", "get", doctor_id)
+
+    def by_speciality(self, speciality) -> list[dict]:
+        return self.client.call("directory", "by_speciality", speciality)
+
+    def specialities(self) -> list[str]:
+        return self.client.call("directory", "specialities")
+
+    def invalidate(self):
+        # Сервис сбрасывает свой кэш сам после каждого изменения врачей
+        pass
+
+
+class RemoteDoctorRepository(_RemoteRepository):
+    repository = "doctors"
+    local_class = DoctorRepository
+
+    def __init__(self, client: ServiceClient):
+        super().__init__(client)
+        self._directory = RemoteDoctorDirectory(client)
+
+    def directory(self) -> RemoteDoctorDirectory:
+        return self._directory
+
+
+class RemoteAppointmentRepository(_RemoteRepository):
+    repository = "appointments"
+    local_class = AppointmentRepository
+
+    def iter_appointments(self, doctor_id, date_from=None, date_to=None, after=None,
+                          descending=False, batch_size=ITER_PAGE_SIZE):
+        """
+        Генератор записей к доктору, как AppointmentRepository.iter_appointments:
+        записи запрашиваются страницами list_appointments по appointment_time последней записи.
+        """
+        while True:
+            rows = self.client.call(self.repository, "list_appointments", doctor_id,
+                                    date_from=date_from, date_to=date_to, after=after,
+                                    descending=descending, limit=batch_size) or []
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]['appointment_time']
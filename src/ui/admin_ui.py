@@ -1,8 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
 from repositories import DoctorRepository, PatientRepository
-from ui.manage_patients_ui import PatientAdminUI
-from ui.manage_doctors_ui import DoctorAdminUI
 
 class AdminUI(tk.Toplevel):
     def __init__(self, doctor_repository: DoctorRepository, patient_repository: PatientRepository):
@@ -30,8 +28,10 @@ class AdminUI(tk.Toplevel):
 
     def manage_doctors(self):
         # Вызов функции управления списком врачей
+        from ui.manage_doctors_ui import DoctorAdminUI
         DoctorAdminUI(self.doctor_repository)
 
     def manage_patients(self):
         # Вызов функции управления списком пациентов
+        from ui.manage_patients_ui import PatientAdminUI
         PatientAdminUI(self.patient_repository)
\ No newline at end of file
@@ -1,49 +1,47 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from tkcalendar import DateEntry  # Нужно установить tkcalendar для выбора даты
 from repositories import AppointmentRepository  # Предполагается, что есть PatientRepository с нужными методами
+from ui.tk_async import BackgroundLoader, run_in_background
+from availability import DayAvailability, WorkingHours, DEFAULT_START_TIME, DEFAULT_END_TIME, DEFAULT_SLOT_MINUTES
+from booking import ReservationStatus
+from recurrence import MAX_OCCURRENCES, RecurrenceRule
 
-from datetime import datetime, timedelta
+from datetime import datetime
 
-def generate_time_slots(start_time="10:00", end_time="18:00", interval_minutes=10, booked_slots_in_date: list | None=None, date=datetime.today()):
+def generate_time_slots(start_time=DEFAULT_START_TIME, end_time=DEFAULT_END_TIME, interval_minutes=DEFAULT_SLOT_MINUTES,
+                        booked_slots_in_date: list | None=None, date=None):
+    """
+    Свободные слоты в формате 'HH:MM'. Оставлено для совместимости,
+    сам расчет выполняет availability.DayAvailability.
+    """
     if booked_slots_in_date is None:
         booked_slots_in_date = []
-        
-    time_slots = []
-    current_time = datetime.strptime(start_time, "%H:%M")
-    end_time = datetime.strptime(end_time, "%H:%M")
 
     if booked_slots_in_date:
         date = booked_slots_in_date[0].date()
-    
-    while current_time <= end_time:
-        # Сравниваем только время, игнорируя дату
-        slot = current_time.strftime("%H:%M")
-        slot_datetime = datetime.combine(date, current_time.time())  # Получаем объект datetime с текущей датой
-        
-        # Проверяем, занято ли время
-        if not any(slot_datetime.time() == booked_slot.time() for booked_slot in booked_slots_in_date):
-            time_slots.append(slot)
-        
-        current_time += timedelta(minutes=interval_minutes)
-    
-    print(f"Слоты временные: {time_slots}")
-    return time_slots
+    elif date is None:
+        date = datetime.today().date()
+
+    hours = WorkingHours(start_time, end_time, interval_minutes)
+    return DayAvailability(date, hours, booked_slots_in_date).free_slot_labels()
 
 class AppointmentBookingWindow(tk.Toplevel):
     def __init__(self, patient_id,
                  appointment_repository: AppointmentRepository,
                  fetch_doctors):
+        from tkcalendar import DateEntry  # Нужно установить tkcalendar для выбора даты
+
         super().__init__()
         self.patient_id = patient_id
         self.appointment_repository = appointment_repository
         self.get_all_doctors = fetch_doctors
         self.title("Запись к врачу")
 
-        # Выбор врача
-        self.doctors = self.get_all_doctors()
-        self.doctor_combobox = ttk.Combobox(self, values=[f"{doc['name']} - {doc['speciality']}" for doc in self.doctors])
-        self.doctor_combobox.set("Выберите врача")
+        # Выбор врача: позиция в комбобоксе соответствует позиции в self.doctors
+        self.doctors = []
+        self.doctor_index_by_id = {}
+        self.doctor_combobox = ttk.Combobox(self, state="readonly")
+        self.doctor_combobox.set("Загрузка врачей...")
         self.doctor_combobox.pack(pady=10, fill=tk.X)
         self.doctor_combobox.bind("<<ComboboxSelected>>", self.update_time_slots)
 
@@ -61,33 +59,71 @@ class AppointmentBookingWindow(tk.Toplevel):
         self.time_combobox.set("Сначала выберите врача и дату")
         self.time_combobox.pack(pady=5)
 
+        # Повторяющаяся запись: тот же день недели и время несколько недель подряд
+        self.repeat_var = tk.BooleanVar(value=False)
+        self.repeat_check = ttk.Checkbutton(self, text="Повторять еженедельно, недель:", variable=self.repeat_var)
+        self.repeat_check.pack(pady=5)
+        self.repeat_weeks = ttk.Spinbox(self, from_=2, to=MAX_OCCURRENCES, width=5)
+        self.repeat_weeks.set(12)
+        self.repeat_weeks.pack(pady=5)
+
         # Кнопка для записи на прием
         self.book_button = ttk.Button(self, text="Записаться", command=self.book_appointment)
         self.book_button.pack(pady=10)
 
+        # Поиск ближайшего свободного времени у всех врачей выбранной специальности
+        self.nearest_button = ttk.Button(self, text="Ближайшее свободное время", command=self.find_nearest_slots)
+        self.nearest_button.pack(pady=5)
+        self.nearest_combobox = ttk.Combobox(self, state="readonly", width=40)
+        self.nearest_combobox.pack(pady=5, fill=tk.X)
+        self.nearest_combobox.bind("<<ComboboxSelected>>", self.select_nearest_slot)
+        self.nearest_slots = []
+
+        self.status_label = ttk.Label(self, text="")
+        self.status_label.pack(pady=5)
+
+        # Слоты пересчитываются в фоне, частые переключения врача и даты склеиваются в один запрос
+        self.preselected_time = None
+        self.slots_loader = BackgroundLoader(self, self.show_time_slots, status_label=self.status_label)
+
+        run_in_background(self, self.get_all_doctors, on_done=self.show_doctors)
+
+    def show_doctors(self, doctors):
+        """Заполняет список врачей после фоновой загрузки"""
+        self.doctors = doctors or []
+        self.doctor_index_by_id = {doc['doctor_id']: index for index, doc in enumerate(self.doctors)}
+        self.doctor_combobox.config(values=[f"{doc['name']} - {doc['speciality']}" for doc in self.doctors])
+        self.doctor_combobox.set("Выберите врача")
+
+    def selected_doctor(self):
+        """Возвращает выбранного в комбобоксе врача или None"""
+        selected_index = self.doctor_combobox.current()
+        if selected_index < 0:
+            return None
+        return self.doctors[selected_index]
+
     def update_time_slots(self, event=None):
         # Проверка, что выбран врач и дата
-        selected_doctor_name = [x.strip() for x in self.doctor_combobox.get().split('-')][0] # Выделяет имя с комбобокса
+        selected_doctor = self.selected_doctor()
         selected_date = self.date_entry.get_date()
-        
-        if selected_doctor_name == "Выберите врача":
-            return
 
-        # Получаем ID выбранного врача
-        selected_doctor = next((doc for doc in self.doctors if doc['name'] == selected_doctor_name), None)
         if selected_doctor:
             doctor_id = selected_doctor["doctor_id"]
             
-            # Получаем занятые слоты для выбранного врача и даты
-            booked_slots = self.appointment_repository.get_booked_slots_in_one_day(doctor_id, selected_date)
-            print(f"Слоты занятые: {booked_slots}")
-            # Генерируем свободные временные слоты с учетом уже забронированных
-            available_time_slots = generate_time_slots(booked_slots_in_date=booked_slots)
-            self.time_combobox.config(values=available_time_slots)
+            # Свободные слоты с учетом рабочих часов врача и уже забронированных записей
+            self.slots_loader.refresh(self.appointment_repository.get_day_availability, doctor_id, selected_date)
+
+    def show_time_slots(self, availability):
+        available_time_slots = availability.free_slot_labels() if availability else []
+        self.time_combobox.config(values=available_time_slots)
+        if self.preselected_time in available_time_slots:
+            self.time_combobox.set(self.preselected_time)
+        else:
             self.time_combobox.set("Выберите время")
+        self.preselected_time = None
 
     def book_appointment(self):
-        selected_doctor_name = [x.strip() for x in self.doctor_combobox.get().split('-')][0] # Выделяет имя с комбобокса
+        selected_doctor = self.selected_doctor()
         selected_date = self.date_entry.get_date()
 
         if selected_date < datetime.today().date():
@@ -97,23 +133,123 @@ class AppointmentBookingWindow(tk.Toplevel):
         selected_time = self.time_combobox.get()
 
         # Проверка, что врач и время выбраны
-        if selected_doctor_name == "Выберите врача" or selected_time == "Выберите время":
+        if selected_doctor is None or selected_time == "Выберите время":
             messagebox.showwarning(message="Пожалуйста, выберите врача и время.")
             return
         
         selected_time = [int(x) for x in self.time_combobox.get().split(":")]
 
-        # Получаем ID выбранного врача
-        selected_doctor = next((doc for doc in self.doctors if doc['name'] == selected_doctor_name), None)
         if selected_doctor:
             doctor_id = selected_doctor["doctor_id"]
             appointment_time = datetime(year=selected_date.year, month=selected_date.month, day=selected_date.day,
                                          hour=selected_time[0], minute=selected_time[1])
-            try:
-                self.appointment_repository.add_appointment(self.patient_id, doctor_id, appointment_time)
-                messagebox.showinfo(message="Запись успешно добавлена")
-            except Exception as e:
+
+            def show_alternatives(result):
+                self.show_nearest_slots([dict(doctor_id=doctor_id, name=selected_doctor['name'],
+                                              speciality=selected_doctor['speciality'], appointment_time=slot)
+                                         for slot in result.alternatives])
+
+            def reserved(result):
+                self.book_button.config(state=tk.NORMAL)
+                if result is None:
+                    messagebox.showerror(message="Не удалось записаться, попробуйте еще раз")
+                elif result.status is ReservationStatus.BOOKED:
+                    messagebox.showinfo(message="Запись успешно добавлена")
+                elif result.status is ReservationStatus.RETRY_LATER:
+                    messagebox.showwarning(message="База данных занята, попробуйте записаться еще раз")
+                elif result.status is ReservationStatus.SLOT_TAKEN:
+                    # Слот успели занять: предлагаем ближайшие свободные
+                    show_alternatives(result)
+                    messagebox.showwarning(message="Это время уже занято. Выберите другое из предложенного.")
+                elif result.status is ReservationStatus.INVALID_SLOT:
+                    # Время не совпадает с расписанием врача (например, часы работы изменились)
+                    show_alternatives(result)
+                    messagebox.showwarning(message="Врач не принимает в это время. "
+                                                   "Выберите другое из предложенного.")
+                else:
+                    messagebox.showerror(message=f"Не удалось записаться: {result.status.value}")
+                self.update_time_slots()
+
+            def failed(e):
+                self.book_button.config(state=tk.NORMAL)
                 messagebox.showerror(message=f"Ошибка: {str(e)}")
+                self.update_time_slots()
+
+            if self.repeat_var.get():
+                self.book_recurring(doctor_id, appointment_time)
+                return
+
+            # Кнопка заблокирована до ответа, чтобы двойной клик не отправил две попытки
+            self.book_button.config(state=tk.DISABLED)
+            run_in_background(self, self.appointment_repository.reserve_slot,
+                              self.patient_id, doctor_id, appointment_time,
+                              on_done=reserved, on_error=failed)
+
+    def book_recurring(self, doctor_id, appointment_time):
+        """Записывает на серию еженедельных приемов одной транзакцией и показывает конфликты"""
+        try:
+            rule = RecurrenceRule.weekly(appointment_time, int(self.repeat_weeks.get()))
+        except ValueError:
+            messagebox.showwarning(message=f"Число недель должно быть от 1 до {MAX_OCCURRENCES}.")
+            return
+
+        def booked(result):
+            self.book_button.config(state=tk.NORMAL)
+            if result is None:
+                messagebox.showerror(message="Не удалось записаться, попробуйте еще раз")
+            elif result.status is ReservationStatus.RETRY_LATER:
+                messagebox.showwarning(message="База данных занята, попробуйте записаться еще раз")
+            elif not result.conflicts:
+                messagebox.showinfo(message=f"Записано приемов: {len(result.booked)}")
+            else:
+                reasons = {ReservationStatus.SLOT_TAKEN: "занято", ReservationStatus.INVALID_SLOT: "вне расписания"}
+                conflicts = "\n".join(f"{moment:%d.%m.%Y %H:%M} - {reasons.get(status, status.value)}"
+                                      for moment, status in result.conflicts)
+                messagebox.showwarning(message=f"Записано приемов: {len(result.booked)} из {rule.count}.\n"
+                                               f"Не удалось записать:\n{conflicts}")
+            self.update_time_slots()
+
+        def failed(e):
+            self.book_button.config(state=tk.NORMAL)
+            messagebox.showerror(message=f"Ошибка: {str(e)}")
 
+        self.book_button.config(state=tk.DISABLED)
+        run_in_background(self, self.appointment_repository.book_recurring,
+                          self.patient_id, doctor_id, rule, on_done=booked, on_error=failed)
+
+    def find_nearest_slots(self):
+        """Ищет ближайшие свободные слоты у всех врачей той же специальности, что и выбранный"""
+        selected_doctor = self.selected_doctor()
+        if selected_doctor is None:
+            messagebox.showwarning(message="Пожалуйста, выберите врача нужной специальности.")
+            return
+
+        self.nearest_combobox.set("Поиск...")
+        run_in_background(self, self.appointment_repository.find_earliest_free_slots,
+                          selected_doctor['speciality'], datetime.now(), on_done=self.show_nearest_slots)
+
+    def show_nearest_slots(self, nearest_slots):
+        self.nearest_slots = nearest_slots or []
+        self.nearest_combobox.config(values=[
+            f"{slot['appointment_time']:%d.%m.%Y %H:%M} - {slot['name']}" for slot in self.nearest_slots
+        ])
+        if self.nearest_slots:
+            self.nearest_combobox.current(0)
+            self.select_nearest_slot()
+        else:
+            self.nearest_combobox.set("Свободного времени не найдено")
+
+    def select_nearest_slot(self, event=None):
+        """Подставляет выбранный ближайший слот в поля врача, даты и времени"""
+        selected_index = self.nearest_combobox.current()
+        if selected_index < 0:
+            return
+
+        slot = self.nearest_slots[selected_index]
+        doctor_index = self.doctor_index_by_id.get(slot['doctor_id'])
+        if doctor_index is None:
+            return
+        self.doctor_combobox.current(doctor_index)
+        self.date_entry.set_date(slot['appointment_time'].date())
+        self.preselected_time = slot['appointment_time'].strftime("%H:%M")
         self.update_time_slots()
-        
\ No newline at end of file
@@ -1,10 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from repositories import DoctorRepository, AppointmentRepository, PatientRepository
+from repositories import DoctorRepository, AppointmentRepository, PatientRepository, Session
 from ui.medical_record_ui import MedicalRecordWindowEdit
+from ui.tk_async import stream_in_background
 
 class DoctorUI(tk.Toplevel):
-    def __init__(self, user_id, doctor_repository: DoctorRepository, appointment_repository: AppointmentRepository, patient_repository: PatientRepository):
+    def __init__(self, session: Session, doctor_repository: DoctorRepository, appointment_repository: AppointmentRepository, patient_repository: PatientRepository):
         super().__init__()
 
         self.title("Список записей")
@@ -13,9 +14,11 @@ class DoctorUI(tk.Toplevel):
         self.appointment_repository = appointment_repository
         self.patient_repository = patient_repository
 
-        self.doctor = doctor_repository.get_doctor_by_user_id(user_id=user_id)
+        # Профиль доктора уже прочитан при входе
+        self.session = session
+        self.stream_cancelled = None
 
-        self.label = ttk.Label(self, text=f"Здравствуйте, {self.doctor['name']}")
+        self.label = ttk.Label(self, text=f"Здравствуйте, {session.name}")
         self.label.pack(pady=10)
 
         # Создаем виджет Treeview
@@ -28,15 +31,26 @@ class DoctorUI(tk.Toplevel):
         self.edit_button = ttk.Button(self, text="Открыть запись", command=self.edit_record)
         self.edit_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.status_label = ttk.Label(self, text="")
+        self.status_label.pack(side=tk.LEFT, padx=5, pady=5)
+
         self.load_records_to_tree_view()
 
     def load_records_to_tree_view(self):
         """Загружает список записей к этому доктору в Treeview."""
+        if self.stream_cancelled is not None:
+            self.stream_cancelled.set()  # Прерываем предыдущую загрузку, если она еще идет
+
         for row in self.tree.get_children():
             self.tree.delete(row)  # Очистка списка перед загрузкой новых данных
 
-        appointments = self.appointment_repository.get_appointments_by_doctor_id(self.doctor['doctor_id'])
+        # Записи читаются потоком в фоне и добавляются порциями, вся история в памяти не хранится
+        self.status_label.config(text="Загрузка...")
+        self.stream_cancelled = stream_in_background(
+            self, self.appointment_repository.iter_appointments, self.session.doctor_id,
+            on_batch=self.add_appointments, on_done=lambda: self.status_label.config(text=""))
 
+    def add_appointments(self, appointments):
         for appointment in appointments:
             self.tree.insert("", tk.END, values=(appointment['patient_id'], appointment['name'], str(appointment['appointment_time'])))
 
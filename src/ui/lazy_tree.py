@@ -0,0 +1,152 @@
+import tkinter as tk
+from tkinter import ttk
+
+from ui.tk_async import run_in_background
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_ROWS = 500
+# Доля прокрутки от края списка, при которой подгружается следующая страница
+PREFETCH_THRESHOLD = 0.1
+
+
+class LazyTreeview(ttk.Frame):
+    """
+    Treeview со страничной подгрузкой строк при прокрутке.
+
+    Страницы запрашиваются через fetch_page(after_id=..., before_id=..., limit=...)
+    в фоновом потоке. В виджете одновременно хранится не больше max_rows строк:
+    при прокрутке вниз удаляются верхние строки, при прокрутке вверх - нижние,
+    и они подгружаются заново, если к ним вернуться.
+    Каждая строка Treeview имеет iid, равный ключу записи, что позволяет
+    точечно обновлять и удалять строки без перезагрузки списка.
+    """
+
+    def __init__(self, master, columns, headings, fetch_page, row_key, row_values,
+                 page_size=DEFAULT_PAGE_SIZE, max_rows=DEFAULT_MAX_ROWS, status_label=None):
+        """
+        :param columns: Идентификаторы колонок Treeview
+        :param headings: Заголовки колонок
+        :param fetch_page: Функция страницы репозитория (например, PatientRepository.get_patients_page)
+        :param row_key: Функция, возвращающая ключ пагинации строки (например, patient_id)
+        :param row_values: Функция, превращающая строку репозитория в values для Treeview
+        :param status_label: ttk.Label для надписи "Загрузка..." (необязательно)
+        """
+        super().__init__(master)
+        self.fetch_page = fetch_page
+        self.row_key = row_key
+        self.row_values = row_values
+        self.page_size = page_size
+        self.max_rows = max(max_rows, page_size * 2)
+        self.status_label = status_label
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            self.tree.heading(column, text=heading)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Ключи строк в порядке отображения
+        self._keys = []
+        self._at_start = True
+        self._at_end = False
+        self._loading = False
+        # Увеличивается при перезагрузке, чтобы отбрасывать ответы на устаревшие запросы
+        self._generation = 0
+
+    def reload(self):
+        """Перечитывает список с первой страницы."""
+        self._generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self._keys = []
+        self._at_start = True
+        self._at_end = False
+        self._loading = False
+        self._load(after_id=None)
+
+    def _load(self, after_id=None, before_id=None):
+        self._loading = True
+        self._set_status("Загрузка...")
+        generation = self._generation
+        run_in_background(self, self.fetch_page, after_id=after_id, before_id=before_id, limit=self.page_size,
+                          on_done=lambda rows: self._page_loaded(generation, rows, before_id is not None),
+                          on_error=lambda error: self._page_failed(generation, error))
+
+    def _page_loaded(self, generation, rows, backwards):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._set_status("")
+        rows = rows or []
+
+        if backwards:
+            self._at_start = len(rows) < self.page_size
+            anchor = self._keys[0] if self._keys else None
+            for row in reversed(rows):
+                key = self.row_key(row)
+                self.tree.insert("", 0, iid=str(key), values=self.row_values(row))
+                self._keys.insert(0, key)
+            # Убираем лишние строки снизу
+            overflow = len(self._keys) - self.max_rows
+            if overflow > 0:
+                self.tree.delete(*[str(key) for key in self._keys[-overflow:]])
+                del self._keys[-overflow:]
+                self._at_end = False
+        else:
+            self._at_end = len(rows) < self.page_size
+            anchor = self._keys[-1] if self._keys else None
+            for row in rows:
+                key = self.row_key(row)
+                self.tree.insert("", tk.END, iid=str(key), values=self.row_values(row))
+                self._keys.append(key)
+            # Убираем лишние строки сверху
+            overflow = len(self._keys) - self.max_rows
+            if overflow > 0:
+                self.tree.delete(*[str(key) for key in self._keys[:overflow]])
+                del self._keys[:overflow]
+                self._at_start = False
+
+        # Оставляем на экране строку, у которой был пользователь до подгрузки
+        if anchor is not None and self.tree.exists(str(anchor)):
+            self.tree.see(str(anchor))
+
+    def _page_failed(self, generation, error):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._set_status("Ошибка загрузки")
+        print(f"Page load failed: {error}")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading or not self._keys:
+            return
+        if float(last) >= 1.0 - PREFETCH_THRESHOLD and not self._at_end:
+            self._load(after_id=self._keys[-1])
+        elif float(first) <= PREFETCH_THRESHOLD and not self._at_start:
+            self._load(before_id=self._keys[0])
+
+    def _set_status(self, text):
+        if self.status_label is not None:
+            self.status_label.config(text=text)
+
+    def update_row(self, row):
+        """
+        Обновляет одну строку после изменения записи. Новая запись добавляется
+        в конец, если список уже прокручен до конца (ключи растут монотонно).
+        """
+        key = self.row_key(row)
+        iid = str(key)
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=self.row_values(row))
+        elif self._at_end and (not self._keys or key > self._keys[-1]):
+            self.tree.insert("", tk.END, iid=iid, values=self.row_values(row))
+            self._keys.append(key)
+
+    def remove_row(self, key):
+        """Убирает строку удаленной записи."""
+        iid = str(key)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            self._keys.remove(key)
@@ -1,16 +1,35 @@
-from pydoc import doc
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk
-from repositories import AppointmentRepository, DoctorRepository, PatientRepository, UserRepository, Role
-from ui.patient_ui import PatientUI
-from ui.admin_ui import AdminUI
-from ui.doctor_ui import DoctorUI
+from repositories import AppointmentRepository, DoctorRepository, PatientRepository, UserRepository, Role, Session
+from ui.tk_async import run_in_background
+
+# Интерфейсы ролей импортируются при первом входе с этой ролью,
+# чтобы окно входа появлялось без загрузки всех модулей интерфейса
 
 class MainApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, db_name="healthcare.db", service_url=None):
+        """
+        :param db_name: Файл базы для работы напрямую
+        :param service_url: Адрес сервиса (service.py); если задан, база напрямую не открывается
+        """
         super().__init__()
         self.title("Система медицинских записей")
 
+        # Репозитории создаются один раз и используются всеми окнами
+        if service_url:
+            from service_client import ServiceClient
+            client = ServiceClient(service_url)
+            self.user_repository = client.users
+            self.doctor_repository = client.doctors
+            self.patient_repository = client.patients
+            self.appointment_repository = client.appointments
+        else:
+            self.user_repository = UserRepository(db_name)
+            self.doctor_repository = DoctorRepository(db_name)
+            self.patient_repository = PatientRepository(db_name)
+            self.appointment_repository = AppointmentRepository(db_name)
+        self.fetch_doctors = self.doctor_repository.directory().all  # кэшированный справочник врачей
+
         self.label = ttk.Label(self, text="Добро пожаловать в систему медицинских записей!")
         self.label.pack(pady=10)
 
@@ -25,33 +44,40 @@ class MainApp(tk.Tk):
         password = simpledialog.askstring("Вход", "Введите пароль:", show='*')
 
         if username and password:
-            # Происходит аутентификация и выбор интерфейса в зависимости от роли
-            user_repository = UserRepository("healthcare.db")
-            doctor_repository = DoctorRepository("healthcare.db")
-            patient_repository = PatientRepository("healthcare.db")
-            appointment_repository = AppointmentRepository("healthcare.db")
-            fetch_doctors = doctor_repository.get_all_doctors
-
-            role = user_repository.authenticate(username, password)
-            user_id = user_repository.find_by_username(username)
-            if role == Role.ADMIN.value:
-                messagebox.showinfo("Информация", "Успешно вошли с ролью администратора")
-                AdminUI(doctor_repository=doctor_repository, patient_repository=patient_repository)
-            elif role == Role.DOCTOR.value:
-                messagebox.showinfo("Информация", "Успешно вошли с ролью доктора")
-                DoctorUI(user_id=user_id,
-                         doctor_repository=doctor_repository, 
-                         patient_repository=patient_repository, 
-                         appointment_repository=appointment_repository)
-            elif role == Role.PATIENT.value:
-                messagebox.showinfo("Информация", "Успешно вошли с ролью пациента")
-                PatientUI(user_id=user_id,
-                          patient_repository=patient_repository, appointment_repository=appointment_repository,
-                          fetch_doctors_func=fetch_doctors)
-            else:
-                messagebox.showinfo("Информация", "Попытка входа выполнена.")     
-                 
-            print(f"Попытка входа: {username} с паролем: {password}")
+            # Проверка хэша пароля идет в фоновом потоке, окно при этом не замирает
+            self.login_button.config(state=tk.DISABLED)
+            self.label.config(text="Проверка пароля...")
+            run_in_background(self, self.user_repository.login, username, password,
+                              on_done=self.logged_in, on_error=self.login_failed)
+            print(f"Попытка входа: {username}")
         else:
             messagebox.showwarning("Предупреждение", "Логин и пароль не могут быть пустыми.")
-            
\ No newline at end of file
+
+    def login_failed(self, error):
+        self.logged_in(None)
+        print(f"Login failed: {error}")
+
+    def logged_in(self, session: Session | None):
+        """Открывает интерфейс роли вошедшего пользователя."""
+        self.login_button.config(state=tk.NORMAL)
+        self.label.config(text="Добро пожаловать в систему медицинских записей!")
+
+        if session is None:
+            messagebox.showinfo("Информация", "Неверный логин или пароль.")
+        elif session.role == Role.ADMIN:
+            messagebox.showinfo("Информация", "Успешно вошли с ролью администратора")
+            from ui.admin_ui import AdminUI
+            AdminUI(doctor_repository=self.doctor_repository, patient_repository=self.patient_repository)
+        elif session.role == Role.DOCTOR:
+            messagebox.showinfo("Информация", "Успешно вошли с ролью доктора")
+            from ui.doctor_ui import DoctorUI
+            DoctorUI(session,
+                     doctor_repository=self.doctor_repository,
+                     patient_repository=self.patient_repository,
+                     appointment_repository=self.appointment_repository)
+        elif session.role == Role.PATIENT:
+            messagebox.showinfo("Информация", "Успешно вошли с ролью пациента")
+            from ui.patient_ui import PatientUI
+            PatientUI(session,
+                      patient_repository=self.patient_repository, appointment_repository=self.appointment_repository,
+                      fetch_doctors_func=self.fetch_doctors)
@@ -1,6 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from repositories import DoctorRepository
+from availability import WorkingHours
+from ui.lazy_tree import LazyTreeview
+from ui.tk_async import run_in_background
 
 class DoctorAdminUI(tk.Toplevel):
     def __init__(self, repository: DoctorRepository):
@@ -9,12 +12,16 @@ class DoctorAdminUI(tk.Toplevel):
 
         self.doctor_repository = repository
 
-        # Создаем виджет Treeview
-        self.tree = ttk.Treeview(self, columns=("ID", "Name", "Speciality"), show="headings")
-        self.tree.heading("ID", text="ID")
-        self.tree.heading("Name", text="Имя")
-        self.tree.heading("Speciality", text="Специальность")
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.status_label = ttk.Label(self, text="")
+
+        # Создаем Treeview, который подгружает врачей страницами при прокрутке
+        self.list_view = LazyTreeview(self, ("ID", "Name", "Speciality"), ("ID", "Имя", "Специальность"),
+                                      fetch_page=self.doctor_repository.get_doctors_page,
+                                      row_key=lambda doctor: doctor['doctor_id'],
+                                      row_values=lambda doctor: (doctor['doctor_id'], doctor['name'], doctor['speciality']),
+                                      status_label=self.status_label)
+        self.list_view.pack(fill=tk.BOTH, expand=True)
+        self.tree = self.list_view.tree
 
         # Добавляем кнопки для управления
         self.edit_button = ttk.Button(self, text="Редактировать", command=self.edit_doctor)
@@ -25,18 +32,19 @@ class DoctorAdminUI(tk.Toplevel):
         self.delete_button.pack(side=tk.LEFT, padx=5, pady=5)
         self.add_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.status_label.pack(side=tk.LEFT, padx=5, pady=5)
+
         # Загрузка данных
         self.load_doctors_to_tree_view()
 
     def load_doctors_to_tree_view(self):
-        """Загружает список докторов в Treeview."""
-        for row in self.tree.get_children():
-            self.tree.delete(row)  # Очистка списка перед загрузкой новых данных
-
-        doctors = self.doctor_repository.get_all_doctors()
+        """Загружает список докторов в Treeview с первой страницы."""
+        self.list_view.reload()
 
-        for doctor in doctors:
-            self.tree.insert("", tk.END, values=(doctor['doctor_id'], doctor['name'], doctor['speciality']))
+    def doctor_saved(self, doctor_id):
+        """Обновляет в списке только строку измененного или добавленного врача."""
+        run_in_background(self, self.doctor_repository.get_doctor, doctor_id,
+                          on_done=lambda doctor: doctor and self.list_view.update_row(doctor))
 
     def edit_doctor(self):
         """Открывает окно для редактирования информации о враче."""
@@ -49,13 +57,17 @@ class DoctorAdminUI(tk.Toplevel):
         doctor_name = self.tree.item(selected_item[0])["values"][1]
         doctor_speciality = self.tree.item(selected_item[0])["values"][2]
 
-        patient_login_data = self.doctor_repository.get_doctor_login_data(doctor_id)
+        def open_edit_window(username):
+            if not username:
+                messagebox.showerror("Ошибка", "Не удалось загрузить данные врача.")
+                return
+            # Открываем новое окно для редактирования
+            EditDoctorWindow(self, self.doctor_repository, self.doctor_saved,
+                             doctor_id, doctor_name, doctor_speciality,
+                             username)
 
-        # Открываем новое окно для редактирования
-        EditDoctorWindow(self, self.doctor_repository, self.load_doctors_to_tree_view,
-                         doctor_id, doctor_name, doctor_speciality,
-                         patient_login_data['username'], patient_login_data['password'])
-        self.load_doctors_to_tree_view()
+        run_in_background(self, self.doctor_repository.get_doctor_username, doctor_id,
+                          on_done=open_edit_window)
 
     def delete_doctor(self):
         """Удаляет выбранного врача и обновляет список."""
@@ -66,23 +78,20 @@ class DoctorAdminUI(tk.Toplevel):
 
         doctor_id = self.tree.item(selected_item[0])["values"][0]
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить доктора?"):
-            self.doctor_repository.delete_doctor(doctor_id)
-            self.load_doctors_to_tree_view()  # Обновляем список после удаления
-            print("Список докторов:")
-            for i in self.doctor_repository.get_all_doctors():
-                print(i)
-            print()
+            # Обновляем список после удаления
+            run_in_background(self, self.doctor_repository.delete_doctor, doctor_id,
+                              on_done=lambda _: self.list_view.remove_row(doctor_id))
     
     def add_doctor(self):
         """Добавляет нового доктора и обновляет список"""
 
         # Открываем новое окно для редактирования
-        EditDoctorWindow(self, self.doctor_repository, self.load_doctors_to_tree_view)
+        EditDoctorWindow(self, self.doctor_repository, self.doctor_saved)
 
 class EditDoctorWindow(tk.Toplevel):
     def __init__(self, master, doctor_repository: DoctorRepository, callback_refresh,
                  doctor_id=None, doctor_name="",  doctor_speciality="",
-                 username="", password=""):
+                 username=""):
         super().__init__(master)
         self.title("Добавить врача" if doctor_id is None else "Редактировать врача")
         self.doctor_id = doctor_id
@@ -107,13 +116,46 @@ class EditDoctorWindow(tk.Toplevel):
         self.username_entry.insert(0, username) # Заполняем, если редактируем
         self.username_entry.grid(row=2, column=1, padx=5, pady=5)
 
-        ttk.Label(self, text="Пароль:").grid(row=3, column=0, padx=5, pady=5)
+        # Хранимый пароль в поле не подставляется: пустое поле при редактировании - пароль не меняется
+        password_label = "Пароль:" if doctor_id is None else "Новый пароль (пусто - не менять):"
+        ttk.Label(self, text=password_label).grid(row=3, column=0, padx=5, pady=5)
         self.password_entry = ttk.Entry(self, show="*")
-        self.password_entry.insert(0, password) # Заполняем, если редактируем
         self.password_entry.grid(row=3, column=1, padx=5, pady=5)
 
+        # Рабочие часы и длина слота приема (для существующего врача подгружаются в фоне)
+        hours = WorkingHours()
+
+        ttk.Label(self, text="Начало приема (ЧЧ:ММ):").grid(row=4, column=0, padx=5, pady=5)
+        self.start_time_entry = ttk.Entry(self)
+        self.start_time_entry.insert(0, hours.start.strftime("%H:%M"))
+        self.start_time_entry.grid(row=4, column=1, padx=5, pady=5)
+
+        ttk.Label(self, text="Конец приема (ЧЧ:ММ):").grid(row=5, column=0, padx=5, pady=5)
+        self.end_time_entry = ttk.Entry(self)
+        self.end_time_entry.insert(0, hours.end.strftime("%H:%M"))
+        self.end_time_entry.grid(row=5, column=1, padx=5, pady=5)
+
+        ttk.Label(self, text="Длительность слота (мин):").grid(row=6, column=0, padx=5, pady=5)
+        self.slot_minutes_entry = ttk.Entry(self)
+        self.slot_minutes_entry.insert(0, str(hours.slot_minutes))
+        self.slot_minutes_entry.grid(row=6, column=1, padx=5, pady=5)
+
         # Кнопка для сохранения врача
-        ttk.Button(self, text="Сохранить", command=self.save_doctor_data).grid(row=4, column=0, columnspan=2, pady=10)
+        self.save_button = ttk.Button(self, text="Сохранить", command=self.save_doctor_data)
+        self.save_button.grid(row=7, column=0, columnspan=2, pady=10)
+
+        if doctor_id is not None:
+            run_in_background(self, self.repository.get_working_hours, doctor_id, on_done=self.show_working_hours)
+
+    def show_working_hours(self, hours: WorkingHours):
+        """Заполняет поля часов приема загруженным расписанием врача."""
+        if hours is None:
+            return
+        for entry, value in ((self.start_time_entry, hours.start.strftime("%H:%M")),
+                             (self.end_time_entry, hours.end.strftime("%H:%M")),
+                             (self.slot_minutes_entry, str(hours.slot_minutes))):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
 
     def save_doctor_data(self):
         """Сохраняет или обновляет данные врача в базе данных."""
@@ -129,16 +171,35 @@ class EditDoctorWindow(tk.Toplevel):
             return
 
         try:
+            hours = WorkingHours(self.start_time_entry.get().strip(), self.end_time_entry.get().strip(),
+                                 self.slot_minutes_entry.get().strip())
+        except ValueError:
+            messagebox.showwarning("Ошибка", "Неверно заданы часы приема.")
+            return
 
+        def save():
             if self.doctor_id is None:
                 # Добавялем нового доктора
-                self.repository.add_doctor(username, password, name, speciality)
+                doctor_id = self.repository.add_doctor(username, password, name, speciality)
             else:
                 # Обновляем данные существующего доктора
                 self.repository.update_doctor(self.doctor_id, name, speciality, username, password)
-            
-            self.callback_refresh()
+                doctor_id = self.doctor_id
+
+            if doctor_id is not None:
+                self.repository.set_working_hours(doctor_id, hours)
+            return doctor_id
+
+        def saved(doctor_id):
+            if doctor_id is not None:
+                self.callback_refresh(doctor_id)  # Обновляем строку врача в главном окне
             messagebox.showinfo("Успех", "Данные врача успешно сохранены.")
             self.destroy()  # Закрываем окно
-        except Exception as e:
+
+        def failed(e):
+            self.save_button.config(state=tk.NORMAL)
             messagebox.showerror("Ошибка", f"Не удалось сохранить данные врача: {e}")
+
+        # Пароль хэшируется при сохранении, это долго - выполняем в фоне
+        self.save_button.config(state=tk.DISABLED)
+        run_in_background(self, save, on_done=saved, on_error=failed)
@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from repositories import PatientRepository
 from ui.medical_record_ui import *
+from ui.lazy_tree import LazyTreeview
+from ui.tk_async import run_in_background
 
 class PatientAdminUI(tk.Toplevel):
     def __init__(self, repository: PatientRepository):
@@ -10,11 +12,25 @@ class PatientAdminUI(tk.Toplevel):
 
         self.patient_repository = repository
 
-        # Создаем виджет Treeview
-        self.tree = ttk.Treeview(self, columns=("ID", "Name"), show="headings")
-        self.tree.heading("ID", text="ID")
-        self.tree.heading("Name", text="Имя")
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.status_label = ttk.Label(self, text="")
+
+        # Поиск по тексту медицинских карт
+        self.search_frame = ttk.Frame(self)
+        self.search_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.search_entry = ttk.Entry(self.search_frame)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_entry.bind("<Return>", lambda event: self.search_records())
+        self.search_button = ttk.Button(self.search_frame, text="Найти в картах", command=self.search_records)
+        self.search_button.pack(side=tk.LEFT, padx=5)
+
+        # Создаем Treeview, который подгружает пациентов страницами при прокрутке
+        self.list_view = LazyTreeview(self, ("ID", "Name"), ("ID", "Имя"),
+                                      fetch_page=self.patient_repository.get_patients_page,
+                                      row_key=lambda patient: patient['patient_id'],
+                                      row_values=lambda patient: (patient['patient_id'], patient['name']),
+                                      status_label=self.status_label)
+        self.list_view.pack(fill=tk.BOTH, expand=True)
+        self.tree = self.list_view.tree
 
         # Добавляем кнопки для управления
         self.view_button = ttk.Button(self, text="Просмотр", command=self.view_patient)
@@ -27,18 +43,19 @@ class PatientAdminUI(tk.Toplevel):
         self.delete_button.pack(side=tk.LEFT, padx=5, pady=5)
         self.add_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.status_label.pack(side=tk.LEFT, padx=5, pady=5)
+
         # Загрузка данных
         self.load_patients_to_tree_view()
 
     def load_patients_to_tree_view(self):
-        """Загружает список пациентов в Treeview."""
-        for row in self.tree.get_children():
-            self.tree.delete(row)  # Очистка списка перед загрузкой новых данных
+        """Загружает список пациентов в Treeview с первой страницы."""
+        self.list_view.reload()
 
-        patients = self.patient_repository.get_all_patients()
-
-        for patient in patients:
-            self.tree.insert("", tk.END, values=(patient['patient_id'], patient['name']))
+    def patient_saved(self, patient_id):
+        """Обновляет в списке только строку измененного или добавленного пациента."""
+        run_in_background(self, self.patient_repository.get_patient, patient_id,
+                          on_done=lambda patient: patient and self.list_view.update_row(patient))
 
     def view_patient(self):
         """Показывает медицинскую карту выбранного пациента."""
@@ -48,12 +65,18 @@ class PatientAdminUI(tk.Toplevel):
             return
 
         patient_id = self.tree.item(selected_item[0])["values"][0]
-        record = self.patient_repository.get_patient_record(patient_id)
+        # Окно само загрузит карту в фоне
+        MedicalRecordWindowView(patient_id, self.patient_repository)
+
+    def search_records(self):
+        """Ищет пациентов по тексту медицинских карт и показывает результаты в отдельном окне."""
+        query = self.search_entry.get().strip()
+        if not query:
+            messagebox.showwarning("Ошибка", "Введите текст для поиска.")
+            return
 
-        if not record:
-            messagebox.showinfo("Медицинская карта", "Медицинская карта отсутствует.")
-        else:
-            MedicalRecordWindowView(patient_id, self.patient_repository)
+        run_in_background(self, self.patient_repository.search_records, query,
+                          on_done=lambda results: RecordSearchWindow(self, self.patient_repository, query, results or []))
 
     def edit_patient(self):
         """Открывает окно для редактирования информации о пациенте."""
@@ -65,11 +88,16 @@ class PatientAdminUI(tk.Toplevel):
         patient_id = self.tree.item(selected_item[0])["values"][0]
         patient_name = self.tree.item(selected_item[0])["values"][1]
 
-        patient_login_data = self.patient_repository.get_patient_login_data(patient_id)
+        def open_edit_window(username):
+            if not username:
+                messagebox.showerror("Ошибка", "Не удалось загрузить данные пациента.")
+                return
+            # Открываем новое окно для редактирования
+            EditPatientWindow(self, self.patient_saved, self.patient_repository, patient_id, patient_name,
+                              username)
 
-        # Открываем новое окно для редактирования
-        EditPatientWindow(self, self.load_patients_to_tree_view, self.patient_repository, patient_id, patient_name,
-                      patient_login_data['username'], patient_login_data['password'])
+        run_in_background(self, self.patient_repository.get_patient_username, patient_id,
+                          on_done=open_edit_window)
 
     def delete_patient(self):
         """Удаляет выбранного пациента и обновляет список."""
@@ -80,22 +108,19 @@ class PatientAdminUI(tk.Toplevel):
 
         patient_id = self.tree.item(selected_item[0])["values"][0]
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить пациента?"):
-            self.patient_repository.delete_patient(patient_id)
-            self.load_patients_to_tree_view()  # Обновляем список после удаления
-            print("Список пациентов:")
-            for i in self.patient_repository.get_all_patients():
-                print(i)
-            print()
+            # Обновляем список после удаления
+            run_in_background(self, self.patient_repository.delete_patient, patient_id,
+                              on_done=lambda _: self.list_view.remove_row(patient_id))
     
     def add_patient(self):
         """Добавляет нового пациента и обновляет список"""
 
         # Открываем новое окно для редактирования
-        EditPatientWindow(self, self.load_patients_to_tree_view, self.patient_repository)
+        EditPatientWindow(self, self.patient_saved, self.patient_repository)
 
 class EditPatientWindow(tk.Toplevel):
     def __init__(self, master, refresh_callback, patient_repository: PatientRepository,
-                  patient_id=None, patient_name="", username="", password="", medical_record=""):
+                  patient_id=None, patient_name="", username="", medical_record=""):
         super().__init__(master)
         self.title("Добавить пациента" if patient_id is None else "Редактировать пациента")
         self.refresh_callback = refresh_callback
@@ -114,13 +139,15 @@ class EditPatientWindow(tk.Toplevel):
         self.username_entry.insert(0, username) # Заполняем, если редактируем
         self.username_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        ttk.Label(self, text="Пароль:").grid(row=2, column=0, padx=5, pady=5)
+        # Хранимый пароль в поле не подставляется: пустое поле при редактировании - пароль не меняется
+        password_label = "Пароль:" if patient_id is None else "Новый пароль (пусто - не менять):"
+        ttk.Label(self, text=password_label).grid(row=2, column=0, padx=5, pady=5)
         self.password_entry = ttk.Entry(self, show="*")
-        self.password_entry.insert(0, password) # Заполняем, если редактируем
         self.password_entry.grid(row=2, column=1, padx=5, pady=5)
 
         # Кнопка для сохранения пациента
-        ttk.Button(self, text="Сохранить", command=self.save_patient_data).grid(row=3, column=0, columnspan=2, pady=10)
+        self.save_button = ttk.Button(self, text="Сохранить", command=self.save_patient_data)
+        self.save_button.grid(row=3, column=0, columnspan=2, pady=10)
 
     def save_patient_data(self):
         """Сохраняет или обновляет данные пациента в базе данных."""
@@ -131,19 +158,58 @@ class EditPatientWindow(tk.Toplevel):
             messagebox.showwarning("Ошибка", "Все поля должны быть заполнены.")
             return
 
-        try:
-            username = self.username_entry.get().strip()
-            password = self.password_entry.get().strip()
+        username = self.username_entry.get().strip()
+        password = self.password_entry.get().strip()
 
+        def save():
             if self.patient_id is None:
                 # Добавялем нового пациента
-                self.repository.add_patient(username, password, name)
-            else:
-                # Обновляем данные существующего пациента
-                self.repository.update_patient(self.patient_id, name, username, password)
-                
+                return self.repository.add_patient(username, password, name)
+            # Обновляем данные существующего пациента
+            self.repository.update_patient(self.patient_id, name, username, password)
+            return self.patient_id
+
+        def saved(patient_id):
             messagebox.showinfo("Успех", "Данные пациента успешно сохранены.")
-            self.refresh_callback()  # Обновляем список пациентов в главном окне
+            if patient_id is not None:
+                self.refresh_callback(patient_id)  # Обновляем строку пациента в главном окне
             self.destroy()  # Закрываем окно
-        except Exception as e:
+
+        def failed(e):
+            self.save_button.config(state=tk.NORMAL)
             messagebox.showerror("Ошибка", f"Не удалось сохранить данные пациента: {e}")
+
+        # Пароль хэшируется при сохранении, это долго - выполняем в фоне
+        self.save_button.config(state=tk.DISABLED)
+        run_in_background(self, save, on_done=saved, on_error=failed)
+
+class RecordSearchWindow(tk.Toplevel):
+    def __init__(self, master, patient_repository: PatientRepository, query, results):
+        super().__init__(master)
+        self.title(f"Поиск: {query}")
+        self.repository = patient_repository
+
+        ttk.Label(self, text=f"Найдено: {len(results)}").pack(pady=5)
+
+        # Результаты в порядке релевантности, найденные слова выделены «»
+        self.tree = ttk.Treeview(self, columns=("ID", "Name", "Snippet"), show="headings")
+        self.tree.heading("ID", text="ID")
+        self.tree.heading("Name", text="Имя")
+        self.tree.heading("Snippet", text="Фрагмент карты")
+        self.tree.column("Snippet", width=500)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        for result in results:
+            self.tree.insert("", tk.END, values=(result['patient_id'], result['name'], result['snippet']))
+        self.tree.bind("<Double-1>", lambda event: self.view_patient())
+
+        ttk.Button(self, text="Открыть карту", command=self.view_patient).pack(pady=5)
+
+    def view_patient(self):
+        """Открывает медицинскую карту выбранного пациента."""
+        selected_item = self.tree.selection()
+        if not selected_item:
+            messagebox.showwarning("Ошибка", "Выберите пациента для просмотра.")
+            return
+
+        patient_id = self.tree.item(selected_item[0])["values"][0]
+        MedicalRecordWindowView(patient_id, self.repository)
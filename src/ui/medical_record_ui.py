@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from repositories import PatientRepository
+from ui.tk_async import run_in_background, stream_in_background
 
 class MedicalRecordWindowView(tk.Toplevel):
     def __init__(self, patient_id, patient_repository: PatientRepository) -> None:
@@ -15,7 +16,7 @@ class MedicalRecordWindowView(tk.Toplevel):
 
         # Многострочное поле для отображения медицинской карты
         self.record_text = tk.Text(self, wrap="word")
-        self.record_text.insert(tk.END, self.repository.get_patient_record(self.patient_id)['record'])
+        self.record_text.insert(tk.END, "Загрузка...")
         self.record_text.config(state=tk.DISABLED)  # только для чтения
         self.record_text.pack(pady=10)
 
@@ -23,21 +24,69 @@ class MedicalRecordWindowView(tk.Toplevel):
         self.close_button = ttk.Button(self, text="Закрыть", command=self.destroy)
         self.close_button.pack(pady=5)
 
+        # Длинная карта показывается по частям: первый экран появляется, не дожидаясь всего текста
+        self._first_chunk = True
+        self._failed = False
+        stream_in_background(self, self.repository.iter_record_chunks, self.patient_id,
+                             on_batch=self.show_chunks, on_done=self.show_done, on_error=self.show_error,
+                             batch_size=1)
+
+    def show_chunks(self, chunks):
+        """Дописывает очередные фрагменты карты в конец текста."""
+        self.record_text.config(state=tk.NORMAL)
+        if self._first_chunk:
+            self.record_text.delete("1.0", tk.END)
+            self._first_chunk = False
+        for chunk in chunks:
+            self.record_text.insert(tk.END, chunk)
+        self.record_text.config(state=tk.DISABLED)
+
+    def show_done(self):
+        if self._failed:
+            # on_done вызывается и после ошибки; редактировать сообщение об ошибке нельзя
+            return
+        if self._first_chunk:
+            # Карта пустая или еще не создана
+            self.show_chunks([])
+        self.record_loaded(True)
+
+    def show_error(self, error):
+        self._failed = True
+        self._first_chunk = False
+        self.record_text.config(state=tk.NORMAL)
+        self.record_text.delete("1.0", tk.END)
+        self.record_text.insert(tk.END, "Не удалось загрузить медицинскую карту.")
+        self.record_text.config(state=tk.DISABLED)
+        self.record_loaded(False)
+
+    def record_loaded(self, success):
+        """Вызывается после загрузки карты, наследники могут разблокировать редактирование."""
+        pass
+
 class MedicalRecordWindowEdit(MedicalRecordWindowView):
     def __init__(self, patient_id, patient_repository: PatientRepository):
         super().__init__(patient_id, patient_repository)
 
-        self.record_text.config(state=tk.NORMAL)
-
-        # Кнопка "Сохранить"
-        self.save_button = ttk.Button(self, text="Сохранить", command=self.save_record)
+        # Кнопка "Сохранить" доступна только после загрузки карты
+        self.save_button = ttk.Button(self, text="Сохранить", command=self.save_record, state=tk.DISABLED)
         self.save_button.pack(pady=5)
-    
+
+    def record_loaded(self, success):
+        if success:
+            self.record_text.config(state=tk.NORMAL)
+            self.save_button.config(state=tk.NORMAL)
+
     def save_record(self):
         # Сохранить изменения в базе данных
         new_record = self.record_text.get("1.0", tk.END).strip()
         if new_record:
-            self.repository.update_medical_record(self.patient_id, new_record)
-            messagebox.showinfo("Сохранено", "Медицинская карта успешно обновлена!")
+            self.save_button.config(state=tk.DISABLED)
+
+            def saved(_):
+                self.save_button.config(state=tk.NORMAL)
+                messagebox.showinfo("Сохранено", "Медицинская карта успешно обновлена!")
+
+            run_in_background(self, self.repository.update_medical_record, self.patient_id, new_record,
+                              on_done=saved)
         else:
             messagebox.showwarning("Ошибка", "Запись не может быть пустой!")
\ No newline at end of file
@@ -1,20 +1,19 @@
 import tkinter as tk
 from tkinter import ttk
-from ui.appointment_ui import AppointmentBookingWindow
 from ui.medical_record_ui import MedicalRecordWindowView
-from repositories import AppointmentRepository, PatientRepository
+from repositories import AppointmentRepository, PatientRepository, Session
 
 class PatientUI(tk.Toplevel):
-    def __init__(self, user_id: int, patient_repository: PatientRepository, appointment_repository: AppointmentRepository, fetch_doctors_func):
+    def __init__(self, session: Session, patient_repository: PatientRepository, appointment_repository: AppointmentRepository, fetch_doctors_func):
         super().__init__()
 
         self.patient_repository = patient_repository
         self.appointment_repository = appointment_repository
         self.fetch_doctors = fetch_doctors_func
-        patient_info = self.patient_repository.get_patient_by_user_id(user_id)
-        
-        self.name = patient_info['name']
-        self.patient_id = patient_info['patient_id']
+        # Профиль пациента уже прочитан при входе
+        self.session = session
+        self.name = session.name
+        self.patient_id = session.patient_id
 
         self.title("Меню пациента")
 
@@ -44,4 +43,6 @@ class PatientUI(tk.Toplevel):
         """
         Передает вызов окну с записью к врачу
         """
+        # Окно записи тянет tkcalendar, поэтому загружается при первом открытии
+        from ui.appointment_ui import AppointmentBookingWindow
         AppointmentBookingWindow(self.patient_id, self.appointment_repository, fetch_doctors=self.fetch_doctors)
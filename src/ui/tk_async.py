@@ -0,0 +1,205 @@
+import queue
+import threading
+import tkinter as tk
+
+from db_worker import get_worker
+
+# Как часто поток интерфейса проверяет готовность фоновых задач
+POLL_INTERVAL_MS = 20
+# Сколько строк потока передается в интерфейс за один раз
+STREAM_BATCH_SIZE = 200
+# Сколько порций может ждать интерфейса: дальше чтение генератора приостанавливается
+STREAM_QUEUE_BATCHES = 4
+
+_END_OF_STREAM = object()
+
+
+def _widget_alive(widget):
+    try:
+        return bool(widget.winfo_exists())
+    except tk.TclError:
+        return False
+
+
+def run_in_background(widget, func, *args, on_done=None, on_error=None, **kwargs):
+    """
+    Выполняет func(*args, **kwargs) в DatabaseWorker и передает результат в поток Tk.
+
+    Tk нельзя трогать из других потоков, поэтому готовность Future проверяется
+    из mainloop через widget.after(). Если окно уже закрыто, колбэки не вызываются.
+
+    :param on_done: Вызывается в потоке Tk с результатом func
+    :param on_error: Вызывается в потоке Tk с исключением
+    :return: concurrent.futures.Future
+    """
+    future = get_worker().submit(func, *args, **kwargs)
+
+    def poll():
+        if not _widget_alive(widget):
+            return
+        if not future.done():
+            widget.after(POLL_INTERVAL_MS, poll)
+            return
+        error = future.exception()
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+            else:
+                print(f"Background task {getattr(func, '__name__', func)} failed: {error}")
+        elif on_done is not None:
+            on_done(future.result())
+
+    widget.after(POLL_INTERVAL_MS, poll)
+    return future
+
+
+def stream_in_background(widget, func, *args, on_batch, on_done=None, on_error=None,
+                         batch_size=STREAM_BATCH_SIZE, **kwargs):
+    """
+    Перебирает генератор func(*args, **kwargs) в отдельном фоновом потоке и передает
+    строки в поток Tk порциями, не дожидаясь конца выборки.
+
+    Генератор держит соединение открытым до конца чтения, поэтому выполняется не в
+    DatabaseWorker, а в своем потоке, и не занимает поток для остальных запросов окна.
+    Очередь порций ограничена: пока интерфейс не разобрал STREAM_QUEUE_BATCHES порций,
+    генератор не читается дальше. Когда окно закрыто, чтение прерывается.
+
+    :param on_batch: Вызывается в потоке Tk со списком очередных строк
+    :param on_done: Вызывается в потоке Tk после последней порции
+    :return: threading.Event, установка которого прерывает чтение
+    """
+    batches = queue.Queue(maxsize=STREAM_QUEUE_BATCHES)
+    cancelled = threading.Event()
+
+    def put(item):
+        # Ждем места в очереди, но не дольше, чем до отмены
+        while not cancelled.is_set():
+            try:
+                batches.put(item, timeout=POLL_INTERVAL_MS / 1000)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = None
+        try:
+            iterator = func(*args, **kwargs)
+            batch = []
+            for row in iterator or ():
+                if cancelled.is_set():
+                    return
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            put(_END_OF_STREAM)
+
+    threading.Thread(target=produce, name="db-stream", daemon=True).start()
+
+    def poll():
+        if not _widget_alive(widget):
+            cancelled.set()
+            return
+        # Не больше одной полной очереди за раз, иначе быстрый генератор не отпустит mainloop
+        for _ in range(STREAM_QUEUE_BATCHES):
+            try:
+                item = batches.get_nowait()
+            except queue.Empty:
+                break
+            if cancelled.is_set():
+                return
+            if item is _END_OF_STREAM:
+                if on_done is not None:
+                    on_done()
+                return
+            if isinstance(item, Exception):
+                if on_error is not None:
+                    on_error(item)
+                else:
+                    print(f"Background stream {getattr(func, '__name__', func)} failed: {item}")
+                continue
+            on_batch(item)
+        widget.after(POLL_INTERVAL_MS, poll)
+
+    widget.after(POLL_INTERVAL_MS, poll)
+    return cancelled
+
+
+class BackgroundLoader:
+    """
+    Фоновая загрузка данных для окна с индикацией загрузки и склейкой обновлений.
+
+    Пока выполняется загрузка, повторные вызовы refresh() не запускают новые запросы:
+    запоминается только последний из них, и он выполняется сразу после текущего.
+    """
+
+    def __init__(self, widget, on_loaded, status_label=None, on_error=None):
+        """
+        :param widget: Окно, в mainloop которого вызываются колбэки
+        :param on_loaded: Вызывается в потоке Tk с результатом загрузки
+        :param status_label: ttk.Label для надписи "Загрузка..." (необязательно)
+        :param on_error: Вызывается в потоке Tk с исключением
+        """
+        self.widget = widget
+        self.on_loaded = on_loaded
+        self.on_error = on_error
+        self.status_label = status_label
+        self._running = False
+        self._pending = None
+
+    @property
+    def loading(self):
+        return self._running
+
+    def refresh(self, func, *args, **kwargs):
+        """Загружает func(*args, **kwargs) в фоне или откладывает до конца текущей загрузки."""
+        if self._running:
+            self._pending = (func, args, kwargs)
+            return
+        self._start(func, args, kwargs)
+
+    def _start(self, func, args, kwargs):
+        self._running = True
+        self._set_loading(True)
+        run_in_background(self.widget, func, *args,
+                          on_done=self._finished, on_error=self._failed, **kwargs)
+
+    def _finished(self, result):
+        if self._pending is None:
+            self._running = False
+            self._set_loading(False)
+            self.on_loaded(result)
+            return
+        # Результат уже устарел - сразу выполняем последний отложенный запрос
+        func, args, kwargs = self._pending
+        self._pending = None
+        self._start(func, args, kwargs)
+
+    def _failed(self, error):
+        self._running = False
+        self._set_loading(False)
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"Background load failed: {error}")
+        if self._pending is not None:
+            func, args, kwargs = self._pending
+            self._pending = None
+            self._start(func, args, kwargs)
+
+    def _set_loading(self, loading):
+        try:
+            self.widget.config(cursor="watch" if loading else "")
+            if self.status_label is not None:
+                self.status_label.config(text="Загрузка..." if loading else "")
+        except tk.TclError:
+            pass
@@ -0,0 +1,126 @@
+"""
+Кодирование аргументов и результатов репозиториев в JSON для сервиса (service, service_client).
+
+Типы, которых нет в JSON, передаются словарем с одним ключом-тегом,
+например {"$datetime": "2024-01-01T10:00:00"}. Словари с нестроковыми ключами
+(например {date: [...]} из get_booked_slots_in_range) передаются как {"$dict": [[ключ, значение], ...]}.
+"""
+import base64
+import datetime
+
+from availability import DayAvailability, WorkingHours
+from booking import RecurringBookingResult, ReservationResult, ReservationStatus
+from recurrence import RecurrenceRule
+from repositories import Role, Session
+from rows import Row
+
+
+def _encode_day_availability(value: DayAvailability):
+    return dict(day=value.day.isoformat(), hours=encode(value.hours), free=list(value._free))
+
+
+def _decode_day_availability(data) -> DayAvailability:
+    hours = decode(data['hours'])
+    day = datetime.date.fromisoformat(data['day'])
+    free = set(data['free'])
+    # Восстанавливаем занятые слоты как дополнение к свободным
+    booked = [datetime.datetime.combine(day, hours.slot_time(index))
+              for index in range(hours.slot_count) if index not in free]
+    return DayAvailability(day, hours, booked)
+
+
+def _encode_session(value: Session):
+    return {name: encode(getattr(value, name)) for name in Session.__slots__}
+
+
+def _encode_reservation(value: ReservationResult):
+    return dict(status=value.status.value, appointment_time=encode(value.appointment_time),
+                appointment_id=value.appointment_id, alternatives=encode(value.alternatives))
+
+
+def _decode_reservation(data) -> ReservationResult:
+    return ReservationResult(ReservationStatus(data['status']), decode(data['appointment_time']),
+                             appointment_id=data['appointment_id'], alternatives=decode(data['alternatives']))
+
+
+def _encode_recurring(value: RecurringBookingResult):
+    return dict(status=value.status.value, booked=encode(value.booked),
+                conflicts=[[encode(moment), status.value] for moment, status in value.conflicts])
+
+
+def _decode_recurring(data) -> RecurringBookingResult:
+    return RecurringBookingResult(ReservationStatus(data['status']),
+                                  booked=[tuple(item) for item in decode(data['booked'])],
+                                  conflicts=[(decode(moment), ReservationStatus(status))
+                                             for moment, status in data['conflicts']])
+
+
+_DECODERS = {
+    "$datetime": datetime.datetime.fromisoformat,
+    "$date": datetime.date.fromisoformat,
+    "$time": datetime.time.fromisoformat,
+    "$bytes": base64.b64decode,
+    "$role": Role,
+    "$working_hours": lambda data: WorkingHours(*data),
+    "$day_availability": _decode_day_availability,
+    "$session": lambda data: Session(**{name: decode(value) for name, value in data.items()}),
+    "$reservation": _decode_reservation,
+    "$recurring_booking": _decode_recurring,
+    "$recurrence": lambda data: RecurrenceRule(decode(data['start']), data['count'],
+                                               data['frequency'], data['interval']),
+    "$dict": lambda items: {decode(key): decode(value) for key, value in items},
+}
+
+
+def encode(value):
+    """Приводит значение к виду, который можно передать json.dumps."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    # datetime проверяется раньше date, так как является его подклассом
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$time": value.isoformat()}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$bytes": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, Role):
+        return {"$role": value.value}
+    if isinstance(value, WorkingHours):
+        return {"$working_hours": [f"{value.start:%H:%M}", f"{value.end:%H:%M}", value.slot_minutes]}
+    if isinstance(value, DayAvailability):
+        return {"$day_availability": _encode_day_availability(value)}
+    if isinstance(value, Session):
+        return {"$session": _encode_session(value)}
+    if isinstance(value, ReservationResult):
+        return {"$reservation": _encode_reservation(value)}
+    if isinstance(value, RecurringBookingResult):
+        return {"$recurring_booking": _encode_recurring(value)}
+    if isinstance(value, RecurrenceRule):
+        return {"$recurrence": dict(start=encode(value.start), count=value.count,
+                                    frequency=value.frequency, interval=value.interval)}
+    if isinstance(value, Row):
+        # Строки репозиториев - кортежи, но клиент работает с ними как со словарями
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) and not key.startswith("$") for key in value):
+            return {key: encode(item) for key, item in value.items()}
+        return {"$dict": [[encode(key), encode(item)] for key, item in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    raise TypeError(f"Тип {type(value).__name__} нельзя передать через сервис")
+
+
+def decode(value):
+    """Обратное к encode преобразование результата json.loads."""
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            tag, data = next(iter(value.items()))
+            decoder = _DECODERS.get(tag)
+            if decoder is not None:
+                return decoder(data)
+        return {key: decode(item) for key, item in value.items()}
+    return value